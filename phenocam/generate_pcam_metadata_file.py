@@ -33,16 +33,21 @@ import sys
 import argparse
 import re
 import os
+import errno
 import utm
-import hashlib
-import exifread
+
+# The checksum engine and the image ingest reader are shared with the UAS programs
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'uas'))
+from checksum_manifest import use_checksum_manifest, record_rename
+from image_ingest import ingest_images
 
 
 __author__ = 'mlucas'
 
 print "generate_pcam_metadata_file Version 0.2, December 16,2015"
 
-serial_number_tag = 'EXIF BodySerialNumber'
+serial_number_tag = 'BodySerialNumber'
 
 
 def get_image_file_list(file_path, f_image_type):
@@ -78,8 +83,8 @@ def get_image_file_list(file_path, f_image_type):
     return image_file_list
 
 
-def get_camera_body_serial_number(image_file):
-    tags = exifread.process_file(image_file)
+def get_camera_body_serial_number(tags):
+    # tags are the EXIF tags of the image read by image_ingest.ingest_images
     if serial_number_tag in tags:
         sn_string = str(tags[serial_number_tag])
     else:
@@ -87,20 +92,31 @@ def get_camera_body_serial_number(image_file):
     return sn_string
 
 
-def rename_image_file(image_record):
+def original_image_path(image_record):
+    image_file = image_record[0][5:]
+    camera = image_record[0][:4]
+    return phenocam_path + data_set + '/' + cam_folder[camera] + '/' + image_file
+
+
+def rename_image_file(image_record, image_data):
+    # image_data is the ImageRecord (size, md5 checksum and EXIF tags) of the image or None if it could not be read
     image_file = image_record[0][5:]
     image_number = image_file[4:]
     camera = image_record[0][:4]
     camera_number = image_record[0][3]
     sample_time = image_record[1][:6]
-    orig_image_path = phenocam_path + data_set + '/' + cam_folder[camera] + '/' + image_file
+    orig_image_path = original_image_path(image_record)
+    md5 = ''
     try:
-        with open(orig_image_path, 'rb') as image:
-            cam_serial_number = get_camera_body_serial_number(image)
+        if image_data is None:
+            raise IOError(errno.ENOENT, os.strerror(errno.ENOENT))
+        cam_serial_number = get_camera_body_serial_number(image_data.tags)
+        md5 = image_data.md5
         renamed_image_file = cam_serial_number + '_' + data_set + '_' + sample_time + '_C0' + camera_number \
                              + '_' + image_number
         new_file_path = phenocam_path + data_set + "/" + cam_folder[camera] + "/" + renamed_image_file
         os.rename(orig_image_path, new_file_path)
+        record_rename(orig_image_path, new_file_path)
 
         
     except IOError as fe:
@@ -112,7 +128,7 @@ def rename_image_file(image_record):
         print "(rename_image_file) Unexpected error:", sys.exc_info()[0]
         sys.exit()
 
-    return new_file_path, renamed_image_file, cam_serial_number, orig_image_path
+    return new_file_path, renamed_image_file, cam_serial_number, orig_image_path, md5
 
 
 def get_image_utm_position(f_latitude, f_longitude):
@@ -120,20 +136,6 @@ def get_image_utm_position(f_latitude, f_longitude):
     return utm_position
 
 
-def hashfilelist(a_file, blocksize=65536):
-    hasher = hashlib.md5()
-    buf = a_file.read(blocksize)
-    while len(buf) > 0:
-        hasher.update(buf)
-        buf = a_file.read(blocksize)
-    return hasher.hexdigest()
-
-
-def calculate_checksum(filename):
-    checksum = hashfilelist(open(filename, 'rb'))
-    return checksum
-
-
 def check_time_str(time_str):
     hour = time_str[0:2]
     mins = time_str[2:4]
@@ -390,15 +392,28 @@ sampleTime = ''
 posY=''         # placeholder for corrected position
 heading_sign='' # placeholder for heading sign + or -
 
-for record in raw_pcam_metadata_list:
+# Read the serial number and the checksum of all images in a single pass over each image (see image_ingest.py), then
+# rename them. The checksums of images that have not changed since a previous run are taken from the checksum manifest
+# of the data set.
+
+use_checksum_manifest(phenocam_path + data_set)
+image_records = ingest_images([original_image_path(record) for record in raw_pcam_metadata_list])
+
+renamed_image_list = []
+for record, image_record in zip(raw_pcam_metadata_list, image_records):
+    image_data = rename_image_file(record, image_record)
+    undo_list.append([image_data[0], image_data[3]])
+    #N.B. Could write out undo list line by line here.
+    renamed_image_list.append(image_data)
+
+for record, image_data in zip(raw_pcam_metadata_list, renamed_image_list):
     try:
-        image_data = rename_image_file(record)
         image_file_path=image_data[0]
         image_file_name = image_data[1]
         orig_image_name = image_data[3]
-        undo_list.append([image_file_path,orig_image_name])
-        #N.B. Could write out undo list line by line here.
-        md5 = calculate_checksum(image_file_path)
+        if image_file_path == '':
+            raise IOError(errno.ENOENT, os.strerror(errno.ENOENT))
+        md5 = image_data[4]
         sensorID = str(image_data[2])
         lon = record[3]
         long_ref = record[4]
@@ -1,6 +1,8 @@
 #!/usr/bin/python
 #
 # Version: 0.1 September 7,2016
+# Version: 0.2 October 2018 - Points are assigned to plots with the plot grid index (uas/plot_lattice.py) instead of
+#                              testing every QGIS plot polygon for every point.
 #
 # Loads a PLY file containing a point cloud in local coordinates and geo-references it using
 # the ASCII (XYZ) file containing the same point cloud in UTM coordinates.
@@ -23,6 +25,7 @@
 import cv2
 import numpy as np
 import sys
+import os
 import subprocess
 import argparse
 import csv
@@ -34,22 +37,11 @@ import local_config
 import mysql.connector
 from mysql.connector import errorcode
 from mysql.connector.constants import ClientFlag
-from qgis.core import *
 
-# Initialize the qgis environment
-# supply path to qgis install location
-QgsApplication.setPrefixPath("/Applications", True)
+# The plot grid index is shared with the UAS programs
 
-# create a reference to the QgsApplication
-# set the second argument to True enables the GUI, which is required for custom QGIS applications
-#
-
-qgs = QgsApplication([], True)
-
-# load QGIS providers
-qgs.initQgis()
-
-# QGIS environment initialization is now complete
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'uas'))
+from plot_lattice import PlotLattice
 
 # Main program body
 # Get the path to the file to be imported from command line
@@ -109,23 +101,21 @@ plotCount=cursor.rowcount
 print("")
 print "Number of plot records found for experiment",experiment, ":",plotCount
 
-# Convert plot coordinates to a polygon and store each plot polygon in a dictionary with plot_id as key.
+# Store the plot corners and build the plot grid index used to find the plot containing each point.
 
-plot_polygons = {}
+plot_ids = []
+plot_corners = []
 
-#index = QgsSpatialIndex()
-
-print "Creating plot polygons for each plot..."
+print "Creating plot grid index..."
 
 for (plot_id, C2_1_x,C2_1_y,C2_2_x,C2_2_y,C1_2_x,C1_2_y,C1_1_x,C1_1_y) in cursor:
-    plot_shape=QgsGeometry.fromPolygon([[QgsPoint(C2_1_x,C2_1_y), QgsPoint(C2_2_x,C2_2_y), QgsPoint(C1_2_x,C1_2_y),
-                                          QgsPoint(C1_1_x,C1_1_y), QgsPoint(C2_1_x,C2_1_y)]])
-    plt_id = str(plot_id)
-    plot_polygons[plt_id]= plot_shape
-#    index.insertFeature(plot_polygons[plt_id])
+    plot_ids.append(str(plot_id))
+    plot_corners.append([(C2_1_x,C2_1_y), (C2_2_x,C2_2_y), (C1_2_x,C1_2_y), (C1_1_x,C1_1_y)])
 
 cursor.close()
 
+plot_lattice = PlotLattice.from_corners(plot_ids, np.array(plot_corners, dtype=np.float64), geographic=False)
+
 # Open the PLY formatted point cloud file and store as a list of x.y.z coordinates
 
 lineCount = 0
@@ -161,6 +151,7 @@ print "Opening Point Cloud UTM file ", pcloudXYZFile
 print "Loading UTM coordinates..."
 
 pointCount=0
+pcloudUTM=[]
 with open(pcloudXYZFile) as pcFile:
    for line in csv.reader(pcFile, delimiter=','):
         x=float(line[0])
@@ -169,11 +160,11 @@ with open(pcloudXYZFile) as pcFile:
         r=int(line[3])
         g=int(line[4])
         b=int(line[5])
-        pt=QgsGeometry.fromPoint(QgsPoint(x,y))
         if (pcloud[pointCount][3]==r and
             pcloud[pointCount][4]==g and
             pcloud[pointCount][5]==b):
-            pcloud[pointCount].extend([x,y,z,r,g,b,pt])
+            pcloud[pointCount].extend([x,y,z,r,g,b])
+            pcloudUTM.append((x,y))
         else:
             print "Mismatch found between PLY RGB values and XYZ RGB values...exiting."
             sys.exit()
@@ -184,24 +175,19 @@ print ''
 
 plot_points={}
 
-for plt_id,plt in plot_polygons.iteritems():
+for plt_id in plot_ids:
     plot_points[plt_id]=[]
 
-# Iterate through the point cloud to find which plots the points fall into.
+# Find the plot that each point of the point cloud falls into using the plot grid index.
 
 print "Segmenting point cloud..."
 
-pointCount=0
+pointPlots = plot_lattice.locate_indexes(np.array(pcloudUTM, dtype=np.float64)).tolist()
 
-for p in pcloud:
-    if pointCount%10000==0:
-        print ("Processing point",pointCount,"of",numPoints)
-    pointCount += 1
-    pt=p[12]
-    for plt_id,plt in plot_polygons.iteritems():
-        if plt.contains(pt):
-            #plot_points[plt_id].append((p[0],p[1],p[2],p[3],p[4],p[5]))
-            plot_points[plt_id].append((p[0], p[1], p[2], p[3], p[4], p[5], p[6],p[7]))
+for p, plotIndex in zip(pcloud, pointPlots):
+    if plotIndex >= 0:
+        #plot_points[plt_id].append((p[0],p[1],p[2],p[3],p[4],p[5]))
+        plot_points[plot_ids[plotIndex]].append((p[0], p[1], p[2], p[3], p[4], p[5], p[6],p[7]))
 
 for plt_id,point_list in plot_points.iteritems():
     if len(point_list) > 0:
@@ -216,9 +202,6 @@ for plt_id,point_list in plot_points.iteritems():
         el = PlyElement.describe(vertex, 'vertex')
         PlyData([el]).write(pcloudPlotSegmentFile)
 
-# Cleanup: call exitQgis() to remove the provider and layer registries from memory
-qgs.exitQgis()
-
 # Exit the program gracefully
 
 print ('Processing Completed. Exiting...')
@@ -0,0 +1,156 @@
+#
+# Version 0.1 October 2018
+#
+# This is a module that contains the checksum engine shared by the HTP image ingest programs (UAS and phenocam).
+#
+# The MD5 checksum stored with every image (md5sum) used to be computed by a copy of hashfilelist in each program,
+# reading 64 KiB at a time on a single thread and leaving the image file open. The engine:
+#
+#   1. Reads each file with bufferSize reads into a reused buffer (no copy of the data per read) and closes it.
+#   2. Hashes many files at once with a thread pool (checksum_files). hashlib releases the GIL while it hashes a block,
+#      so the threads hash in parallel.
+#   3. Chooses the number of threads from the storage the files are on (storage_workers): few threads on a spinning
+#      disk, where concurrent reads only add seeks, one per core on SSD/NVMe and more on network or parallel file
+#      systems (NFS, Lustre) where the latency of each read is hidden by having more reads in flight.
+#   4. Skips the files whose MD5 checksum is already recorded in the checksum manifest in use, if any (see
+#      checksum_manifest.py).
+#
+# The module runs with Python 2.7 (phenocam) and Python 3.
+#
+
+from __future__ import print_function
+from __future__ import division
+
+import io
+import os
+import hashlib
+import multiprocessing
+from multiprocessing.pool import ThreadPool
+
+bufferSize = 4 * 1024 * 1024
+
+# Number of hashing threads by storage type
+
+rotationalWorkers = 2
+networkWorkersPerCore = 2
+maxWorkers = 32
+networkFileSystems = ('nfs', 'nfs4', 'lustre', 'gpfs', 'beegfs', 'cifs', 'smbfs', 'fuse.sshfs', 'panfs')
+
+_checksumManifest = None
+
+
+def set_checksum_manifest(manifest):
+    # Make calculate_checksum consult a ChecksumManifest (None to stop using one)
+    global _checksumManifest
+    _checksumManifest = manifest
+
+
+def get_checksum_manifest():
+    return _checksumManifest
+
+
+def hash_file_object(fileObject, algorithm='md5', blockSize=bufferSize, hasher=None):
+    # Return the hex digest of the rest of an open binary file. hasher is a hashlib object already fed the start of the
+    # file (the algorithm is then ignored).
+    hasher = hasher if hasher is not None else hashlib.new(algorithm)
+    blockBuffer = bytearray(blockSize)
+    view = memoryview(blockBuffer)
+    readinto = getattr(fileObject, 'readinto', None)
+    if readinto is None:
+        block = fileObject.read(blockSize)
+        while len(block) > 0:
+            hasher.update(block)
+            block = fileObject.read(blockSize)
+        return hasher.hexdigest()
+    count = readinto(blockBuffer)
+    while count:
+        hasher.update(view[:count])
+        count = readinto(blockBuffer)
+    return hasher.hexdigest()
+
+
+def hashfilelist(afile, blocksize=bufferSize):
+    # Return the MD5 checksum of an open binary file (the former per-program function)
+    return hash_file_object(afile, 'md5', blocksize)
+
+
+def calculate_checksum(ffilename, algorithm='md5'):
+    # Return the checksum of a file. The MD5 checksum is taken from the checksum manifest in use when the file has not
+    # changed since it was recorded.
+    manifest = _checksumManifest if algorithm == 'md5' else None
+    if manifest is not None:
+        fileStat = os.stat(ffilename)
+        checksum = manifest.lookup(ffilename, fileStat)
+        if checksum is not None:
+            return checksum
+    with io.open(ffilename, 'rb', buffering=0) as imageFile:
+        checksum = hash_file_object(imageFile, algorithm)
+    if manifest is not None:
+        manifest.record(ffilename, checksum, fileStat)
+    return checksum
+
+
+def _mount_type(path):
+    # Return the file system type of the mount point containing path (Linux) or None
+    try:
+        with open('/proc/mounts', 'r') as mountsFile:
+            mounts = [line.split()[1:3] for line in mountsFile if len(line.split()) > 2]
+    except (IOError, OSError):
+        return None
+    path = os.path.realpath(path)
+    bestMount, bestType = '', None
+    for mountPoint, fileSystem in mounts:
+        mountPoint = mountPoint.replace('\\040', ' ')
+        prefix = mountPoint.rstrip('/') + '/'
+        if (path == mountPoint or path.startswith(prefix)) and len(mountPoint) >= len(bestMount):
+            bestMount, bestType = mountPoint, fileSystem
+    return bestType
+
+
+def _is_rotational(path):
+    # Return True (spinning disk), False (SSD/NVMe) or None (unknown) for the block device holding path (Linux)
+    try:
+        device = os.stat(path).st_dev
+        blockPath = os.path.realpath('/sys/dev/block/%d:%d' % (os.major(device), os.minor(device)))
+    except (OSError, AttributeError):
+        return None
+    for queuePath in (os.path.join(blockPath, 'queue', 'rotational'),
+                      os.path.join(os.path.dirname(blockPath), 'queue', 'rotational')):
+        try:
+            with open(queuePath, 'r') as queueFile:
+                return queueFile.read().strip() == '1'
+        except (IOError, OSError):
+            continue
+    return None
+
+
+def storage_workers(path):
+    # Return the number of hashing threads for files stored under path
+    cores = multiprocessing.cpu_count()
+    fileSystem = _mount_type(path)
+    if fileSystem in networkFileSystems:
+        return min(cores * networkWorkersPerCore, maxWorkers)
+    if _is_rotational(path):
+        return rotationalWorkers
+    return min(cores, maxWorkers)
+
+
+def checksum_files(filePaths, workers=None, algorithm='md5'):
+    #
+    # Return the list of checksums of filePaths (in the same order). The files are hashed by workers threads, chosen
+    # from the storage of the first file when workers is None.
+    #
+    filePaths = list(filePaths)
+    if len(filePaths) == 0:
+        return []
+    if workers is None:
+        workers = storage_workers(os.path.dirname(os.path.abspath(filePaths[0])))
+    workers = min(workers, len(filePaths))
+    if workers <= 1:
+        return [calculate_checksum(filePath, algorithm) for filePath in filePaths]
+    pool = ThreadPool(workers)
+    try:
+        return pool.map(lambda filePath: calculate_checksum(filePath, algorithm), filePaths, 1)
+    finally:
+        pool.close()
+        pool.join()
@@ -0,0 +1,148 @@
+#
+# Version 0.1 October 2018
+#
+# This is a module that contains the checksum manifest used to skip hashing files that have not changed.
+#
+# Every run of the metadata programs used to hash every image again, including the reruns after a job was interrupted
+# halfway through a flight or after a correction of the plot prefix. The manifest is a SQLite database in the flight
+# folder (.checksum_manifest.sqlite) holding the MD5 checksum of each file hashed in the folder, keyed by
+#
+#   path, size, mtime_ns, inode
+#
+# When a manifest is in use (use_checksum_manifest), checksum_engine.calculate_checksum looks the file up before reading
+# it and only hashes it when the path is unknown or its size, modification time or inode changed. The renames done by
+# the programs themselves are recorded with record_rename, which moves the entry to the new path, so a rerun after the
+# images were renamed does not hash them again.
+#
+# Each checksum is committed as soon as it is computed, so the checksums computed before a job was interrupted are kept.
+# The manifest can be used from several threads and forked worker processes: each opens its own connection.
+#
+# The manifest only serves the reruns of a program on a flight folder. A folder that is archived (moved to
+# uav_processed) must not take it along: remove_checksum_manifest closes the manifest and deletes its files (the
+# database and its -wal and -shm files) before the folder is moved.
+#
+# The module runs with Python 2.7 (phenocam) and Python 3.
+#
+
+from __future__ import print_function
+from __future__ import division
+
+import os
+import sqlite3
+import threading
+
+import checksum_engine
+
+manifestFileName = '.checksum_manifest.sqlite'
+manifestTimeout = 60.0  # seconds to wait for a write lock held by another worker
+
+
+def file_key(fileStat):
+    # Return the (size, mtime_ns, inode) of an os.stat result
+    mtimeNs = getattr(fileStat, 'st_mtime_ns', None)
+    if mtimeNs is None:
+        mtimeNs = int(round(fileStat.st_mtime * 1e9))
+    return fileStat.st_size, mtimeNs, fileStat.st_ino
+
+
+class ChecksumManifest(object):
+    '''MD5 checksums of the files of a flight folder keyed by path, size, modification time and inode.'''
+
+    def __init__(self, manifestPath):
+        self.manifestPath = manifestPath
+        self.local = threading.local()
+        self.connection()
+
+    def connection(self):
+        # Return the connection of the calling thread (and process), opening it on first use
+        connection = getattr(self.local, 'connection', None)
+        if connection is None or self.local.pid != os.getpid():
+            connection = sqlite3.connect(self.manifestPath, timeout=manifestTimeout)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            connection.execute('CREATE TABLE IF NOT EXISTS checksums (path TEXT PRIMARY KEY, size INTEGER, '
+                               'mtime_ns INTEGER, inode INTEGER, md5 TEXT)')
+            connection.commit()
+            self.local.connection = connection
+            self.local.pid = os.getpid()
+        return connection
+
+    def lookup(self, path, fileStat=None):
+        # Return the recorded checksum of a file or None if the file is not in the manifest or has changed
+        fileStat = fileStat if fileStat is not None else os.stat(path)
+        row = self.connection().execute('SELECT size, mtime_ns, inode, md5 FROM checksums WHERE path = ?',
+                                        (os.path.abspath(path),)).fetchone()
+        if row is None or tuple(row[0:3]) != file_key(fileStat):
+            return None
+        return str(row[3])
+
+    def record(self, path, checksum, fileStat=None):
+        # Record the checksum of a file. fileStat is the os.stat result taken before the file was read.
+        fileStat = fileStat if fileStat is not None else os.stat(path)
+        connection = self.connection()
+        connection.execute('INSERT OR REPLACE INTO checksums (path, size, mtime_ns, inode, md5) VALUES (?, ?, ?, ?, ?)',
+                           (os.path.abspath(path),) + file_key(fileStat) + (checksum,))
+        connection.commit()
+
+    def record_rename(self, oldPath, newPath):
+        # Follow a rename done by the program: the entry of oldPath becomes the entry of newPath
+        oldPath, newPath = os.path.abspath(oldPath), os.path.abspath(newPath)
+        if oldPath == newPath:
+            return
+        connection = self.connection()
+        connection.execute('DELETE FROM checksums WHERE path = ?', (newPath,))
+        connection.execute('UPDATE checksums SET path = ? WHERE path = ?', (newPath, oldPath))
+        connection.commit()
+
+    def close(self):
+        # Close the connection of the calling thread, first writing the WAL file back to the database
+        connection = getattr(self.local, 'connection', None)
+        if connection is not None and self.local.pid == os.getpid():
+            try:
+                connection.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+            except sqlite3.Error as e:
+                print('*** Warning*** Unable to checkpoint checksum manifest', self.manifestPath, e)
+            connection.close()
+        self.local.connection = None
+
+
+def open_checksum_manifest(folder):
+    # Return the ChecksumManifest of a flight folder, creating it if there is none
+    return ChecksumManifest(os.path.join(folder, manifestFileName))
+
+
+def close_checksum_manifest():
+    # Stop using the manifest in use (if any) and close it
+    manifest = checksum_engine.get_checksum_manifest()
+    checksum_engine.set_checksum_manifest(None)
+    if manifest is not None:
+        manifest.close()
+
+
+def use_checksum_manifest(folder):
+    #
+    # Open the manifest of a flight folder and make checksum_engine.calculate_checksum consult it, closing the manifest
+    # used before. Returns the manifest.
+    #
+    close_checksum_manifest()
+    manifest = open_checksum_manifest(folder)
+    checksum_engine.set_checksum_manifest(manifest)
+    return manifest
+
+
+def remove_checksum_manifest(folder):
+    # Delete the manifest files of a flight folder (before the folder is archived), closing the manifest if in use
+    manifestPath = os.path.join(folder, manifestFileName)
+    manifest = checksum_engine.get_checksum_manifest()
+    if manifest is not None and os.path.abspath(manifest.manifestPath) == os.path.abspath(manifestPath):
+        close_checksum_manifest()
+    for path in (manifestPath, manifestPath + '-wal', manifestPath + '-shm'):
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def record_rename(oldPath, newPath):
+    # Record a rename in the manifest in use (if any)
+    manifest = checksum_engine.get_checksum_manifest()
+    if manifest is not None:
+        manifest.record_rename(oldPath, newPath)
@@ -26,6 +26,8 @@ import time
 import datetime
 import csv
 
+from flight_identity import read_flight_identity
+
 secsInWeek = 604800
 secsInDay = 86400
 gpsEpoch = (1980, 1, 6, 0, 0, 0)  # (year, month, day, hh, mm, ss)
@@ -60,39 +62,13 @@ def UTCFromGps(gpsWeek, SOW, leapSecs=16):
     return (year, month, day, hh, mm, ss)
 
 def get_flightid_from_dji_log(djiLog):
-    djiList = []
 
     try:
-        with open(djiLog,'rU') as logfile:
-            header = next(logfile)  # Skip the header row
-            for row in logfile:  # Now start processing the rest of the log
-                rowFields = row.split(',')
-                lYear = rowFields[11][0:4]
-                lMonth = rowFields[11][5:7]
-                lDay = rowFields[11][8:10]
-                lhours = rowFields[11][11:13]
-                lminutes = rowFields[11][14:16]
-                lsecs = rowFields[11][17:19]
-                lmsecs = rowFields[11][20:]
-                lDate = lYear + '/' + lMonth + '/' + lDay
-                lTime = lhours + ':' + lminutes + ':' + lsecs + '.' + lmsecs
-                timeAndDate = (str(lYear).zfill(4), str(lMonth).zfill(2), str(lDay).zfill(2), str(lhours).zfill(2),
-                               str(lminutes).zfill(2), str(lsecs).zfill(2))
-                # Convert the timestamp to UTC time
-                timestamp = int(rowFields[43])
-                dateTimeStr = datetime.datetime.utcfromtimestamp(timestamp / 1000.0).strftime(
-                        '%Y/%m/%d %H:%M:%S.%f')
-                DateStr = dateTimeStr.split(' ')[0]
-                TimeStr = dateTimeStr.split(' ')[1]
-                djiList.append(timeAndDate)
-        flightId =  'uas_'+djiList[0][0]+djiList[0][1]+djiList[0][2] + '_' + \
-                    djiList[0][3]+djiList[0][4]+djiList[0][5] + '_' + \
-                    djiList[-1][0]+djiList[-1][1]+djiList[-1][2] + '_' + \
-                    djiList[-1][3]+djiList[-1][4]+djiList[-1][5]
-        startDate = datetime.date(int(djiList[0][0]),int(djiList[0][1]),int(djiList[0][2]))
-        startTime = datetime.time(int(djiList[0][3]),int(djiList[0][4]), int(djiList[0][5]))
-        endDate = datetime.date(int(djiList[-1][0]),int(djiList[-1][1]),int(djiList[-1][2]))
-        endTime = datetime.time(int(djiList[-1][3]),int(djiList[-1][4]), int(djiList[-1][5]))
+        flightId, firstDateTime, lastDateTime, logPath = read_flight_identity(djiLog)
+        startDate = firstDateTime.date()
+        startTime = firstDateTime.time().replace(microsecond=0)
+        endDate = lastDateTime.date()
+        endTime = lastDateTime.time().replace(microsecond=0)
     except Exception,e:
         print '*** Error*** Unable to process log file. Please check that the file specified is a valid DJI log. '
         print '*** Error Code:',e
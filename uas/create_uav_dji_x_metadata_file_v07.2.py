@@ -80,7 +80,6 @@ import time
 import math
 import sys
 import argparse
-import hashlib
 import os
 import glob
 import pathlib
@@ -91,15 +90,20 @@ from mysql.connector import errorcode
 
 import datetime
 import pytz
-from timezonefinder import TimezoneFinder
+from timezone_service import timezone_at
 
-import collections
-import bisect
-from scipy.spatial import cKDTree
 import numpy
 
+from dji_log import read_dji_log_ends
+from flight_log_cache import load_gps_track
+from frame_positions import calculate_frame_times, match_frames
+from frame_extractor import read_frame_index
+from checksum_engine import checksum_files
+from checksum_manifest import use_checksum_manifest, record_rename
+from geotag_writer import GeotagRecord, write_geotags, report_geotag_failures
+from plot_map_cache import load_plot_map
+
 from shapely import wkt
-from shapely.wkt import dumps
 from shapely.geometry import Point, LineString,Polygon
 
 secsInWeek = 604800
@@ -160,167 +164,21 @@ def get_image_file_list(uasPath, imageType,imageFileList):
 def interpolate_time(fflightLog):
     #
     # The default sampling frequency in the log file is 10 Hz.
-    # This function interpolates the UAV position at a frequency of 100 hz.
-    # The interpolated position data stored in dictionary with the image timestamp as a key.
-    # The function returns the dictionary gpsEventDict and the timezone associated with the log file times.
+    # This function interpolates the UAV position at a frequency of 100 hz over each range (isTakingVideo segment).
+    # The interpolated position data is returned as a GpsTrack (see gps_track.py) together with the timezone
+    # associated with the log file times.
     #
-    gpsEventDict = collections.OrderedDict()  # stores position,altitude,video status, interpolation indicator with time as key
-    gpsEventList = []
-    rowCount = 0
-    timestamp = 0
-    seedTime = 0
-    newTime = 0
-    prevTime = 0
-    nextTime = 0
-    lastTime=0
-    timeDelta = 0
-    takingVideo = '0'
-    prevLat = 0.0
-    nextLat = 0.0
-    prevLong = 0.0
-    nextLong = 0.0
-    prevAlt = 0.0
-    nextAlt = 0.0
-    latitude = 0.0
-    longitude = 0.0
-    altitude = 0.0
-    segment=0
-    with open(fflightLog, 'rU') as log:
-
-        header = next(log)  # Skip the header row
-
-        previous = next(log)  # Save the initial data row for comparison with next row
-        rowCount+=1
-        rowFields = previous.split(',')
-        latitude = float(rowFields[0]) + lonOffset
-        longitude = float(rowFields[1]) + latOffset
-        altitude = float(rowFields[2]) * 0.3048  # Convert altitude in feet to meters
-        lYear = rowFields[11][0:4]
-        lMonth = rowFields[11][5:7]
-        lDay = rowFields[11][8:10]
-        lhours = rowFields[11][11:13]
-        lminutes = rowFields[11][14:16]
-        lsecs = rowFields[11][17:19]
-        lmsecs = rowFields[11][20:]
-        lDate = lYear + '/' + lMonth + '/' + lDay
-        lTime = lhours + ':' + lminutes + ':' + lsecs + '.' + lmsecs
-        takingVideo = rowFields[37]
-        timestamp = int(rowFields[43])
-        interpolated = False  # The row is read directly from the file and is therefore not interpolated
-        tf = TimezoneFinder()
-        tzone = tf.timezone_at(lng=longitude, lat=latitude)
-
-        prevTime = timestamp
-        prevLat = latitude
-        prevLong = longitude
-        prevAlt = altitude
-
-        for row in log:  # Now start processing the rest of the log
-            rowCount+=1
-            rowFields = row.split(',')
-            latitude = float(rowFields[0]) + latOffset
-            longitude = float(rowFields[1]) + lonOffset
-            altitude = float(rowFields[2]) * 0.3048
-            lYear = rowFields[11][0:4]
-            lMonth = rowFields[11][5:7]
-            lDay = rowFields[11][8:10]
-            lhours = rowFields[11][11:13]
-            lminutes = rowFields[11][14:16]
-            lsecs = rowFields[11][17:19]
-            lmsecs = rowFields[11][20:]
-            lDate = lYear + '/' + lMonth + '/' + lDay
-            lTime = lhours + ':' + lminutes + ':' + lsecs + '.' + lmsecs
-            takingVideo = rowFields[37]
-            timestamp = int(rowFields[43])
-            interpolated = False
-            if takingVideo == '1':
-
-                # Start interpolation
-
-                timeDelta = timestamp - prevTime
-                latDelta = latitude - prevLat
-                longDelta = longitude - prevLong
-                altDelta = altitude - prevAlt
-
-
-                if seedTime == 0:
-                    seedTime = round((timestamp) / 1000.0, 2) * 1000
-                    newTime = int(seedTime)
-                    segment+=1
-
-                # Convert the timestamp to UTC time
-
-                dateTimeStr = datetime.datetime.utcfromtimestamp(timestamp / 1000.0).strftime('%Y/%m/%d %H:%M:%S.%f')
-                DateStr = dateTimeStr.split(' ')[0]
-                TimeStr = dateTimeStr.split(' ')[1]
-
-                # Store the log data
-
-                gpsEventList = [DateStr, TimeStr, latitude, longitude, altitude, takingVideo, interpolated,
-                                timestamp,segment]
-                gpsEventDict[timestamp] = gpsEventList
-
-                # Normal sampling interval is 100ms. The interpolated sampling interval is 10 ms.
-                # If the difference between the two times of interest is > 20 ms perform interpolation
-
-                lastTime = prevTime
-                if abs(timeDelta) > 10:
-                    interpolated = True
-                    newLat=prevLat
-                    newLong=prevLong
-                    newAlt=prevAlt
-                    while newTime < timestamp:
-                        timeFraction = (newTime - lastTime) / timeDelta
-                        if latDelta > 0.0:
-                            newLat += abs(latDelta) * timeFraction
-                        elif latDelta < 0.0:
-                            newLat -= abs(latDelta) * timeFraction
-                        if longDelta > 0.0:
-                            newLong += abs(longDelta) * timeFraction
-                        elif longDelta < 0.0:
-                            newLong -= abs(longDelta) * timeFraction
-                        if altDelta > 0.0:
-                            newAlt += abs(altDelta) * timeFraction
-                        elif altDelta < 0.0:
-                            newAlt -= abs(altDelta) * timeFraction
-                        newTimeStr = datetime.datetime.utcfromtimestamp(newTime / 1000.0).strftime(
-                            '%Y/%m/%d %H:%M:%S.%f')
-                        newDateStr = newTimeStr.split(' ')[0]
-                        newTimeStr = newTimeStr.split(' ')[1]
-                        gpsEventList = [newDateStr, newTimeStr, newLat, newLong, newAlt, takingVideo, interpolated,
-                                        newTime, segment]
-                        gpsEventDict[newTime] = gpsEventList
-                        rowCount+=1
-                        lastTime = newTime
-                        newTime += 10
-                else:
-                    newTime += 0
-
-            else:
-                seedTime = 0
-
-            prevTime = timestamp
-            prevLat = latitude
-            prevLong = longitude
-            prevAlt = altitude
-
-    return gpsEventDict, tzone
+    # The interpolated track is cached next to the log file (see flight_log_cache.py) so a rerun over the same flight
+    # does not parse the log again. Only the first row of the log is needed to find the timezone.
+    #
+    flightLogColumns = read_dji_log_ends(fflightLog)
 
+    tzone = timezone_at(flightLogColumns.lat[0] + float(latOffset), flightLogColumns.lon[0] + float(lonOffset))
 
-def hashfilelist(afile, blocksize=65536):
-    # Function used to compute an MD5 checksum
-    hasher = hashlib.md5()
-    buf = afile.read(blocksize)
-    while len(buf) > 0:
-        hasher.update(buf)
-        buf = afile.read(blocksize)
-    return hasher.hexdigest()
+    gpsTrack = load_gps_track(fflightLog, 100, latOffset, lonOffset)
 
+    return gpsTrack, tzone
 
-def calculate_checksum(ffilename):
-    # Function used to assign an MD5 checksum to each image.
-    checksum = hashfilelist(open(ffilename, 'rb'))
-    return checksum
 
 def init_metadata_record():
     record_id=None
@@ -371,21 +229,15 @@ def decimalDegrees2DMS(value, type):
                str(subseconds)[0:7] + "" + direction
     return notation
 
-def calculate_range_flight_durations(gpsEvents):
+def calculate_range_flight_durations(gpsTrack):
     #
     # This function calculates the duration of the flight time across each range in the experiment
     #
-    segRef=0
-    segStartTime=0
-    for event in sorted(gpsEvents.items()):
-        segment=event[1][-1]
-        if segment != segRef:
-            segStartTime=int(event[0])
-        segEndTime=int(event[0])
+    for segment, rangeTrack in gpsTrack.segments_view():
+        segStartTime=rangeTrack.start_time()
+        segEndTime=rangeTrack.end_time()
         segDuration=segEndTime-segStartTime
-        segRef=segment
         rangeDurations[segment]=[segStartTime,segEndTime,segDuration]
-        pass
     return(rangeDurations)
 
 def open_db_connection(config):
@@ -503,6 +355,11 @@ if renameImages == 'Y':
     pathlib.Path(renamePath).mkdir(parents=False, exist_ok=True)
 debugMode=args.debug
 
+# The checksums of images that have not changed since a previous run are taken from the checksum manifest of the
+# flight folder
+
+use_checksum_manifest(uasFolderPath)
+
 record_id = None
 notes = ''
 imageFileList = []
@@ -517,17 +374,16 @@ with open(metadataSqlFilePath, 'w') as sqlFile:
     sqlFile.close()
 
 # Read the log file and extract the list of timestamped events required to determine the UAV position at a given time.
-gpsEvents,localTimeZone =interpolate_time(flightLog)
-sortedKeys=list(sorted(gpsEvents.keys()))
+gpsTrack,localTimeZone =interpolate_time(flightLog)
 
-if len(gpsEvents)==0:
+if len(gpsTrack)==0:
     print("There were no gps events found in", flightLog)
     print()
 
-fltStartString=datetime.datetime.utcfromtimestamp(min(gpsEvents.keys())/1000.0)
-fltEndString=datetime.datetime.utcfromtimestamp(max(gpsEvents.keys())/1000.0)
-fltStart=time.gmtime(min(gpsEvents.keys())/1000.0)
-fltEnd=time.gmtime(max(gpsEvents.keys())/1000.0)
+fltStartString=datetime.datetime.utcfromtimestamp(gpsTrack.start_time()/1000.0)
+fltEndString=datetime.datetime.utcfromtimestamp(gpsTrack.end_time()/1000.0)
+fltStart=time.gmtime(gpsTrack.start_time()/1000.0)
+fltEnd=time.gmtime(gpsTrack.end_time()/1000.0)
 print()
 print('Flight Start: ',fltStartString)
 print('Flight End: ',fltEndString)
@@ -547,64 +403,51 @@ if debugMode == 'Y':
     with open(debugPath, 'w') as csvfile:
         header = csv.writer(csvfile)
         header.writerow(
-            ['newTime','newDateStr', 'newTimeStr', 'newLat', 'newLong', 'newAlt', 'takingVideo', 'interpolated','newTime','segment'])
+            ['newTime','newDateStr', 'newTimeStr', 'newLat', 'newLong', 'newAlt','segment'])
     csvfile.close()
 
     #with open('/bulk/mlucas/test/gpsEvents.csv', 'ab') as csvfile:
     with open(debugPath, 'a') as csvfile:
         print('Generating gpsEvents file', debugPath)
-        for lineitem in sorted(gpsEvents.iteritems()):
-            fileline = csv.writer(csvfile)
-            fileline.writerow([lineitem[0], lineitem[1][0], lineitem[1][1], lineitem[1][2], lineitem[1][3], lineitem[1][4], lineitem[1][5], lineitem[1][6],lineitem[1][7], lineitem[1][8]])
+        fileline = csv.writer(csvfile)
+        for newTime, newLat, newLong, newAlt, segment in zip(gpsTrack.timestamps.tolist(), gpsTrack.lat.tolist(),
+                                                              gpsTrack.lon.tolist(), gpsTrack.alt.tolist(),
+                                                              gpsTrack.segments.tolist()):
+            newDateStr, newTimeStr = datetime.datetime.utcfromtimestamp(newTime / 1000.0).strftime(
+                '%Y/%m/%d %H:%M:%S.%f').split(' ')
+            fileline.writerow([newTime, newDateStr, newTimeStr, newLat, newLong, newAlt, segment])
     csvfile.close()
 #**********************************************
 
-# Query the database for the plot polygons and store them in a dictionary with plot_id as key
-
-cursor, cnx = open_db_connection(config)
-plotQuery=("SELECT record_id,plot_id,ST_AsText(plot_polygon) FROM plot_map WHERE plot_id LIKE %s")
+# Load the plot polygons from the local plot map cache (refreshed from the plot_map table when it has changed) and
+# store them in a dictionary with plot_id as key
 
 try:
-    cursor.execute(plotQuery, (plotPrefix,))
-    if cursor.rowcount != 0:
-        for row in cursor:
-            plotId=row[1]
-            plotPolygon=row[2]
-            plt=wkt.loads(plotPolygon)
-            plots[plotId] = [plotId, plt, plt.centroid]
-    else:
-        print("There were no plots found in the database with plot prefix of " + plotPrefix)
-        print("Exiting...")
-        sys.exit()
+    plotMap = load_plot_map(plotPrefix, config)
 except Exception as e:
-    #print('Unexpected error during database query:', sys.exc_info()[0])
-    print('Unexpected error during database query:', e)
+    print('Unexpected error while loading the plot map:', e)
     print('Exiting...')
     sys.exit()
 
-print ('Closing connection to database table: plot_map ')
-commit_and_close_db_connection(cursor, cnx)
+if len(plotMap) == 0:
+    print("There were no plots found in the database with plot prefix of " + plotPrefix)
+    print("Exiting...")
+    sys.exit()
 
-# Build the KD Tree of plot coordinates that will be used to compute the nearest plot for a point
+for plotId, plt in zip(plotMap.plotIds, plotMap.polygons()):
+    plots[plotId] = [plotId, plt, plt.centroid]
 
+# Build the plot grid index that will be used to find the plot containing each image position
 
-plotCentroids = [] # Stores plot coordinates used to build KD Tree
-plotCentroidID=[] # Stores plot coordinates and plotID used to identify the name of the nearest plot
-for plotID in plots.items():
-    plotLon = plotID[1][2].centroid.x
-    plotLat = plotID[1][2].centroid.y
-    plotCentroids.append((plotLon,plotLat))
-    plotCentroidID.append((plotLon,plotLat,plotID[1][0]))
-plotPoints = numpy.array(plotCentroids)
-plotKDTree = cKDTree(plotPoints, leafsize=100)
+plotLattice = plotMap.lattice()
 
 # Get the list of image files available for the flight/
 
-rangeDurations=calculate_range_flight_durations(gpsEvents)
+rangeDurations=calculate_range_flight_durations(gpsTrack)
 
 #Get the timestamp of first log entry i.e. when isTakingVideo is first true.
 
-firstLogEntry = int(sortedKeys[0])
+firstLogEntry = gpsTrack.start_time()
 rangeSegment=1
 intersectedPlots={}
 
@@ -644,8 +487,28 @@ with open(plotRangePath, 'w') as plotRangeFile:
         print()
         print('UAS Metadata Output File: ',uasMetadataFile)
         frameIndex = 0
-        logTimeIndex= 0
-        timestamp = rangeDurations[rangeSegment][0]
+        geotagRecords = []
+        imagePaths = []
+
+        # Compute the time of every frame in the image set and assign the positions to all frames in one batch. Image
+        # sets written by frame_extractor.py are spaced by ground distance and list the time of each frame in their
+        # frame index.
+
+        if imageCount > 0:
+            frameIndexTimes = read_frame_index(uasPath)
+            if frameIndexTimes is not None and all(f in frameIndexTimes for f in imagefiles):
+                print("Frame times read from the frame index of", folder)
+                frameTimes = numpy.array([frameIndexTimes[f] for f in imagefiles])
+            else:
+                frameTimes = calculate_frame_times(rangeDurations[rangeSegment][0], rangeDurations[rangeSegment][2],
+                                                   imageCount)
+            framePositions = match_frames(gpsTrack, frameTimes)
+            frameTimes = framePositions['frame_time'].tolist()
+            frameLatitudes = framePositions['latitude'].tolist()
+            frameLongitudes = framePositions['longitude'].tolist()
+            frameAltitudes = framePositions['altitude'].tolist()
+            framePlots = plotLattice.locate(numpy.column_stack((framePositions['longitude'],
+                                                                framePositions['latitude'])))
 
         try:
             for f in imagefiles:
@@ -653,25 +516,19 @@ with open(plotRangePath, 'w') as plotRangeFile:
                 imagefilename=f
                 imagefilepath=uasPath+imagefilename
 
-            # Interpolate Longitude,Latitude and Altitude of image
-            # Convert date/time/frame to timestamp
+            # Longitude,Latitude and Altitude of image interpolated at the frame time
             #
 
-            # Find the time index in GPS events that is less than or equal to the frame time
-
-                logTimeIndex = bisect.bisect_left(sortedKeys, timestamp)
-                gpsEventsKey = sortedKeys[logTimeIndex]
-                gpsEvents[gpsEventsKey].extend((logTimeIndex,timestamp, abs(gpsEventsKey - timestamp),imagefilename))
-
-                uas_latitude=gpsEvents[gpsEventsKey][2]
-                uas_longitude=gpsEvents[gpsEventsKey][3]
-                # Create a WKT representation of the position POINT object using shapely dumps function
-                uas_position = dumps(Point(uas_longitude, uas_latitude))
+                timestamp = frameTimes[frameIndex]
+                uas_latitude = frameLatitudes[frameIndex]
+                uas_longitude = frameLongitudes[frameIndex]
+                uas_altitude = frameAltitudes[frameIndex]
+                # WKT representation of the position POINT object
+                uas_position = framePositions['position'][frameIndex]
                 uas_position_source = logSource # Position data derived from image EXIF
 
-                uas_altitude = gpsEvents[gpsEventsKey][4]
-                uas_sample_date_utc=gpsEvents[gpsEventsKey][0]
-                uas_sample_time_utc=gpsEvents[gpsEventsKey][1]
+                uas_sample_date_utc = framePositions['date_utc'][frameIndex]
+                uas_sample_time_utc = framePositions['time_utc'][frameIndex]
 
                 metadata_record[0]=record_id
                 metadata_record[2]=flightId
@@ -686,15 +543,13 @@ with open(plotRangePath, 'w') as plotRangeFile:
                 metadata_record[12] = uas_position_source
                 metadata_record[13] = ''
 
-            # Determine whether the point corresponding to the image position lies within a plot
+            # The plot containing the image position (None if the position lies outside all plots)
 
-                pt=numpy.array([uas_longitude,uas_latitude]) # UAS position
-                nearest = plotKDTree.query(pt, k=1, distance_upper_bound=6) # Find the nearest plot centroid for pt
-                plotID=plotCentroidID[nearest[1]][2] # Lookup the plot given the plot centroid
+                plotID = framePlots[frameIndex]
 
                 # Build the list of plots intersected by points on the flight path of a range
 
-                if plotID not in intersectedPlots and plots[plotID][1].contains(Point(uas_longitude,uas_latitude)) :
+                if plotID is not None and plotID not in intersectedPlots:
                     intersectedPlots[plotID]=[rangeSegment,plotID,plots[plotID][1].wkt,timestamp]
                     print('Plot intersection found for range: ' + str(rangeSegment),' Plot ID: '+ plotID
                           + ' Timestamp: '+ str(timestamp))
@@ -712,6 +567,7 @@ with open(plotRangePath, 'w') as plotRangeFile:
                     metadata_record[1] = newimagefilename
                     oldimagefilepath = uasPath + imagefilename
                     os.rename(oldimagefilepath, newimagefilepath)
+                    record_rename(oldimagefilepath, newimagefilepath)
                     print('old file name: ', oldimagefilepath)
                     print('new file name: ', newimagefilepath)
                     print()
@@ -720,40 +576,17 @@ with open(plotRangePath, 'w') as plotRangeFile:
                     newimagefilepath = oldimagefilepath
                     metadata_record[1] = imagefilename
 
-                metadata_record[11] = calculate_checksum(newimagefilepath)
                 metadata_record[0] = record_id
 
                 metadatalist.append(metadata_record)
+                imagePaths.append(newimagefilepath)
                 #
-                # Update the EXIF GPS data in each image using exiftool
+                # Collect the EXIF GPS position of each image. The positions of the image set are written in bulk after
+                # the last image (see geotag_writer.py). The log altitude is above ground level so it is not written.
                 #
 
-                try:
-                    if updateExif=='Y':
-                        imageName=newimagefilepath
-                        if uas_longitude < 0:
-                            uas_longitude_ref='W'
-                        else:
-                            uas_longitude_ref='E'
-                        if uas_latitude < 0:
-                            uas_latitude_ref= 'S'
-                        else:
-                            uas_latitude_ref='N'
-                        uas_altitude_ref = '+'  # Above Sea Level
-                        #print("Updating GPS EXIF for Image Name", imageName, "Latitude:", uas_latitude,
-                        #      "Longitude:", uas_longitude, "Latitude Ref:", uas_latitude_ref,
-                        #      "Longitude Ref:", uas_longitude_ref)
-                        ll = subprocess.Popen(["exiftool",
-                                               "-GPSLatitude=" + str(uas_latitude),
-                                               "-GPSLatitudeRef=" + uas_latitude_ref,
-                                               "-GPSLongitude=" + str(uas_longitude),
-                                               "-GPSLongitudeRef=" + uas_longitude_ref,
-                                               imageName],stdout=subprocess.PIPE)
-                        output, err = ll.communicate()
-                        ll.kill()
-                except:
-                    pass
-                timestamp += frameInterval
+                if updateExif=='Y':
+                    geotagRecords.append(GeotagRecord(newimagefilepath, uas_latitude, uas_longitude, None))
                 frameIndex += 1
 
         except Exception as e:
@@ -762,6 +595,17 @@ with open(plotRangePath, 'w') as plotRangeFile:
             print('*** Trying to continue...')
             pass
 
+        # Compute the MD5 checksums of the image set at once (see checksum_engine.py), before the EXIF update
+
+        for metadata_record, checksum in zip(metadatalist, checksum_files(imagePaths)):
+            metadata_record[11] = checksum
+
+        # Update the EXIF GPS data of the images of the image set
+
+        if updateExif=='Y' and len(geotagRecords) > 0:
+            print('Updating EXIF GPS position of', len(geotagRecords), 'images')
+            report_geotag_failures(write_geotags(geotagRecords))
+
         with open(uasMetadataFile, 'w') as csvfile:
             header = csv.writer(csvfile)
             header.writerow(
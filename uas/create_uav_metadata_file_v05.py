@@ -50,8 +50,9 @@ import math
 import utm
 import sys
 import argparse
-import hashlib
-import exifread
+from checksum_engine import checksum_files
+from checksum_manifest import use_checksum_manifest
+from exif_reader import read_exif, gps_degrees, gps_date_time
 
 secsInWeek = 604800
 secsInDay = 86400
@@ -180,21 +181,8 @@ def get_apm_log_info(fapmLog):
     return camEventList, gpsEventList
 
 
-def hashfilelist(afile, blocksize=65536):
-    hasher = hashlib.md5()
-    buf = afile.read(blocksize)
-    while len(buf) > 0:
-        hasher.update(buf)
-        buf = afile.read(blocksize)
-    return hasher.hexdigest()
-
-
-def calculate_checksum(ffilename):
-    checksum = hashfilelist(open(ffilename, 'rb'))
-    return checksum
-
 def get_image_exif_data(ffilename):
-    tags = exifread.process_file(image)
+    tags = read_exif(ffilename)
     fcam_position_x     = None
     fcam_position_y     = None
     fcam_position_z     = None
@@ -208,22 +196,16 @@ def get_image_exif_data(ffilename):
     try:
 
     # Get Camera GPS Altitude
-        if gpsAltTag in tags:
-            altStr          = str(tags[gpsAltTag])
-            if '/' in altStr:
-                altNum,altDenom = altStr.split('/')
-                fcam_position_z  = str(float(altNum)/float(altDenom))
-            else:
-                fcam_position_z = altStr
+        if 'GPSAltitude' in tags:
+            fcam_position_z = str(tags['GPSAltitude'])
         else:
             fcam_position_z = '0'
 
 
     #    Get Camera GPS Altitude reference MSL - Mean Sea Level BMSL = Below Mean Sea Level
 
-        if gpsAltRefTag in tags:
-            altRefStr = str(tags[gpsAltRefTag])
-            if altRefStr == '0':
+        if 'GPSAltitudeRef' in tags:
+            if tags['GPSAltitudeRef'] == 0:
                 fcam_altitude_ref='AMSL'
             else:
                 fcam_altitude_ref='BMSL'
@@ -232,36 +214,9 @@ def get_image_exif_data(ffilename):
 
 
     # Get Camera GPS Latitude and Longitude Data
-        latRefStr       = str(tags[gpsLatRefTag])
-        latStrLen       = len(str(tags[gpsLatTag]))-1
-        latStr          = str(tags[gpsLatTag])[1:latStrLen]
-        lat,latMins,latSecs = latStr.split(', ')
-        if '/' in latSecs:
-            latSecsNum,latSecsDenom = latSecs.split('/')
-            latSecsDec = float(latSecsNum)/float(latSecsDenom)
-        else:
-            latSecsDec=float(latSecs)
-
-        if latRefStr == "S":
-            fcam_latitude = (float(lat)+ (float(latMins)/60) + latSecsDec/3600) * (-1)
-        elif latRefStr == "N":
-            fcam_latitude = (float(lat)+ (float(latMins)/60) + latSecsDec/3600)
-
 
-        longRefStr      = str(tags[gpsLongRefTag])
-        lonStrLen       = len(str(tags[gpsLongTag]))-1
-        lonStr          = str(tags[gpsLongTag])[1:lonStrLen]
-        lon,lonMins,lonSecs = lonStr.split(', ')
-        if '/' in lonSecs:
-            lonSecsNum,lonSecsDenom = lonSecs.split('/')
-            lonSecsDec = float(lonSecsNum)/float(lonSecsDenom)
-        else:
-            lonSecsDec=float(lonSecs)
-
-        if longRefStr == "W":
-            fcam_longitude = (float(lon)+ (float(lonMins)/60) + lonSecsDec/3600) * (-1)
-        elif longRefStr == "E":
-            fcam_longitude = (float(lon)+ (float(lonMins)/60) + lonSecsDec/3600)
+        fcam_latitude = gps_degrees(tags, 'GPSLatitude')
+        fcam_longitude = gps_degrees(tags, 'GPSLongitude')
 
     # Get Camera UTM Position
         camUtmPosition  = get_image_utm_position(fcam_latitude, fcam_longitude)
@@ -275,20 +230,7 @@ def get_image_exif_data(ffilename):
 
     # Get Camera Image Date and Time
 
-        dateStr=str(tags[gpsDateTag])
-        year,month,day = dateStr.split(':')
-        fcam_sample_date=year+'/'+month+'/'+day
-
-        timeStrLen = len(str(tags[gpsTimeTag]))-1
-        timeStr = str(tags[gpsTimeTag])[1:timeStrLen]
-        if '/' in timeStr:
-            hrs, mins, secsFract = timeStr.split(', ')
-            secsNum,secsDenom = secsFract.split('/')
-            secs = str(int(secsNum)/int(secsDenom))
-        else:
-            hrs, mins, secs = timeStr.split(', ')
-
-        fcam_sample_time=hrs.zfill(2)+':'+mins.zfill(2)+':'+secs.zfill(2)
+        fcam_sample_date, fcam_sample_time = gps_date_time(tags)
 
 
     except Exception,e:
@@ -421,12 +363,18 @@ flightId = 'uas_'+ gpsEvents[0][0] + gpsEvents[0][1] + gpsEvents[0][2] + '_' + \
 
 print 'Flight ID:', flightId
 
+# Compute the checksums of all images at once (see checksum_engine.py). The checksums of images that have not changed
+# since a previous run are taken from the checksum manifest of the image folder.
+
+use_checksum_manifest(uasPath)
+imageChecksums = dict(zip(imagefiles, checksum_files([uasPath + f for f in imagefiles])))
+
 camIndex = 0
 for f in imagefiles:
     metadata_record=init_metadata_record()
     filename = uasPath + f
     imagefilename = f
-    metadata_record[24]=calculate_checksum(filename)
+    metadata_record[24]=imageChecksums[f]
     metadata_record[0]=record_id
     metadata_record[1]=imagefilename
     metadata_record[2]=flightId
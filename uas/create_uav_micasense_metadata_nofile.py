@@ -31,6 +31,11 @@ import sys
 import os
 import argparse
 from imagepreprocess import *
+from flight_identity import read_flight_identity, flight_id_fields
+from exif_harvest import harvest_images
+from checksum_manifest import use_checksum_manifest, remove_checksum_manifest, record_rename
+from transfer_engine import transfer_files, move_tree, report_transfer_failures
+from dedup_index import open_dedup_index, report_duplicates
 from shapely import wkt
 from shapely.wkt import dumps
 from shapely.geometry import Point,Polygon,MultiPoint
@@ -59,38 +64,8 @@ def parse_flight_folder_name(flightFolder):
     return dateStr,timeStr,plElevStr,camStr,angleStr,imgTypeStr,seqStr
 
 def create_flightId_from_logfile(flightLog):
-    flightLogList=[]
-    with open(flightLog, 'rU') as log:
-        header = next(log)  # Skip the header row
-        for row in log:
-            flightLogList.append(row)
-        firstRow=flightLogList[0]
-        rowFields = firstRow.split(',')
-        lYear = rowFields[11][0:4]
-        lMonth = rowFields[11][5:7]
-        lDay = rowFields[11][8:10]
-        lhours = rowFields[11][11:13]
-        lminutes = rowFields[11][14:16]
-        lsecs = rowFields[11][17:19]
-
-        utcStartDate = lYear + lMonth + lDay
-        utcStartTime = lhours + lminutes + lsecs
-
-        lastRow=flightLogList[-1]
-        rowFields = lastRow.split(',')
-        lYear = rowFields[11][0:4]
-        lMonth = rowFields[11][5:7]
-        lDay = rowFields[11][8:10]
-        lhours = rowFields[11][11:13]
-        lminutes = rowFields[11][14:16]
-        lsecs = rowFields[11][17:19]
-
-        utcEndDate = lYear + lMonth + lDay
-        utcEndTime = lhours + lminutes + lsecs
-
-        flightID = 'uas_'+utcStartDate+'_'+utcStartTime+'_'+utcEndDate+'_'+utcEndTime
-
-    return flightID,utcStartDate,utcStartTime,utcEndDate,utcEndTime
+    # Only the header and the first and last complete records of the log are read (see flight_identity.py)
+    return flight_id_fields(read_flight_identity(flightLog))
 
 def create_flightId_from_image_datetime(metadataList,longitude,latitude):
 
@@ -143,6 +118,9 @@ cmdline.add_argument('-t', '--type', help='Image file type extension, e.g. TIF,
 cmdline.add_argument('-o', '--out', help='Output file path and filename',
                      default='/cygdrive/f/uav_processed/')
 
+cmdline.add_argument('-w', '--workers', type=int, help='Number of EXIF and checksum harvest workers (default is the '
+                     'number of cores)', default=None)
+
 args = cmdline.parse_args()
 
 uasPath = args.dir
@@ -159,6 +137,14 @@ uasFolderPathList=[]
 #uasFolderList=[]
 uasSubFolderList=[]
 uasLogFileList=[]
+folderChecksums={} # Image file name: md5 checksum of each data set folder, used to verify the archive move
+folderFlightIds={}
+duplicateFolders=set()
+
+# Images already archived are found with the duplicate image index of the archive folder, kept on local disk
+# (see dedup_index.py)
+
+dedupIndex=open_dedup_index(uasOutPath)
 
 # Search for data set folders that need to be processed and store in a list
 # NB '' item in os.path.join adds an os-independent trailing slash character
@@ -194,6 +180,13 @@ for uasFolder in uasFolderPathList:
     uasSubFolderList=[]
     uasSubFolderList=[os.path.join(uasFolder,name)+'/' for name in os.listdir(uasFolder) if os.path.isdir(os.path.join(uasFolder,name))]
 
+    # List the images of every sub-folder, then harvest the EXIF data and checksums of all images of the data set with
+    # a process pool. The results are returned in the order of imageEntries. The checksums of images that have not
+    # changed since a previous run are taken from the checksum manifest of the data set folder.
+
+    imageEntries = []
+    folderChecksums[uasFolder] = {}
+    use_checksum_manifest(uasFolder)
     for subFolder in uasSubFolderList:
         print("Processing Data Set sub-folder: "+subFolder)
         # Get the list of image files in the sub-folder
@@ -203,42 +196,51 @@ for uasFolder in uasFolderPathList:
             pass
         else:
             print("Number of images in " + subFolder + "=" + str(len(imagefiles)))
-            for f in imagefiles:
-                filename = subFolder + f
-                imagefilename = f
-                #
-                # Get Image File EXIF metadata
-                #
-                with open(filename, 'rb') as image:
-                    position_x, position_y, altitudeFeet, latitude, longitude, dateUTC, \
-                    timeUTC, lat_zone, long_zone, altitudeRef, cam_serial_no = get_image_exif_data(image)
-                image.close()
-                flightId=None
-                y = dateUTC[0:4]
-                m = dateUTC[5:7]
-                d = dateUTC[8:10]
-                dateString = y + m + d
-                h = timeUTC[0:2]
-                mm = timeUTC[3:5]
-                s = timeUTC[6:8]
-                timeString = h + mm + s
-                sensorId = 'CAM_' + cam_serial_no
-                # Create a WKT representation of the position POINT object using shapely dumps function
-                position = dumps(Point(longitude, latitude))
-                positionRef = 'EXIF'
-                notes = None
-                # Rename image files
-                imageFileName = sensorId + '_' + dateString + '_' + timeString + '_' + imagefilename
-                oldImageFilePath = subFolder + imagefilename
-                newImageFilePath = subFolder + imageFileName
-                os.rename (oldImageFilePath,newImageFilePath)
-                # Populate the metadata data structure for the renamed image
-                metadataRecord = []
-                altitude = float(altitudeFeet) * 0.3048
-                md5sum = calculate_checksum(newImageFilePath)
-                metadataRecord = [imageFileName, flightId, sensorId, dateUTC, timeUTC, position, altitude, altitudeRef,
-                                  md5sum, positionRef, notes]
-                metadataList.append(metadataRecord)
+            imageEntries.extend((subFolder, f) for f in imagefiles)
+
+    # Check all images against the duplicate image index before any image is renamed or inserted. A data set with
+    # images that were already archived (e.g. an SD card offloaded twice) is left in staging.
+
+    duplicates = dedupIndex.find_duplicates([subFolder + f for subFolder, f in imageEntries])
+    if len(duplicates) > 0:
+        report_duplicates(duplicates, len(imageEntries), uasFolder)
+        print("Skipping data set " + uasFolder + " - it is left in staging")
+        duplicateFolders.add(uasFolder)
+        continue
+
+    harvestStart = time.time()
+    harvest = harvest_images([subFolder + f for subFolder, f in imageEntries], args.workers)
+    for (subFolder, imagefilename), (exifData, md5sum) in zip(imageEntries, harvest):
+        position_x, position_y, altitudeFeet, latitude, longitude, dateUTC, \
+        timeUTC, lat_zone, long_zone, altitudeRef, cam_serial_no = exifData
+        flightId=None
+        y = dateUTC[0:4]
+        m = dateUTC[5:7]
+        d = dateUTC[8:10]
+        dateString = y + m + d
+        h = timeUTC[0:2]
+        mm = timeUTC[3:5]
+        s = timeUTC[6:8]
+        timeString = h + mm + s
+        sensorId = 'CAM_' + cam_serial_no
+        # Create a WKT representation of the position POINT object using shapely dumps function
+        position = dumps(Point(longitude, latitude))
+        positionRef = 'EXIF'
+        notes = None
+        # Rename image files. The checksum was computed before the rename from the same image contents.
+        imageFileName = sensorId + '_' + dateString + '_' + timeString + '_' + imagefilename
+        oldImageFilePath = subFolder + imagefilename
+        newImageFilePath = subFolder + imageFileName
+        os.rename (oldImageFilePath,newImageFilePath)
+        record_rename(oldImageFilePath, newImageFilePath)
+        # Populate the metadata data structure for the renamed image
+        metadataRecord = []
+        altitude = float(altitudeFeet) * 0.3048
+        metadataRecord = [imageFileName, flightId, sensorId, dateUTC, timeUTC, position, altitude, altitudeRef,
+                          md5sum, positionRef, notes]
+        metadataList.append(metadataRecord)
+        folderChecksums[uasFolder][imageFileName] = md5sum
+    print(len(metadataList), "images harvested in", round(time.time() - harvestStart, 2), "seconds")
 
     # Compute the flight ID from the image timestamps to support case where logfile is not available
 
@@ -246,6 +248,7 @@ for uasFolder in uasFolderPathList:
     #   create_flightId_from_image_datetime(metadataList,longitude,latitude)
     flightId, utcStartDate, utcStartTime, utcEndDate, utcEndTime = \
         create_flightId_from_image_datetime(metadataList, longitude, latitude)
+    folderFlightIds[uasFolder] = flightId
 
     print("")
     print("Connecting to Database...")
@@ -324,6 +327,8 @@ for uasFolder in uasFolderPathList:
 # Move all of the image files to the top level of the sub-folder
 
 for uasFolder in uasFolderPathList:
+    if uasFolder in duplicateFolders:
+        continue
 
 # Process each image sub-folder
 
@@ -338,17 +343,27 @@ for uasFolder in uasFolderPathList:
             pass
         else:
             print("Moving " + str(len(imagefiles)) + " images from " + subFolder + " to " + uasFolder)
-            for f in imagefiles:
-                oldFilename = subFolder + f
-                newFilename = uasFolder + f
-                shutil.move(oldFilename,newFilename)
-            print("Cleaning up...")
-            os.rmdir(subFolder)
+            moved, moveFailures = transfer_files([(subFolder + f, uasFolder + f, None) for f in imagefiles], move=True)
+            report_transfer_failures(moveFailures)
+            if len(moveFailures) == 0:
+                print("Cleaning up...")
+                os.rmdir(subFolder)
 
 # Move the data set to the uav_processed folder
 
     print("Moving processed data sets from " + uasFolder + " to " + uasOutPath)
-    shutil.move(uasFolder,uasOutPath)
+    # Images copied to another file system are checked against the checksums of the metadata (see transfer_engine.py).
+    # The checksum manifest of the data set folder is only used by reruns on the staging folder and is not archived.
+    remove_checksum_manifest(uasFolder)
+    moveFailures = move_tree(uasFolder, uasOutPath, folderChecksums.get(uasFolder))
+    report_transfer_failures(moveFailures)
+
+# Add the archived images to the duplicate image index
+
+    if len(moveFailures) == 0:
+        archivedFolder = os.path.join(uasOutPath, os.path.basename(os.path.normpath(uasFolder)), '')
+        dedupIndex.add_images([(archivedFolder + imageFileName, md5sum, folderFlightIds.get(uasFolder))
+                               for imageFileName, md5sum in folderChecksums[uasFolder].items()])
 
 # Exit the program gracefully
 
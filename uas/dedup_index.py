@@ -0,0 +1,153 @@
+#
+# Version 0.1 October 2018
+#
+# This is a module that contains the duplicate image index used to detect images that were already archived.
+#
+# The md5sum of every image is stored in uas_images but was never used to detect an SD card offloaded twice, so a
+# flight ingested again was renamed, inserted a second time and archived twice. The index is a SQLite database mapping
+# the MD5 checksum of every archived image to its archived path and flight ID. The ingest programs check all images of a
+# data set against it before renaming or inserting them:
+#
+#   1. Size         Images whose size is not the size of any archived image are new. This needs only an os.stat.
+#   2. Partial MD5  The MD5 of the first and last partialSize bytes of the remaining images is looked up with the size.
+#   3. MD5          Only the images matching on size and partial MD5 are hashed in full (see checksum_engine.py) and
+#                   looked up by checksum.
+#
+# A new flight is therefore cleared without reading its images, and a flight ingested again is found by reading a few
+# hundred KiB of each image before any image is hashed in full. The partial and full hashes are computed by a thread
+# pool.
+#
+# The archive folder is usually on network storage (NFS, CIFS), where SQLite file locking is not reliable, so the index
+# is kept on local disk under ~/.htp/dedup_index, in a file named after the real path of the archive folder (as the plot
+# map cache, see plot_map_cache.py). Each computer ingesting into an archive folder therefore has its own index of the
+# images it archived there.
+#
+
+from __future__ import print_function
+from __future__ import division
+
+import os
+import re
+import sqlite3
+import hashlib
+import collections
+from multiprocessing.pool import ThreadPool
+
+import checksum_engine
+
+defaultIndexFolder = os.path.join(os.path.expanduser('~'), '.htp', 'dedup_index')
+partialSize = 65536
+dedupTimeout = 60.0  # seconds to wait for a write lock held by another ingest program
+
+Duplicate = collections.namedtuple('Duplicate', ['path', 'md5', 'archivedPath', 'flightId'])
+
+
+def partial_checksum(path, size=None):
+    # Return the MD5 of the first and last partialSize bytes of a file (of the whole file when it is smaller)
+    size = size if size is not None else os.stat(path).st_size
+    hasher = hashlib.md5()
+    with open(path, 'rb') as imageFile:
+        hasher.update(imageFile.read(partialSize))
+        if size > partialSize:
+            imageFile.seek(max(size - partialSize, partialSize))
+            hasher.update(imageFile.read(partialSize))
+    return hasher.hexdigest()
+
+
+def _map(function, items, workers):
+    if workers <= 1 or len(items) <= 1:
+        return [function(item) for item in items]
+    pool = ThreadPool(min(workers, len(items)))
+    try:
+        return pool.map(function, items, 1)
+    finally:
+        pool.close()
+        pool.join()
+
+
+class DedupIndex(object):
+    '''MD5 checksums of the archived images with their archived path and flight ID.'''
+
+    def __init__(self, indexPath):
+        self.indexPath = indexPath
+        self.connection = sqlite3.connect(indexPath, timeout=dedupTimeout)
+        self.connection.execute('CREATE TABLE IF NOT EXISTS images (md5 TEXT PRIMARY KEY, size INTEGER, '
+                                'partial_md5 TEXT, path TEXT, flight_id TEXT)')
+        self.connection.execute('CREATE INDEX IF NOT EXISTS images_size_partial ON images (size, partial_md5)')
+        self.connection.commit()
+
+    def close(self):
+        self.connection.close()
+
+    def find_duplicates(self, paths, workers=None):
+        #
+        # Return the list of Duplicate of the images of paths that are already in the index (in the order of paths).
+        # The images are hashed by workers threads, chosen from the storage of the first image when workers is None.
+        #
+        paths = list(paths)
+        if len(paths) == 0:
+            return []
+        if workers is None:
+            workers = checksum_engine.storage_workers(os.path.dirname(os.path.abspath(paths[0])))
+        archivedSizes = set(row[0] for row in self.connection.execute('SELECT DISTINCT size FROM images'))
+        sizes = [os.stat(path).st_size for path in paths]
+        candidates = [(path, size) for path, size in zip(paths, sizes) if size in archivedSizes]
+        if len(candidates) == 0:
+            return []
+
+        partials = _map(lambda candidate: partial_checksum(*candidate), candidates, workers)
+        matches = [path for (path, size), partial in zip(candidates, partials)
+                   if self.connection.execute('SELECT 1 FROM images WHERE size = ? AND partial_md5 = ? LIMIT 1',
+                                              (size, partial)).fetchone() is not None]
+        checksums = _map(checksum_engine.calculate_checksum, matches, workers)
+
+        duplicates = []
+        for path, checksum in zip(matches, checksums):
+            row = self.connection.execute('SELECT path, flight_id FROM images WHERE md5 = ?', (checksum,)).fetchone()
+            if row is not None:
+                duplicates.append(Duplicate(path, checksum, row[0], row[1]))
+        return duplicates
+
+    def add_images(self, images, workers=None):
+        #
+        # Add archived images to the index, a list of (archived path, MD5 checksum, flight ID). An image already in the
+        # index keeps its first archived path and flight ID.
+        #
+        images = list(images)
+        if len(images) == 0:
+            return
+        if workers is None:
+            workers = checksum_engine.storage_workers(os.path.dirname(os.path.abspath(images[0][0])))
+        sizes = [os.stat(path).st_size for path, checksum, flightId in images]
+        partials = _map(lambda image: partial_checksum(image[0][0], image[1]), list(zip(images, sizes)), workers)
+        self.connection.executemany('INSERT OR IGNORE INTO images (md5, size, partial_md5, path, flight_id) '
+                                    'VALUES (?, ?, ?, ?, ?)',
+                                    [(checksum, size, partial, os.path.abspath(path), flightId)
+                                     for (path, checksum, flightId), size, partial in zip(images, sizes, partials)])
+        self.connection.commit()
+
+
+def dedup_index_path(archiveFolder, indexFolder=defaultIndexFolder):
+    # Return the index file path of an archive folder. The real path of the folder is hashed so two folders never share
+    # a file name.
+    key = os.path.realpath(archiveFolder)
+    name = re.sub('[^A-Za-z0-9]', '_', key) + '_' + hashlib.md5(key.encode('utf-8')).hexdigest()[:8]
+    return os.path.join(indexFolder, name + '.sqlite')
+
+
+def open_dedup_index(archiveFolder, indexFolder=defaultIndexFolder):
+    # Return the DedupIndex of an archive folder, creating it (on local disk, in indexFolder) if there is none
+    if not os.path.isdir(indexFolder):
+        os.makedirs(indexFolder)
+    return DedupIndex(dedup_index_path(archiveFolder, indexFolder))
+
+
+def report_duplicates(duplicates, imageCount, folder):
+    # Print a summary of the images of a data set folder that were already archived
+    if len(duplicates) == 0:
+        return
+    flights = sorted(set(str(duplicate.flightId) for duplicate in duplicates))
+    print('*** Warning***', len(duplicates), 'of', imageCount, 'images of', folder, 'were already archived with flight',
+          ', '.join(flights))
+    for duplicate in duplicates[:10]:
+        print('***', duplicate.path, 'is a copy of', duplicate.archivedPath)
@@ -0,0 +1,283 @@
+#
+# Version 0.1 October 2018
+#
+# This is a module that contains the DJI flight log (_v2.csv) reader shared by the HTP DJI programs.
+#
+# The log is parsed in a single pass into typed numpy column arrays. Columns are located by their header name so the
+# programs no longer depend on hard-coded column indexes. The legacy column index is only used when a log does not
+# contain the named column.
+#
+# Columns returned (FlightLog attributes):
+#
+#   lat             Latitude (degrees)
+#   lon             Longitude (degrees)
+#   alt             Altitude (meters, converted from the altitude(feet) column)
+#   elapsed         Time elapsed since the start of the flight (ms)
+#   timestamp       UTC timestamp (ms since the unix epoch)
+#   datetime        UTC date and time (numpy datetime64[ms])
+#   datetimeLocal   Local date and time (numpy datetime64[ms]) or None if not present in the log
+#   isTakingVideo   True when the camera is recording video
+#   isTakingPhoto   True when the camera is taking a photo or None if not present in the log
+#
+# Long mapping missions produce logs of hundreds of MB so the module also provides bounded-memory readers:
+#
+#   iter_dji_log_chunks     Yields the log as FlightLogs of at most chunkRows rows
+#   iter_video_segments     Yields each isTakingVideo segment as soon as it is complete
+#   read_dji_log_ends       Reads only the header, the first row and the last complete row of the log
+#
+
+from __future__ import print_function
+from __future__ import division
+
+import io
+import os
+import itertools
+import numpy
+
+feetToMeters = 0.3048
+
+defaultChunkRows = 50000
+tailBlockSize = 65536
+
+# Log columns used by the HTP programs: attribute name, header name, legacy column index, numpy type, required
+
+logColumns = [
+    ('lat',             'latitude',             0,      'f8',   True),
+    ('lon',             'longitude',            1,      'f8',   True),
+    ('alt',             'altitude(feet)',       2,      'f8',   True),
+    ('elapsed',         'time(millisecond)',    10,     'i8',   False),
+    ('datetime',        'datetime(utc)',        11,     'U32',  False),
+    ('datetimeLocal',   'datetime(local)',      12,     'U32',  False),
+    ('isTakingPhoto',   'isTakingPhoto',        27,     'i1',   False),
+    ('isTakingVideo',   'isTakingVideo',        37,     'i1',   False),
+    ('timestamp',       'timestamp',            43,     'i8',   False),
+]
+
+
+class FlightLog(object):
+    '''Column arrays of a DJI flight log. Indexing with a slice or a boolean mask returns a FlightLog of the rows.'''
+
+    __slots__ = ('path', 'lat', 'lon', 'alt', 'elapsed', 'timestamp', 'datetime', 'datetimeLocal', 'isTakingVideo',
+                 'isTakingPhoto')
+
+    def __init__(self, path, lat, lon, alt, elapsed, timestamp, datetime, datetimeLocal=None, isTakingVideo=None,
+                 isTakingPhoto=None):
+        self.path = path
+        self.lat = lat
+        self.lon = lon
+        self.alt = alt
+        self.elapsed = elapsed
+        self.timestamp = timestamp
+        self.datetime = datetime
+        self.datetimeLocal = datetimeLocal
+        self.isTakingVideo = isTakingVideo
+        self.isTakingPhoto = isTakingPhoto
+
+    def __len__(self):
+        return len(self.timestamp)
+
+    def __getitem__(self, rows):
+        columns = [getattr(self, name) for name in self.__slots__[1:]]
+        return FlightLog(self.path, *[None if column is None else column[rows] for column in columns])
+
+    def video_segments(self):
+        # Return a list of (start,stop) row index pairs, one for each run of rows where isTakingVideo is true.
+        # The X5R records video while flying over a range so each pair corresponds to a range.
+        if self.isTakingVideo is None:
+            return []
+        video = numpy.concatenate(([0], self.isTakingVideo.astype(numpy.int8), [0]))
+        edges = numpy.diff(video)
+        starts = numpy.flatnonzero(edges == 1)
+        stops = numpy.flatnonzero(edges == -1)
+        return list(zip(starts.tolist(), stops.tolist()))
+
+
+def resolve_log_columns(header):
+    # Return a dictionary of attribute name: column index for the columns found in the log header.
+    # Header names are matched ignoring case and surrounding white space.
+
+    headerNames = [name.strip().lower() for name in header]
+    columnIndex = {}
+    for name, headerName, legacyIndex, numpyType, required in logColumns:
+        if headerName.lower() in headerNames:
+            columnIndex[name] = headerNames.index(headerName.lower())
+        elif legacyIndex is not None and legacyIndex < len(headerNames):
+            columnIndex[name] = legacyIndex
+        elif required:
+            raise ValueError('DJI log column ' + headerName + ' was not found in the log header.')
+    if 'datetime' not in columnIndex and 'timestamp' not in columnIndex:
+        raise ValueError('DJI log has neither a datetime(utc) nor a timestamp column.')
+    return columnIndex
+
+
+def parse_log_datetimes(dateTimeStrings):
+    # Convert log date/time strings e.g. 2017/05/02 16:03:28.123 to numpy datetime64[ms] values.
+    dateTimeStrings = numpy.char.replace(numpy.char.strip(dateTimeStrings), '/', '-')
+    return dateTimeStrings.astype('datetime64[ms]')
+
+
+def log_columns_from_rows(path, rows, elapsedOrigin=None):
+    # Build a FlightLog from the structured array returned by numpy.loadtxt.
+    # elapsedOrigin is the first timestamp (ms) of the log, used when the log has no time(millisecond) column and the
+    # rows are not the start of the log.
+
+    names = rows.dtype.names
+    if 'timestamp' in names:
+        timestamp = rows['timestamp'].astype(numpy.int64)
+        if 'datetime' in names:
+            dateTime = parse_log_datetimes(rows['datetime'])
+        else:
+            dateTime = timestamp.astype('datetime64[ms]')
+    else:
+        dateTime = parse_log_datetimes(rows['datetime'])
+        timestamp = dateTime.astype(numpy.int64)
+
+    if 'elapsed' in names:
+        elapsed = rows['elapsed'].astype(numpy.int64)
+    else:
+        if elapsedOrigin is None:
+            elapsedOrigin = timestamp[0] if len(timestamp) else 0
+        elapsed = timestamp - elapsedOrigin
+
+    dateTimeLocal = parse_log_datetimes(rows['datetimeLocal']) if 'datetimeLocal' in names else None
+    isTakingVideo = rows['isTakingVideo'].astype(bool) if 'isTakingVideo' in names else None
+    isTakingPhoto = rows['isTakingPhoto'].astype(bool) if 'isTakingPhoto' in names else None
+
+    return FlightLog(path, rows['lat'].astype(numpy.float64), rows['lon'].astype(numpy.float64),
+                     rows['alt'].astype(numpy.float64) * feetToMeters, elapsed, timestamp, dateTime, dateTimeLocal,
+                     isTakingVideo, isTakingPhoto)
+
+
+def log_row_dtype(columnIndex):
+    # Return the usecols tuple and structured dtype used by numpy.loadtxt to parse the resolved columns
+    usecols = []
+    dtype = []
+    for name, headerName, legacyIndex, numpyType, required in logColumns:
+        if name in columnIndex:
+            usecols.append(columnIndex[name])
+            dtype.append((name, numpyType))
+    return tuple(usecols), numpy.dtype(dtype)
+
+
+def read_dji_log(logPath):
+    # Parse a DJI _v2.csv flight log in a single pass and return a FlightLog of typed column arrays.
+
+    with io.open(logPath, 'r', newline=None) as log:
+        header = next(log).split(',')
+        columnIndex = resolve_log_columns(header)
+        usecols, dtype = log_row_dtype(columnIndex)
+        rows = numpy.loadtxt(log, delimiter=',', usecols=usecols, dtype=dtype, ndmin=1)
+
+    return log_columns_from_rows(logPath, rows)
+
+
+
+def concatenate_logs(flightLogs):
+    # Return a FlightLog of the rows of the given FlightLogs (all read from the same log) in order
+    flightLogs = list(flightLogs)
+    if len(flightLogs) == 1:
+        return flightLogs[0]
+    columns = [[getattr(flightLog, name) for flightLog in flightLogs] for name in FlightLog.__slots__[1:]]
+    return FlightLog(flightLogs[0].path, *[None if column[0] is None else numpy.concatenate(column)
+                                           for column in columns])
+
+
+def iter_dji_log_chunks(logPath, chunkRows=defaultChunkRows):
+    #
+    # Parse a DJI _v2.csv flight log in chunks of at most chunkRows rows and yield a FlightLog for each chunk.
+    # Only one chunk is held in memory at a time.
+    #
+    with io.open(logPath, 'r', newline=None) as log:
+        header = next(log).split(',')
+        columnIndex = resolve_log_columns(header)
+        usecols, dtype = log_row_dtype(columnIndex)
+        elapsedOrigin = None
+        while True:
+            lines = list(itertools.islice(log, chunkRows))
+            if len(lines) == 0:
+                break
+            rows = numpy.loadtxt(lines, delimiter=',', usecols=usecols, dtype=dtype, ndmin=1)
+            if len(rows) == 0:
+                continue
+            chunk = log_columns_from_rows(logPath, rows, elapsedOrigin)
+            elapsedOrigin = chunk.timestamp[0] - chunk.elapsed[0]
+            yield chunk
+
+
+def iter_video_segments(logPath, chunkRows=defaultChunkRows):
+    #
+    # Stream the log and yield a FlightLog for each isTakingVideo segment as soon as the segment is complete.
+    #
+    # Each FlightLog holds the video rows of the segment preceded by the log row just before the segment (when there
+    # is one) so that positions at times just before the first video row can be interpolated as they are when the
+    # whole log is read. FlightLog.video_segments() of a yielded FlightLog returns the single segment.
+    #
+    pending = []        # Rows of the segment that is still being recorded at the end of the previous chunk
+    leadRow = None      # Last row of the previous chunk
+    for chunk in iter_dji_log_chunks(logPath, chunkRows):
+        if chunk.isTakingVideo is None:
+            return
+        if len(pending) > 0 and not chunk.isTakingVideo[0]:
+            # The segment ended on the last row of the previous chunk
+            yield concatenate_logs(pending)
+            pending = []
+        for start, stop in chunk.video_segments():
+            if start == 0 and len(pending) > 0:
+                pending.append(chunk[0:stop])
+            else:
+                if start > 0:
+                    pending = [chunk[start - 1:stop]]
+                elif leadRow is not None:
+                    pending = [leadRow, chunk[0:stop]]
+                else:
+                    pending = [chunk[0:stop]]
+            if stop < len(chunk):
+                yield concatenate_logs(pending)
+                pending = []
+        leadRow = chunk[len(chunk) - 1:]
+    if len(pending) > 0:
+        yield concatenate_logs(pending)
+
+
+def read_tail_lines(log, lineCount, blockSize=tailBlockSize):
+    # Return up to lineCount of the last lines of a file opened in binary mode, reading the file backwards in blocks
+    log.seek(0, os.SEEK_END)
+    position = log.tell()
+    tail = b''
+    while position > 0 and tail.count(b'\n') <= lineCount:
+        readSize = min(blockSize, position)
+        position -= readSize
+        log.seek(position)
+        tail = log.read(readSize) + tail
+    lines = tail.splitlines()
+    if position > 0:
+        lines = lines[1:]   # The first line of the tail may be incomplete
+    return lines[-lineCount:]
+
+
+def read_dji_log_ends(logPath, tailLines=10):
+    #
+    # Return a FlightLog of the first row and the last complete row of a DJI log without reading the rest of the log.
+    # The last lines of a log that was cut short (e.g. the battery was removed) may be incomplete so the last line that
+    # parses is used.
+    #
+    with io.open(logPath, 'r', newline=None) as log:
+        header = next(log).split(',')
+        firstLine = next(log)
+    columnIndex = resolve_log_columns(header)
+    usecols, dtype = log_row_dtype(columnIndex)
+
+    with io.open(logPath, 'rb') as log:
+        lastLines = read_tail_lines(log, tailLines)
+
+    rows = numpy.loadtxt([firstLine], delimiter=',', usecols=usecols, dtype=dtype, ndmin=1)
+    for line in reversed(lastLines):
+        try:
+            lastRow = numpy.loadtxt([line.decode('utf-8', 'replace')], delimiter=',', usecols=usecols, dtype=dtype,
+                                    ndmin=1)
+        except (ValueError, IndexError):
+            continue
+        if len(lastRow) == 1:
+            rows = numpy.concatenate((rows, lastRow))
+            break
+    return log_columns_from_rows(logPath, rows)
@@ -0,0 +1,88 @@
+#
+# Version 0.1 October 2018
+#
+# This is a module that contains the EXIF and checksum harvest stage used to read the metadata of the images of a flight.
+#
+# The Micasense programs read the EXIF data and the MD5 checksum of every image one image at a time, sub-folder by
+# sub-folder, so a flight of 5 x 2,000 TIFFs kept a single core busy. harvest_images fans the images of all sub-folders
+# of a data set out to a concurrent.futures process pool and returns the results in the order of the image list as they
+# are completed, so the metadata list is built in the same order as before:
+#
+#   for imagePath, (exifData, md5sum) in zip(imagePaths, harvest_images(imagePaths)):
+#
+# exifData is the tuple returned by imagepreprocess.get_image_exif_data. Each image is read once for both its EXIF data
+# and its checksum (see image_ingest.py). The checksum is that of the image contents, so it does not change when the
+# image is renamed afterwards.
+#
+# The pool size defaults to the number of cores, limited to workersPerDisk workers per disk when the number of disks the
+# images are read from is given. The workers are forked (POSIX) so the calling script is not imported again by each
+# worker; where fork is not available the images are harvested by a thread pool.
+#
+
+from __future__ import print_function
+from __future__ import division
+
+import os
+import multiprocessing
+
+from imagepreprocess import get_image_exif_data
+from image_ingest import ingest_image
+
+try:
+    import concurrent.futures as futures
+except ImportError:
+    futures = None
+
+workersPerDisk = 8
+chunkSize = 16
+
+
+def default_workers(disks=None):
+    # Return the pool size: one worker per core, at most workersPerDisk workers per disk when disks is given
+    workers = multiprocessing.cpu_count()
+    if disks is not None:
+        workers = min(workers, workersPerDisk * max(int(disks), 1))
+    return max(workers, 1)
+
+
+def harvest_image(imagePath):
+    # Return the EXIF data (see imagepreprocess.get_image_exif_data) and the MD5 checksum of an image
+    imageRecord = ingest_image(imagePath)
+    return get_image_exif_data(imagePath, imageRecord.tags), imageRecord.md5
+
+
+def _executor(workers):
+    if os.name == 'posix':
+        try:
+            context = multiprocessing.get_context('fork')
+            return futures.ProcessPoolExecutor(max_workers=workers, mp_context=context)
+        except (AttributeError, TypeError, ValueError):
+            pass
+    return futures.ThreadPoolExecutor(max_workers=workers)
+
+
+def harvest_images(imagePaths, workers=None, disks=None):
+    #
+    # Yield (EXIF data, MD5 checksum) of each image of imagePaths, in the order of imagePaths. The images are harvested
+    # by workers workers (default_workers(disks) when workers is None) and the results are yielded as soon as the
+    # results of all preceding images are available.
+    #
+    imagePaths = list(imagePaths)
+    workers = workers if workers is not None else default_workers(disks)
+    workers = min(workers, len(imagePaths))
+    if workers <= 1:
+        for imagePath in imagePaths:
+            yield harvest_image(imagePath)
+        return
+    if futures is None:
+        # Python 2 without the futures backport
+        pool = multiprocessing.Pool(workers)
+        try:
+            for result in pool.imap(harvest_image, imagePaths, chunkSize):
+                yield result
+        finally:
+            pool.terminate()
+        return
+    with _executor(workers) as executor:
+        for result in executor.map(harvest_image, imagePaths, chunksize=chunkSize):
+            yield result
@@ -0,0 +1,163 @@
+#
+# Version 0.1 October 2018
+#
+# This is a module that contains the EXIF reader used to get the GPS position and date/time of an image.
+#
+# exifread.process_file parses every IFD of an image including the MakerNote and the thumbnail and returns each value
+# as a printable object, which the programs then parsed back from strings such as [39, 6, 1234/100]. read_exif walks
+# only the TIFF IFD0, EXIF and GPS IFDs of a TIFF (Micasense, DNG, CR2) or JPEG (EXIF APP1 segment) image, reads only
+# the entries of the tags in exifTags with small seeks and reads, and returns typed values:
+#
+#   ASCII           str without the trailing NUL
+#   BYTE/SHORT/LONG int (tuple of int when the tag has more than one value)
+#   RATIONAL        float (tuple of float) e.g. GPSLatitude (39.0, 6.0, 12.34)
+#
+# The time taken does not depend on the size of the image or on where the image data is stored in the file.
+#
+
+from __future__ import print_function
+from __future__ import division
+
+import struct
+
+# Tags read from each IFD: tag number: name
+
+ifd0Tags = {0x010F: 'Make', 0x0110: 'Model', 0x0132: 'DateTime'}
+exifIfdTags = {0x9003: 'DateTimeOriginal', 0x9291: 'SubSecTimeOriginal', 0xA431: 'BodySerialNumber'}
+gpsIfdTags = {0x0000: 'GPSVersionID', 0x0001: 'GPSLatitudeRef', 0x0002: 'GPSLatitude', 0x0003: 'GPSLongitudeRef',
+              0x0004: 'GPSLongitude', 0x0005: 'GPSAltitudeRef', 0x0006: 'GPSAltitude', 0x0007: 'GPSTimeStamp',
+              0x0009: 'GPSStatus', 0x0012: 'GPSMapDatum', 0x001D: 'GPSDate'}
+
+exifIfdPointer = 0x8769
+gpsIfdPointer = 0x8825
+
+exifTags = dict(list(ifd0Tags.items()) + list(exifIfdTags.items()) + list(gpsIfdTags.items()))
+
+# TIFF field types: type: (struct format, size of one value)
+
+tiffTypes = {1: ('B', 1), 2: ('s', 1), 3: ('H', 2), 4: ('L', 4), 5: ('LL', 8), 6: ('b', 1), 7: ('B', 1),
+             8: ('h', 2), 9: ('l', 4), 10: ('ll', 8), 11: ('f', 4), 12: ('d', 8)}
+
+maxValueSize = 4096
+
+
+def read_at(image, offset, size):
+    image.seek(offset)
+    data = image.read(size)
+    if len(data) < size:
+        raise ValueError('EXIF data is truncated')
+    return data
+
+
+def tiff_base(image):
+    # Return the offset of the TIFF header of a TIFF or JPEG image or None if the image has neither
+    start = read_at(image, 0, 4)
+    if start[0:4] in (b'II*\x00', b'MM\x00*'):
+        return 0
+    if start[0:2] != b'\xff\xd8':
+        return None
+    offset = 2
+    while True:
+        marker, length = struct.unpack('>2sH', read_at(image, offset, 4))
+        if marker[0:1] != b'\xff' or marker == b'\xff\xda':
+            return None
+        if marker == b'\xff\xe1' and read_at(image, offset + 4, 6) == b'Exif\x00\x00':
+            return offset + 10
+        offset += 2 + length
+
+
+def decode_value(order, fieldType, count, data):
+    fmt, size = tiffTypes[fieldType]
+    if fieldType == 2:
+        return data[:count].split(b'\x00')[0].decode('utf-8', 'replace').strip()
+    if fieldType == 7 and count > 4:
+        return data[:count]
+    values = struct.unpack(order + fmt * count, data[:size * count])
+    if fieldType in (5, 10):
+        values = tuple(float(numerator) / denominator if denominator != 0 else 0.0
+                       for numerator, denominator in zip(values[0::2], values[1::2]))
+    return values[0] if count == 1 else tuple(values)
+
+
+def read_ifd(image, base, order, offset, tagNames, tags):
+    #
+    # Add the values of the tags of tagNames found in the IFD at offset to the tags dictionary and return the offsets
+    # of the EXIF and GPS IFDs pointed to by the IFD (or None).
+    #
+    entryCount = struct.unpack(order + 'H', read_at(image, base + offset, 2))[0]
+    entries = read_at(image, base + offset + 2, 12 * entryCount)
+    pointers = {}
+    for index in range(entryCount):
+        entry = entries[12 * index:12 * index + 12]
+        tag, fieldType, count = struct.unpack(order + 'HHL', entry[0:8])
+        if tag in (exifIfdPointer, gpsIfdPointer):
+            pointers[tag] = struct.unpack(order + 'L', entry[8:12])[0]
+            continue
+        if tag not in tagNames or fieldType not in tiffTypes:
+            continue
+        size = tiffTypes[fieldType][1] * count
+        if size > maxValueSize:
+            continue
+        if size <= 4:
+            data = entry[8:8 + size]
+        else:
+            data = read_at(image, base + struct.unpack(order + 'L', entry[8:12])[0], size)
+        tags[tagNames[tag]] = decode_value(order, fieldType, count, data)
+    return pointers.get(exifIfdPointer), pointers.get(gpsIfdPointer)
+
+
+def read_exif_file(image):
+    # Return the dictionary of tag name: value of the tags of exifTags found in an open (binary) image file
+    tags = {}
+    base = tiff_base(image)
+    if base is None:
+        return tags
+    byteOrder = read_at(image, base, 2)
+    order = '<' if byteOrder == b'II' else '>'
+    ifd0Offset = struct.unpack(order + 'L', read_at(image, base + 4, 4))[0]
+    exifOffset, gpsOffset = read_ifd(image, base, order, ifd0Offset, ifd0Tags, tags)
+    if exifOffset is not None:
+        read_ifd(image, base, order, exifOffset, exifIfdTags, tags)
+    if gpsOffset is not None:
+        read_ifd(image, base, order, gpsOffset, gpsIfdTags, tags)
+    return tags
+
+
+def read_exif(image):
+    # Return the dictionary of tag name: value of the tags of exifTags found in an image given by its path or as an
+    # open binary file
+    if hasattr(image, 'read'):
+        position = image.tell()
+        try:
+            return read_exif_file(image)
+        finally:
+            image.seek(position)
+    with open(image, 'rb') as imageFile:
+        return read_exif_file(imageFile)
+
+
+def gps_degrees(tags, coordinate):
+    # Return the signed decimal degrees of GPSLatitude or GPSLongitude, or None if the tag is missing
+    if coordinate not in tags or coordinate + 'Ref' not in tags:
+        return None
+    values = tags[coordinate] if isinstance(tags[coordinate], tuple) else (tags[coordinate],)
+    degrees = sum(value / 60.0 ** index for index, value in enumerate(values))
+    return -degrees if tags[coordinate + 'Ref'] in ('S', 'W') else degrees
+
+
+def gps_date_time(tags):
+    # Return the GPS date (yyyy/mm/dd) and time (hh:mm:ss) strings or None when the image has no GPS date. Fractional
+    # seconds are truncated (as the former Python 2 integer division did) since the time is used in flight IDs and
+    # image file names.
+    if 'GPSDate' not in tags or 'GPSTimeStamp' not in tags:
+        return None
+    hours, minutes, seconds = tags['GPSTimeStamp']
+    return tags['GPSDate'].replace(':', '/'), '%02d:%02d:%02d' % (int(hours), int(minutes), int(seconds))
+
+
+def exif_date_time(tags, tag='DateTimeOriginal'):
+    # Return the date (yyyy/mm/dd) and time (hh:mm:ss) strings of an EXIF date/time tag or None if it is missing
+    if tag not in tags or ' ' not in tags[tag]:
+        return None
+    dateStr, timeStr = tags[tag].split(' ')[0:2]
+    return dateStr.replace(':', '/'), timeStr
@@ -0,0 +1,204 @@
+#
+# Version 0.1 October 2018
+#
+# This is a module that contains the exiftool service shared by the HTP UAS programs.
+#
+# Starting exiftool starts a perl interpreter, which takes 100-300 ms, so the programs no longer run one exiftool per
+# image (or per tag). Each worker (thread or process) keeps a single exiftool running with -stay_open and sends it
+# commands through its standard input:
+#
+#   1. get_exiftool() returns the ExifTool of the calling thread, started on first use and closed at exit. A process
+#      forked from a parent that already had one starts its own.
+#   2. Reads and writes of many files are queued in batches (batchSize files per command), so one command replaces
+#      hundreds of exiftool runs.
+#   3. Every command ends with a numbered -execute so its output (and its messages on stderr) can be matched to it.
+#      stderr is drained by a reader thread while stdout is read, so a command with many error messages cannot fill
+#      the stderr pipe and block exiftool before it writes the end of its output.
+#
+# get_metadata returns the tags of a file in the same form as pyexiftool (-G -n -j), so an ExifTool can be passed to
+# micasense.metadata.Metadata as exiftool_obj.
+#
+
+from __future__ import print_function
+from __future__ import division
+
+import os
+import json
+import atexit
+import threading
+import subprocess
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+try:
+    from shutil import which
+except ImportError:
+    from distutils.spawn import find_executable as which
+
+# exiftool locations tried when exiftool is not on the PATH
+
+defaultExecutables = ['/usr/local/bin/exiftool', '/usr/bin/exiftool', 'D:/ExifTool/exiftool.exe']
+
+batchSize = 500
+
+_local = threading.local()
+_services = []
+_servicesLock = threading.Lock()
+
+
+def find_exiftool():
+    # Return the path of the exiftool executable
+    executable = which('exiftool')
+    if executable is not None:
+        return executable
+    for executable in defaultExecutables:
+        if os.path.exists(executable):
+            return executable
+    raise IOError('exiftool was not found on the PATH')
+
+
+def batches(items, size=batchSize):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+class ExifToolError(Exception):
+    pass
+
+
+class ExifTool(object):
+    '''A single exiftool process kept running with -stay_open that executes commands sent to its standard input.'''
+
+    def __init__(self, executable=None):
+        self.executable = executable if executable is not None else find_exiftool()
+        self.process = None
+        self.pid = None
+        self.commandCount = 0
+        self.lock = threading.Lock()
+        self.errorLines = None
+
+    def start(self):
+        if self.process is not None and self.pid == os.getpid():
+            return
+        self.process = subprocess.Popen([self.executable, '-stay_open', 'True', '-@', '-', '-common_args',
+                                         '-charset', 'filename=utf8'],
+                                        stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        self.pid = os.getpid()
+        self.errorLines = queue.Queue()
+        reader = threading.Thread(target=_drain, args=(self.process.stderr, self.errorLines))
+        reader.daemon = True
+        reader.start()
+
+    def close(self):
+        # Stop the exiftool process
+        if self.process is None or self.pid != os.getpid():
+            return
+        try:
+            self.process.stdin.write(b'-stay_open\nFalse\n')
+            self.process.stdin.close()
+            self.process.stdout.read()
+            self.process.wait()
+        except (IOError, OSError, ValueError):
+            self.process.kill()
+        self.process = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        self.close()
+
+    def _read_until(self, readline, sentinel):
+        # Return the lines read with readline up to the sentinel line. readline returns an empty line (or None) at end.
+        lines = []
+        while True:
+            line = readline()
+            if not line:
+                raise ExifToolError('exiftool stopped unexpectedly')
+            if line.rstrip(b'\r\n') == sentinel:
+                return b''.join(lines).decode('utf-8', 'replace')
+            lines.append(line)
+
+    def execute_with_errors(self, *args):
+        # Execute one exiftool command (a list of arguments, one per line) and return its output and error messages
+        with self.lock:
+            self.start()
+            self.commandCount += 1
+            sentinel = ('{ready%d}' % self.commandCount).encode('ascii')
+            arguments = [arg if isinstance(arg, bytes) else str(arg).encode('utf-8') for arg in args]
+            command = b'\n'.join(arguments + [b'-echo4', sentinel, ('-execute%d' % self.commandCount).encode('ascii')])
+            self.process.stdin.write(command + b'\n')
+            self.process.stdin.flush()
+            output = self._read_until(self.process.stdout.readline, sentinel)
+            errors = self._read_until(self.errorLines.get, sentinel)
+            return output, errors
+
+    def execute(self, *args):
+        # Execute one exiftool command and return its output. Error messages are printed.
+        output, errors = self.execute_with_errors(*args)
+        if errors.strip():
+            print('*** Warning*** exiftool:', errors.strip())
+        return output
+
+    def get_tags(self, files, tags=None, numeric=True, groups=False):
+        #
+        # Return a list of dictionaries (one per file, in the order of files) of the tags of each file. All tags are
+        # returned when tags is None. Values are numeric (-n) unless numeric is False; tag names are prefixed with
+        # their group (e.g. EXIF:DateTimeOriginal) when groups is True. Files are read batchSize files per command.
+        #
+        options = ['-j'] + (['-n'] if numeric else []) + (['-G'] if groups else [])
+        options += ['-' + tag for tag in tags] if tags is not None else []
+        results = []
+        for fileBatch in batches(list(files)):
+            output = self.execute(*(options + fileBatch))
+            records = json.loads(output) if output.strip() else []
+            bySource = dict((os.path.normpath(record.get('SourceFile', '')), record) for record in records)
+            results.extend(bySource.get(os.path.normpath(fileName), {}) for fileName in fileBatch)
+        return results
+
+    def get_tag(self, tag, fileName, numeric=True):
+        # Return the value of one tag of a file or None
+        record = self.get_tags([fileName], [tag], numeric)[0]
+        tagName = tag.split(':')[-1]
+        return record.get(tagName)
+
+    def get_metadata(self, fileName):
+        # Return all tags of a file keyed by group:tag, as pyexiftool's get_metadata
+        return self.get_tags([fileName], groups=True)[0]
+
+    def copy_tags(self, sourceFile, targetFile, tags=None):
+        # Copy tags (all writable tags when tags is None) from sourceFile to targetFile without keeping a copy of the
+        # original target file
+        arguments = ['-tagsFromFile', sourceFile] + (['-' + tag for tag in tags] if tags is not None else [])
+        return self.execute(*(arguments + ['-overwrite_original', targetFile]))
+
+
+def _drain(stream, lines):
+    # Queue the lines of stream (the stderr of an exiftool process) until it is closed, then queue None
+    for line in iter(stream.readline, b''):
+        lines.put(line)
+    lines.put(None)
+
+
+def _close_services():
+    for service in _services:
+        service.close()
+
+
+atexit.register(_close_services)
+
+
+def get_exiftool():
+    # Return the ExifTool of the calling thread (and process), starting it on first use
+    service = getattr(_local, 'service', None)
+    if service is None or service.pid not in (None, os.getpid()):
+        service = ExifTool()
+        with _servicesLock:
+            _services.append(service)
+        _local.service = service
+    service.start()
+    return service
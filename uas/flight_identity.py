@@ -0,0 +1,95 @@
+#
+# Version 0.1 October 2018
+#
+# This is a module that contains the flight identity functions shared by the HTP UAS programs.
+#
+# A flight is identified by the UTC date and time of the first and last records of its DJI log e.g.
+#
+#   uas_20180502_160328_20180502_160827
+#
+# Only the header, the first data row and the last complete row of the log are read (see dji_log.read_dji_log_ends) so
+# the time taken does not depend on the size of the log. read_flight_identities does this for a list of logs in
+# parallel and find_flight_logs lists the DJI logs of a staging tree.
+#
+# The module can also be run to list the flight ID of every log in a staging tree:
+#
+#   python flight_identity.py -d /data/uav_staging/
+#
+
+from __future__ import print_function
+from __future__ import division
+
+import os
+import argparse
+import collections
+from multiprocessing.pool import ThreadPool
+
+from dji_log import read_dji_log_ends
+
+FlightIdentity = collections.namedtuple('FlightIdentity', ['flightId', 'startDateTime', 'endDateTime', 'logPath'])
+
+defaultThreads = 8
+
+
+def format_flight_id(startDateTime, endDateTime):
+    # Return the flight ID of a flight that started and ended at the given UTC datetimes
+    return 'uas_' + startDateTime.strftime('%Y%m%d_%H%M%S') + '_' + endDateTime.strftime('%Y%m%d_%H%M%S')
+
+
+def read_flight_identity(logPath):
+    # Return the FlightIdentity of a DJI log from its first and last complete records
+    logEnds = read_dji_log_ends(logPath)
+    startDateTime = logEnds.datetime[0].item()
+    endDateTime = logEnds.datetime[-1].item()
+    return FlightIdentity(format_flight_id(startDateTime, endDateTime), startDateTime, endDateTime, logPath)
+
+
+def flight_id_fields(flightIdentity):
+    # Return the flight ID and the start/end UTC dates (yyyymmdd) and times (hhmmss) as strings
+    return (flightIdentity.flightId,
+            flightIdentity.startDateTime.strftime('%Y%m%d'), flightIdentity.startDateTime.strftime('%H%M%S'),
+            flightIdentity.endDateTime.strftime('%Y%m%d'), flightIdentity.endDateTime.strftime('%H%M%S'))
+
+
+def find_flight_logs(stagingPath, suffix='.csv'):
+    # Return the sorted list of the DJI log files found anywhere below stagingPath. Log cache folders are skipped.
+    logPaths = []
+    for folder, subFolders, fileNames in os.walk(stagingPath):
+        subFolders[:] = [name for name in subFolders if not name.endswith('.cache')]
+        logPaths.extend(os.path.join(folder, name) for name in fileNames if name.lower().endswith(suffix))
+    return sorted(logPaths)
+
+
+def _read_flight_identity_or_none(logPath):
+    try:
+        return read_flight_identity(logPath)
+    except Exception as e:
+        print('*** Warning*** Unable to read flight identity from', logPath, e)
+        return None
+
+
+def read_flight_identities(logPaths, threads=defaultThreads):
+    #
+    # Return the FlightIdentity of each log in logPaths, in the same order. The logs are read in parallel.
+    # None is returned for a log that can not be read (e.g. a CSV file that is not a DJI log).
+    #
+    logPaths = list(logPaths)
+    if len(logPaths) == 0:
+        return []
+    pool = ThreadPool(min(threads, len(logPaths)))
+    try:
+        return pool.map(_read_flight_identity_or_none, logPaths)
+    finally:
+        pool.close()
+        pool.join()
+
+
+if __name__ == '__main__':
+    cmdline = argparse.ArgumentParser()
+    cmdline.add_argument('-d', '--dir', help='The staging directory to search for DJI log files.')
+    cmdline.add_argument('-t', '--threads', type=int, default=defaultThreads, help='The number of logs read at once.')
+    args = cmdline.parse_args()
+
+    for flightIdentity in read_flight_identities(find_flight_logs(args.dir), args.threads):
+        if flightIdentity is not None:
+            print(flightIdentity.flightId + ',' + flightIdentity.logPath)
@@ -0,0 +1,164 @@
+#
+# Version 0.1 October 2018
+#
+# This is a module that contains the on-disk cache of parsed DJI flight logs and interpolated GPS tracks.
+#
+# The parsed log columns (see dji_log.py) and the interpolated track (see gps_interpolation.py) are stored as .npy
+# files in a sidecar folder next to the log file, e.g.
+#
+#   2018-05-02_16-03-28_v2.csv
+#   2018-05-02_16-03-28_v2.csv.cache/
+#       key.json            Log path, size, mtime and md5 content hash the cache was built from
+#       log_<column>.npy    Parsed log columns
+#       track_<rate>hz_<column>.npy Interpolated track columns
+#
+# The .npy files are opened memory-mapped so a cached log is available without parsing. The cache is rebuilt
+# automatically when the log file changes: the size and mtime are checked first and the content hash is only computed
+# when the size matches but the mtime does not (e.g. a copied log).
+#
+# The track is cached without latitude/longitude offsets; the offsets are applied when the track is loaded so reruns
+# that only change --lonoffset/--latoffset still use the cache.
+#
+
+from __future__ import print_function
+from __future__ import division
+
+import os
+import json
+import hashlib
+import numpy
+
+from dji_log import FlightLog, read_dji_log, iter_video_segments
+from gps_track import GpsTrack
+from gps_interpolation import interpolate_segments
+
+cacheVersion = 1
+cacheSuffix = '.cache'
+
+logCacheColumns = ('lat', 'lon', 'alt', 'elapsed', 'timestamp', 'datetime', 'datetimeLocal', 'isTakingVideo',
+                   'isTakingPhoto')
+trackCacheColumns = ('timestamps', 'lat', 'lon', 'alt', 'segments')
+
+
+def log_content_hash(logPath, blocksize=1048576):
+    # Compute the MD5 checksum of the log file
+    hasher = hashlib.md5()
+    with open(logPath, 'rb') as log:
+        buf = log.read(blocksize)
+        while len(buf) > 0:
+            hasher.update(buf)
+            buf = log.read(blocksize)
+    return hasher.hexdigest()
+
+
+def cache_folder(logPath):
+    return os.path.abspath(logPath) + cacheSuffix
+
+
+def read_cache_key(folder):
+    try:
+        with open(os.path.join(folder, 'key.json'), 'r') as keyFile:
+            return json.load(keyFile)
+    except (IOError, OSError, ValueError):
+        return None
+
+
+def write_cache_key(folder, key):
+    with open(os.path.join(folder, 'key.json'), 'w') as keyFile:
+        json.dump(key, keyFile, indent=1, sort_keys=True)
+
+
+def clear_cache(folder):
+    for name in os.listdir(folder):
+        if name.endswith('.npy') or name == 'key.json':
+            os.remove(os.path.join(folder, name))
+
+
+def validate_cache(logPath):
+    #
+    # Return the cache folder for the log after making sure that it matches the current log file contents.
+    # A stale cache is emptied. Returns None if the cache folder can not be created (e.g. read-only staging area).
+    #
+    folder = cache_folder(logPath)
+    logStat = os.stat(logPath)
+    try:
+        if not os.path.isdir(folder):
+            os.mkdir(folder)
+        key = read_cache_key(folder)
+        if key is not None and key.get('version') == cacheVersion and key.get('size') == logStat.st_size:
+            if key.get('mtime') == logStat.st_mtime:
+                return folder
+            if key.get('md5') == log_content_hash(logPath):
+                key['mtime'] = logStat.st_mtime
+                write_cache_key(folder, key)
+                return folder
+        clear_cache(folder)
+        write_cache_key(folder, {'version': cacheVersion, 'path': os.path.abspath(logPath), 'size': logStat.st_size,
+                                 'mtime': logStat.st_mtime, 'md5': log_content_hash(logPath)})
+    except (IOError, OSError) as e:
+        print('*** Warning*** Unable to use flight log cache', folder, e)
+        return None
+    return folder
+
+
+def save_columns(folder, prefix, columns):
+    # Save the columns and then record them in the cache key so that a partially written set is never loaded
+    try:
+        savedNames = []
+        for name, column in columns:
+            if column is not None:
+                numpy.save(os.path.join(folder, prefix + name + '.npy'), column)
+                savedNames.append(name)
+        key = read_cache_key(folder)
+        key.setdefault('columns', {})[prefix] = savedNames
+        write_cache_key(folder, key)
+    except (IOError, OSError) as e:
+        print('*** Warning*** Unable to write flight log cache', folder, e)
+
+
+def load_columns(folder, prefix, names):
+    # Return a dictionary of memory-mapped columns or None if the columns have not been cached.
+    # Optional columns that were not present in the log are returned as None.
+    key = read_cache_key(folder)
+    if key is None or prefix not in key.get('columns', {}):
+        return None
+    savedNames = key['columns'][prefix]
+    columns = {}
+    for name in names:
+        if name in savedNames:
+            columns[name] = numpy.load(os.path.join(folder, prefix + name + '.npy'), mmap_mode='r')
+        else:
+            columns[name] = None
+    return columns
+
+
+def load_flight_log(logPath):
+    # Return the parsed FlightLog columns of the log, parsing the log only when it has not been cached.
+
+    folder = validate_cache(logPath)
+    if folder is not None:
+        columns = load_columns(folder, 'log_', logCacheColumns)
+        if columns is not None:
+            return FlightLog(logPath, *[columns[name] for name in logCacheColumns])
+
+    flightLogColumns = read_dji_log(logPath)
+    if folder is not None:
+        save_columns(folder, 'log_', [(name, getattr(flightLogColumns, name)) for name in logCacheColumns])
+    return flightLogColumns
+
+
+def load_gps_track(logPath, rate=100, latOffset=0.0, lonOffset=0.0):
+    # Return the GpsTrack interpolated at the given rate (Hz), building and caching it when it has not been cached.
+    # The track is built from the streamed video segments so the whole log is never loaded to build it.
+
+    prefix = 'track_' + str(rate) + 'hz_'
+    folder = validate_cache(logPath)
+    columns = load_columns(folder, prefix, trackCacheColumns) if folder is not None else None
+    if columns is None:
+        gpsTrack = interpolate_segments(iter_video_segments(logPath), rate)
+        if folder is not None:
+            save_columns(folder, prefix, [(name, getattr(gpsTrack, name)) for name in trackCacheColumns])
+        columns = dict((name, getattr(gpsTrack, name)) for name in trackCacheColumns)
+
+    return GpsTrack(columns['timestamps'], columns['lat'] + float(latOffset), columns['lon'] + float(lonOffset),
+                    columns['alt'], columns['segments'])
@@ -0,0 +1,162 @@
+#
+# Version 0.1 October 2018
+#
+# This is a module that contains the frame extraction stage used to turn range videos into image sets.
+#
+# Each range video is decoded once (cv2.VideoCapture) and only the frames spaced a given ground distance apart are kept,
+# instead of writing every frame and thinning the image set later. The frames of a range are assumed to be taken at
+# equal time intervals over the range flight duration, as in frame_positions.calculate_frame_times. The position of
+# every frame is interpolated from the GpsTrack, projected to UTM and the first frame of each spacing interval along the
+# flight path is kept; frames that are not kept are grabbed but not retrieved.
+#
+# The kept frames are written as JPEG files together with a frame index (frames.csv) in the image set folder:
+#
+#   file,frame_index,frame_time,latitude,longitude,altitude,plot_id
+#
+# create_uav_dji_x_metadata_file_v07.2.py uses the frame times of the index instead of assuming the images are equally
+# spaced in time. The module can also be run to extract the frames of the range videos of a flight:
+#
+#   python frame_extractor.py -d /data/uav_staging/flight/ -v /data/uav_staging/flight/DCIM/ -s 1.0 -e 18ASH%
+#
+
+from __future__ import print_function
+from __future__ import division
+
+import os
+import csv
+import glob
+import time
+import argparse
+import datetime
+import numpy
+
+from frame_positions import calculate_frame_times
+from waypoint_rendezvous import project_to_utm
+
+frameIndexFileName = 'frames.csv'
+frameIndexColumns = ['file', 'frame_index', 'frame_time', 'latitude', 'longitude', 'altitude', 'plot_id']
+
+defaultSpacing = 1.0        # meters
+defaultJpegQuality = 95
+
+
+def select_frames_by_distance(latitudes, longitudes, spacing=defaultSpacing):
+    #
+    # Return the indexes of the frames to keep so that consecutive kept frames are about spacing meters apart along the
+    # flight path: the first frame and the first frame of each following spacing interval of the cumulative ground
+    # distance. Frames taken while the UAV hovers are not kept.
+    #
+    if len(latitudes) == 0:
+        return numpy.empty(0, dtype=numpy.int64)
+    positions = project_to_utm(latitudes, longitudes)[0]
+    steps = numpy.hypot(*numpy.diff(positions, axis=0).T)
+    intervals = numpy.floor(numpy.concatenate(([0.0], numpy.cumsum(steps))) / spacing)
+    return numpy.concatenate(([0], numpy.flatnonzero(numpy.diff(intervals) > 0) + 1)).astype(numpy.int64)
+
+
+def read_frame_index(folder):
+    # Return a dictionary of image file name: frame time (ms) of the frame index of an image set folder, or None if the
+    # folder has no frame index
+    framePath = os.path.join(folder, frameIndexFileName)
+    if not os.path.exists(framePath):
+        return None
+    with open(framePath, 'r') as frameFile:
+        return dict((row['file'], float(row['frame_time'])) for row in csv.DictReader(frameFile))
+
+
+def write_frame_index(folder, rows):
+    with open(os.path.join(folder, frameIndexFileName), 'w') as frameFile:
+        writer = csv.writer(frameFile, lineterminator='\n')
+        writer.writerow(frameIndexColumns)
+        writer.writerows(rows)
+
+
+def extract_frames(videoPath, gpsTrack, startTime, duration, outFolder, spacing=defaultSpacing, plotIndex=None,
+                   framePrefix='frame_', jpegQuality=defaultJpegQuality):
+    #
+    # Decode a range video once and write the frames spaced spacing meters apart to outFolder. The video covers
+    # duration ms of the GpsTrack from startTime (ms). plotIndex is a PlotLattice or PlotLocator used to tag each frame
+    # with the plot it was taken over. Returns the frame index rows, which are also written to outFolder/frames.csv.
+    #
+    import cv2
+
+    capture = cv2.VideoCapture(videoPath)
+    if not capture.isOpened():
+        raise IOError('Unable to open video ' + videoPath)
+    try:
+        frameCount = int(capture.get(cv2.CAP_PROP_FRAME_COUNT))
+        frameTimes = calculate_frame_times(startTime, duration, frameCount) if frameCount > 0 else numpy.empty(0)
+        latitudes, longitudes, altitudes = gpsTrack.positions_at(frameTimes)
+        keptFrames = select_frames_by_distance(latitudes, longitudes, spacing)
+        if plotIndex is not None and len(keptFrames) > 0:
+            framePlots = plotIndex.locate(numpy.column_stack((longitudes[keptFrames], latitudes[keptFrames])))
+        else:
+            framePlots = [None] * len(keptFrames)
+
+        if not os.path.isdir(outFolder):
+            os.makedirs(outFolder)
+        rows = []
+        keptIndex = 0
+        for frameIndex in range(frameCount):
+            if keptIndex == len(keptFrames):
+                break
+            if frameIndex != keptFrames[keptIndex]:
+                if not capture.grab():
+                    break
+                continue
+            ok, image = capture.read()
+            if not ok:
+                break
+            fileName = framePrefix + str(frameIndex).zfill(6) + '.jpg'
+            cv2.imwrite(os.path.join(outFolder, fileName), image, [cv2.IMWRITE_JPEG_QUALITY, jpegQuality])
+            plotId = framePlots[keptIndex]
+            rows.append([fileName, frameIndex, '%.3f' % frameTimes[frameIndex], '%.10f' % latitudes[frameIndex],
+                         '%.10f' % longitudes[frameIndex], '%.3f' % altitudes[frameIndex],
+                         plotId if plotId is not None else ''])
+            keptIndex += 1
+    finally:
+        capture.release()
+
+    if len(rows) < len(keptFrames):
+        print('*** Warning*** Only', len(rows), 'of', len(keptFrames), 'frames could be decoded from', videoPath)
+    write_frame_index(outFolder, rows)
+    return rows
+
+
+if __name__ == '__main__':
+    import config
+    from flight_log_cache import load_gps_track
+    from plot_map_cache import load_plot_map
+
+    cmdline = argparse.ArgumentParser()
+    cmdline.add_argument('-d', '--dir', help='Directory path to the flight folder containing the DJI log file')
+    cmdline.add_argument('-v', '--video', help='Directory path to the range video files')
+    cmdline.add_argument('-t', '--type', help='Video file type extension', default='MOV')
+    cmdline.add_argument('-o', '--out', help='Output folder path (default is the flight folder)')
+    cmdline.add_argument('-s', '--spacing', type=float, default=defaultSpacing, help='Ground distance between frames (m)')
+    cmdline.add_argument('-c', '--camera', help='Camera sensor ID used in the image set folder names', default='X5')
+    cmdline.add_argument('-e', '--expt', help='Plot prefix for experiment', default='18ASH%')
+    args = cmdline.parse_args()
+
+    flightPath = os.path.join(args.dir, '')
+    outPath = os.path.join(args.out if args.out is not None else flightPath, '')
+    flightLog = glob.glob(flightPath + '*_v2.csv')[0]
+    gpsTrack = load_gps_track(flightLog)
+    plotLattice = load_plot_map(args.expt, config).lattice()
+
+    # The range videos are matched to the video segments of the log (isTakingVideo runs) in time order
+
+    videoPaths = sorted(glob.glob(os.path.join(args.video, '*.' + args.type)))
+    rangeTracks = gpsTrack.segments_view()
+    if len(videoPaths) != len(rangeTracks):
+        print('*** Warning***', len(videoPaths), 'videos were found for', len(rangeTracks), 'log video segments')
+
+    for rangeNumber, (videoPath, (segment, rangeTrack)) in enumerate(zip(videoPaths, rangeTracks)):
+        startTime = rangeTrack.start_time()
+        rangeDate = datetime.datetime.utcfromtimestamp(startTime / 1000.0).strftime('%Y%m%d')
+        imageSetPath = outPath + 'DJI_' + args.camera + '_C' + str(rangeNumber + 1).zfill(3) + '_' + rangeDate
+        extractStart = time.time()
+        rows = extract_frames(videoPath, gpsTrack, startTime, rangeTrack.end_time() - startTime, imageSetPath,
+                              args.spacing, plotLattice)
+        print(os.path.basename(videoPath), len(rows), 'frames written to', imageSetPath, 'in',
+              round(time.time() - extractStart, 2), 'seconds')
@@ -0,0 +1,55 @@
+#
+# Version 0.1 October 2018
+#
+# This is a module that contains the functions used to assign a position to every frame of an image set in one batch.
+#
+# The frames of a range are assumed to be taken at equal time intervals over the range flight duration. All frame
+# times are computed up front, resolved against the GpsTrack with a single binary search plus linear interpolation, and
+# the WKT position and UTC date/time columns of the metadata file are formatted for the whole image set at once.
+#
+
+from __future__ import print_function
+from __future__ import division
+
+import numpy
+
+
+def calculate_frame_times(rangeStartTime, rangeDuration, imageCount):
+    # Return the time (ms) of each of imageCount frames taken at equal intervals over the range flight duration (ms)
+    frameInterval = float(rangeDuration) / imageCount
+    return rangeStartTime + numpy.arange(imageCount, dtype=numpy.float64) * frameInterval
+
+
+def format_wkt_points(longitudes, latitudes):
+    # Return the WKT representation of each (longitude, latitude) position e.g. POINT (-96.6 39.1)
+    return ['POINT (%.10f %.10f)' % position for position in zip(longitudes.tolist(), latitudes.tolist())]
+
+
+def format_utc_datetimes(times):
+    # Return the UTC date (yyyy/mm/dd) and time (hh:mm:ss.ffffff) strings of each time (ms since the unix epoch)
+    microseconds = numpy.round(numpy.asarray(times, dtype=numpy.float64) * 1000.0).astype(numpy.int64)
+    isoStrings = numpy.datetime_as_string(microseconds.astype('datetime64[us]'), unit='us')
+    dateStrings = numpy.char.replace(isoStrings.astype('U10'), '-', '/')
+    timeStrings = [isoString[11:] for isoString in isoStrings.tolist()]
+    return dateStrings.tolist(), timeStrings
+
+
+def match_frames(gpsTrack, frameTimes):
+    #
+    # Assign a position to every frame time (ms) of an image set.
+    #
+    # Returns a dictionary of columns: frame_time, latitude, longitude, altitude, position (WKT), date_utc and time_utc.
+    # The frame matches are recorded in the GpsTrack match array.
+    #
+    frameTimes = numpy.asarray(frameTimes, dtype=numpy.float64)
+    gpsTrack.record_matches(gpsTrack.sample_indexes(frameTimes), frameTimes)
+    latitudes, longitudes, altitudes = gpsTrack.positions_at(frameTimes)
+    dateStrings, timeStrings = format_utc_datetimes(frameTimes)
+
+    return {'frame_time': frameTimes,
+            'latitude': latitudes,
+            'longitude': longitudes,
+            'altitude': altitudes,
+            'position': format_wkt_points(longitudes, latitudes),
+            'date_utc': dateStrings,
+            'time_utc': timeStrings}
@@ -6,18 +6,22 @@ import csv
 import sys
 import argparse
 import os
-import exifread
-import piexif
+from exif_reader import read_exif, gps_degrees
 import config
 import datetime
 import pytz
 from pytz import timezone
 from tzlocal import get_localzone
-from timezonefinder import TimezoneFinder
+from timezone_service import timezone_at
 import collections
 import bisect
 from math import radians, cos, sin, asin, sqrt
 from PIL import Image
+import numpy
+
+from dji_log import iter_dji_log_chunks
+from exiftool_service import get_exiftool
+from geotag_writer import GeotagRecord, write_geotags, report_geotag_failures
 
 secsInWeek = 604800
 secsInDay = 86400
@@ -124,65 +128,44 @@ def read_flight_log(flightLog):
     gpsEventDict = collections.OrderedDict()  # stores position,altitude,video status, interpolation indicator with time as key
     gpsEventList = []
 
-    with open(flightLog, 'rU') as log:
-
-        header = next(log)  # Skip the header row
-        firstRow = next(log)  # Save the initial data row for comparison with next row
-        rowFields = firstRow.split(',')
-        latitude = float(rowFields[0])
-        longitude = float(rowFields[1])
-        tf = TimezoneFinder()
-        tzone = tf.timezone_at(lng=longitude, lat=latitude)
-
-        for row in log:  # Now start processing the rest of the log
-            rowFields = row.split(',')
-            latitude = float(rowFields[0])
-            longitude = float(rowFields[1])
-            altitude = float(rowFields[2]) * 0.3048
-            lYear = rowFields[12][0:4]
-            lMonth = rowFields[12][5:7]
-            lDay = rowFields[12][8:10]
-            lhours = rowFields[12][11:13]
-            lminutes = rowFields[12][14:16]
-            lsecs = rowFields[12][17:19]
-            lmsecs = rowFields[12][20:]
-            lDate = lYear + '/' + lMonth + '/' + lDay
-            lTime = lhours + ':' + lminutes + ':' + lsecs + '.' + lmsecs
-            takingPhoto = rowFields[27]
-            #timestamp = int(rowFields[43])
-
-            if takingPhoto =='0':
-
-                # Convert the timestamp to UTC time
-
-                #dateTimeStr = datetime.datetime.utcfromtimestamp(timestamp / 1000.0).strftime('%Y/%m/%d %H:%M:%S.%f')
-                #DateStr = dateTimeStr.split(' ')[0]
-                #TimeStr = dateTimeStr.split(' ')[1][0:12]
-                DateStr=lDate
-                TimeStr=lTime
-
-                # Store the log data
-
-                gpsEventList = [DateStr, TimeStr, latitude, longitude, altitude, takingPhoto]
-                gpsEventDict[TimeStr]=gpsEventList
-                #gpsEventDict[timestamp] = gpsEventList
-                #print(gpsEventList)
-    return gpsEventDict, tzone
+    tzone = None
 
-def get_image_exif_data(filename):
+    # The log is read in chunks so that only one chunk of a long log is held in memory at a time
 
-    # Declare Tags for image EXIF data
+    for chunkIndex, flightLogColumns in enumerate(iter_dji_log_chunks(flightLog)):
+        if tzone is None:
+            tzone = timezone_at(flightLogColumns.lat[0], flightLogColumns.lon[0])
 
+        # The image DateTimeOriginal tag is local time so the log rows are keyed by their local time when available
+
+        if flightLogColumns.datetimeLocal is not None:
+            logDateTimes = flightLogColumns.datetimeLocal
+        else:
+            logDateTimes = flightLogColumns.datetime
+        firstRow = 1 if chunkIndex == 0 else 0
+        if flightLogColumns.isTakingPhoto is not None:
+            logRows = numpy.flatnonzero(~flightLogColumns.isTakingPhoto[firstRow:]) + firstRow
+        else:
+            logRows = numpy.arange(firstRow, len(flightLogColumns))
+        logDateTimeStrings = numpy.datetime_as_string(logDateTimes[logRows], unit='ms')
 
-    gpsDateTag          = 'GPS GPSDate'
-    gpsLatTag           = 'GPS GPSLatitude'
-    gpsLatRefTag        = 'GPS GPSLatitudeRef'
-    gpsLongTag          = 'GPS GPSLongitude'
-    gpsLongRefTag       = 'GPS GPSLongitudeRef'
-    gpsTimeTag          = 'GPS GPSTimeStamp'
-    exifImageDateTime   = 'EXIF DateTimeOriginal'
+        for rowIndex, dateTimeStr in zip(logRows.tolist(), logDateTimeStrings.tolist()):
+            DateStr = dateTimeStr[0:10].replace('-', '/')
+            TimeStr = dateTimeStr[11:]
+            takingPhoto = '0'
+
+            # Store the log data
+
+            gpsEventList = [DateStr, TimeStr, flightLogColumns.lat[rowIndex], flightLogColumns.lon[rowIndex],
+                            flightLogColumns.alt[rowIndex], takingPhoto]
+            gpsEventDict[TimeStr]=gpsEventList
+    return gpsEventDict, tzone
+
+def get_image_exif_data(filename):
 
-    tags = exifread.process_file(filename,strict=True)
+    # Read only the IFD0, EXIF and GPS IFD tags of the image (see exif_reader.py)
+
+    tags = read_exif(filename)
 
     cam_position_x     = None
     cam_position_y     = None
@@ -198,53 +181,15 @@ def get_image_exif_data(filename):
     try:
 
     # Get Camera GPS Latitude and Longitude Data
-        latRefStr       = str(tags[gpsLatRefTag])
-        latStrLen       = len(str(tags[gpsLatTag]))-1
-        latStr          = str(tags[gpsLatTag])[1:latStrLen]
-        lat,latMins,latSecs = latStr.split(', ')
-        if '/' in latSecs:
-            latSecsNum,latSecsDenom = latSecs.split('/')
-            latSecsDec = float(latSecsNum)/float(latSecsDenom)
-        else:
-            latSecsDec=float(latSecs)
-
-        if latRefStr == "S":
-            cam_latitude = (float(lat)+ (float(latMins)/60) + latSecsDec/3600) * (-1)
-        elif latRefStr == "N":
-            cam_latitude = (float(lat)+ (float(latMins)/60) + latSecsDec/3600)
-
-
-        longRefStr      = str(tags[gpsLongRefTag])
-        lonStrLen       = len(str(tags[gpsLongTag]))-1
-        lonStr          = str(tags[gpsLongTag])[1:lonStrLen]
-        lon,lonMins,lonSecs = lonStr.split(', ')
-        if '/' in lonSecs:
-            lonSecsNum,lonSecsDenom = lonSecs.split('/')
-            lonSecsDec = float(lonSecsNum)/float(lonSecsDenom)
-        else:
-            lonSecsDec=float(lonSecs)
 
-        if longRefStr == "W":
-            cam_longitude = (float(lon)+ (float(lonMins)/60) + lonSecsDec/3600) * (-1)
-        elif longRefStr == "E":
-            cam_longitude = (float(lon)+ (float(lonMins)/60) + lonSecsDec/3600)
+        cam_latitude = gps_degrees(tags, 'GPSLatitude')
+        cam_longitude = gps_degrees(tags, 'GPSLongitude')
 
     # Get Camera Image Time
 
-        if exifImageDateTime in tags:
-            pass
-
-        if gpsTimeTag in tags:
-
-            timeStrLen = len(str(tags[gpsTimeTag]))-1
-            timeStr = str(tags[gpsTimeTag])[1:timeStrLen]
-            if '/' in timeStr:
-                hrs, mins, secsFract = timeStr.split(', ')
-                secsNum,secsDenom = secsFract.split('/')
-                secs = str(int(secsNum)/int(secsDenom))
-            else:
-                hrs, mins, secs = timeStr.split(', ')
-            cam_sample_time=hrs.zfill(2)+':'+mins.zfill(2)+':'+secs.zfill(2)
+        if 'GPSTimeStamp' in tags:
+            hrs, mins, secs = tags['GPSTimeStamp']
+            cam_sample_time='%02d:%02d:%02d' % (hrs, mins, secs)
 
     except Exception,e:
         print('*** Error*** Unable to process image file EXIF data for ')
@@ -274,11 +219,11 @@ if imageCount==0:
     print("There were no image files found in ",uasPath)
     print("Exiting")
 metadataList=[]
-for image in imageFiles:
-    #dt = subprocess.call(['exiftool', '-DateTimeOriginal', image])
-    dt = subprocess.Popen(['exiftool', '-DateTimeOriginal', image],stdout=subprocess.PIPE)
-    output, err = dt.communicate()
-    dateTimeStr=output.split(': ')[1]
+geotagRecords=[]
+exifTool = get_exiftool()
+imageTags = exifTool.get_tags(imageFiles, ['DateTimeOriginal']) # Read the time of all images with one exiftool process
+for image, tags in zip(imageFiles, imageTags):
+    dateTimeStr=str(tags['DateTimeOriginal'])
     imageTimeStr=dateTimeStr.split(' ')[1]
     imageTimeStr=imageTimeStr[0:12]
     #print(image,imageTimeStr)
@@ -289,13 +234,16 @@ for image in imageFiles:
     longitude=str(gpsEvents[gpsEventsKey][3])
     imageName=gpsEvents[gpsEventsKey][8]
     print("Image Name",imageName,"Latitude:",latitude,"Longitude:",longitude,)
-    ll=subprocess.Popen(['exiftool', '-GPSLatitude='+latitude,'-GPSLongitude='+longitude, imageName], stdout=subprocess.PIPE)
-    output, err = ll.communicate()
+    geotagRecords.append(GeotagRecord(imageName, float(latitude), float(longitude), None))
     imageFileName=imageName.split('/')[-1]
     metadataRecord=[imageFileName,latitude,longitude]
     metadataList.append(metadataRecord)
     pass
 
+# Write the GPS position of all images with one exiftool CSV import per chunk of images
+
+report_geotag_failures(write_geotags(geotagRecords))
+
 #
 # Write out the metadata file
 #
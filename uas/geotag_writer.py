@@ -0,0 +1,100 @@
+#
+# Version 0.1 October 2018
+#
+# This is a module that contains the bulk EXIF GPS writer used to geotag the images of an image set.
+#
+# The positions of all images of an image set are collected first and written with one exiftool -csv= import per chunk
+# of chunkSize images, using the shared exiftool process (see exiftool_service.py), instead of one exiftool run per
+# image. The images are updated in place (-overwrite_original) so no _original copy of every image is left behind.
+# The files exiftool could not update are reported with the exiftool error message. The error messages of a chunk are
+# read while exiftool runs (see exiftool_service.py), so a chunk of missing or corrupt images, however many error lines
+# it produces, is reported rather than blocking exiftool.
+#
+# Positions are written as absolute values with their reference: GPSLatitudeRef N/S, GPSLongitudeRef E/W and
+# GPSAltitudeRef 0 (above sea level) or 1 (below sea level). The altitude is only written when it is given.
+#
+
+from __future__ import print_function
+from __future__ import division
+
+import os
+import re
+import csv
+import tempfile
+import collections
+
+from exiftool_service import get_exiftool, batches
+
+GeotagRecord = collections.namedtuple('GeotagRecord', ['fileName', 'latitude', 'longitude', 'altitude'])
+
+chunkSize = 1000
+
+geotagColumns = ['SourceFile', 'GPSLatitude', 'GPSLatitudeRef', 'GPSLongitude', 'GPSLongitudeRef', 'GPSAltitude',
+                 'GPSAltitudeRef']
+
+errorPattern = re.compile(r'^(Error|Warning): (.*) - (.+)$')
+
+
+def geotag_row(record):
+    # Return the exiftool CSV row of a GeotagRecord
+    row = [record.fileName,
+           '%.10f' % abs(record.latitude), 'S' if record.latitude < 0 else 'N',
+           '%.10f' % abs(record.longitude), 'W' if record.longitude < 0 else 'E']
+    if record.altitude is None:
+        return row + ['', '']
+    return row + ['%.3f' % abs(record.altitude), '1' if record.altitude < 0 else '0']
+
+
+def write_geotag_csv(csvPath, records):
+    with open(csvPath, 'w') as csvFile:
+        writer = csv.writer(csvFile, lineterminator='\n')
+        writer.writerow(geotagColumns)
+        writer.writerows(geotag_row(record) for record in records)
+
+
+def failed_files(errors, fileNames):
+    #
+    # Return a list of (file name, message) of the files named in exiftool error messages. Warnings that do not stop a
+    # file from being updated are ignored.
+    #
+    fileSet = set(fileNames)
+    failures = []
+    for line in errors.splitlines():
+        match = errorPattern.match(line.strip())
+        if match is not None and match.group(1) == 'Error' and match.group(3) in fileSet:
+            failures.append((match.group(3), match.group(2)))
+    return failures
+
+
+def write_geotags(records, exifTool=None):
+    #
+    # Write the GPS position of each GeotagRecord to its image. Returns the list of (file name, message) of the images
+    # that could not be updated.
+    #
+    exifTool = exifTool if exifTool is not None else get_exiftool()
+    failures = []
+    for chunk in batches(list(records), chunkSize):
+        handle, csvPath = tempfile.mkstemp(suffix='.csv', prefix='geotag_')
+        os.close(handle)
+        try:
+            write_geotag_csv(csvPath, chunk)
+            fileNames = [record.fileName for record in chunk]
+            # Empty CSV values (no altitude) are ignored by the import rather than deleting the tag
+            output, errors = exifTool.execute_with_errors(*(['-n', '-csv=' + csvPath, '-overwrite_original'] +
+                                                            fileNames))
+            chunkFailures = failed_files(errors, fileNames)
+            notUpdated = re.search(r'(\d+) files? weren\'t updated due to errors', output)
+            if notUpdated is not None and int(notUpdated.group(1)) > len(chunkFailures):
+                print('*** Warning***', notUpdated.group(1), 'images were not updated:', errors.strip())
+            failures.extend(chunkFailures)
+        finally:
+            os.remove(csvPath)
+    return failures
+
+
+def report_geotag_failures(failures):
+    # Print the images that could not be geotagged
+    for fileName, message in failures:
+        print('*** Error*** Unable to update the EXIF GPS position of', fileName, ':', message)
+    if len(failures) > 0:
+        print('***', len(failures), 'images were not geotagged')
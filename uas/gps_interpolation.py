@@ -0,0 +1,88 @@
+#
+# Version 0.1 October 2018
+#
+# This is a module that contains the position interpolation engine used by the HTP DJI programs.
+#
+# The default sampling frequency of the DJI log file is 10 Hz. The engine builds a regular timeline at the requested
+# rate (100 Hz by default) over each isTakingVideo segment of the log and interpolates the UAV position at every tick
+# of the timeline in one set of array operations. The interpolated positions are returned as a GpsTrack of numpy
+# arrays (see gps_track.py); date and time strings are only formatted by the caller for the positions that are used.
+#
+# interpolate_segments builds the same track from the segments streamed by dji_log.iter_video_segments so that the
+# whole log never has to be held in memory.
+#
+
+from __future__ import print_function
+from __future__ import division
+
+import numpy
+
+from gps_track import GpsTrack
+
+
+def build_segment_timeline(segmentStarts, segmentEnds, rate):
+    # Return the tick times (ms) and the segment number (1..n) of every tick of a regular timeline at the given rate
+    # covering each segment. The first tick of a segment is the segment start time rounded to the tick interval.
+
+    tickInterval = 1000.0 / rate
+    segmentStarts = numpy.asarray(segmentStarts, dtype=numpy.float64)
+    segmentEnds = numpy.asarray(segmentEnds, dtype=numpy.float64)
+
+    seeds = numpy.round(segmentStarts / tickInterval) * tickInterval
+    tickCounts = numpy.floor((segmentEnds - seeds) / tickInterval).astype(numpy.int64) + 1
+    tickCounts = numpy.maximum(tickCounts, 1)
+
+    segments = numpy.repeat(numpy.arange(1, len(tickCounts) + 1, dtype=numpy.int32), tickCounts)
+    firstTick = numpy.repeat(numpy.cumsum(tickCounts) - tickCounts, tickCounts)
+    tickNumber = numpy.arange(len(segments), dtype=numpy.int64) - firstTick
+    ticks = numpy.repeat(seeds, tickCounts) + tickNumber * tickInterval
+
+    return numpy.round(ticks).astype(numpy.int64), segments
+
+
+def interpolate_track(flightLogColumns, rate=100, latOffset=0.0, lonOffset=0.0):
+    #
+    # Interpolate the UAV position at the given rate (Hz) over each isTakingVideo segment of the log.
+    # latOffset and lonOffset (degrees) are added to the log positions to correct errors in the log file position.
+    #
+    # Returns a GpsTrack of timestamps (ms), latitudes, longitudes, altitudes (m) and segments (1..n).
+    #
+
+    segmentRows = flightLogColumns.video_segments()
+    logTimes = flightLogColumns.timestamp
+    if len(segmentRows) == 0:
+        empty = numpy.empty(0)
+        return GpsTrack(empty, empty, empty, empty, empty)
+
+    segmentStarts = [logTimes[start] for start, stop in segmentRows]
+    segmentEnds = [logTimes[stop - 1] for start, stop in segmentRows]
+    timestamps, segments = build_segment_timeline(segmentStarts, segmentEnds, rate)
+
+    # Interpolate against every log row (not only the video rows) so that a tick falling just before the first
+    # video row of a segment is interpolated from the preceding log row, as the original 100 Hz loop did.
+
+    latitudes = numpy.interp(timestamps, logTimes, flightLogColumns.lat) + float(latOffset)
+    longitudes = numpy.interp(timestamps, logTimes, flightLogColumns.lon) + float(lonOffset)
+    altitudes = numpy.interp(timestamps, logTimes, flightLogColumns.alt)
+
+    return GpsTrack(timestamps, latitudes, longitudes, altitudes, segments)
+
+
+def interpolate_segments(segmentLogs, rate=100, latOffset=0.0, lonOffset=0.0):
+    #
+    # Interpolate the UAV position at the given rate (Hz) over a sequence of isTakingVideo segments, each given as a
+    # FlightLog (see dji_log.iter_video_segments). The segments are numbered 1..n in the order they are received.
+    #
+    columns = {'timestamps': [], 'lat': [], 'lon': [], 'alt': [], 'segments': []}
+    segmentCount = 0
+    for segmentLog in segmentLogs:
+        segmentTrack = interpolate_track(segmentLog, rate, latOffset, lonOffset)
+        for name in ('timestamps', 'lat', 'lon', 'alt'):
+            columns[name].append(getattr(segmentTrack, name))
+        columns['segments'].append(segmentTrack.segments + segmentCount)
+        segmentCount += len(segmentTrack.segment_ids())
+
+    if segmentCount == 0:
+        empty = numpy.empty(0)
+        return GpsTrack(empty, empty, empty, empty, empty)
+    return GpsTrack(*[numpy.concatenate(columns[name]) for name in ('timestamps', 'lat', 'lon', 'alt', 'segments')])
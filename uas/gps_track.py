@@ -0,0 +1,105 @@
+#
+# Version 0.1 October 2018
+#
+# This is a module that contains the GpsTrack class used to store the interpolated UAV positions.
+#
+# The track is stored as a structure of arrays: sorted int64 timestamps (ms) and float64 latitude, longitude and
+# altitude columns plus an int32 segment (range) number, i.e. about 36 bytes per sample and no python object per
+# sample. Lookups by time use a binary search (numpy.searchsorted) so they are O(log n).
+#
+# The images matched to the track are recorded in a separate match array (sample index, frame time and the time
+# difference between the frame and the sample) so the position columns are never modified.
+#
+
+from __future__ import print_function
+from __future__ import division
+
+import numpy
+
+matchDtype = numpy.dtype([('sample', numpy.int64), ('frame_time', numpy.float64), ('delta', numpy.float64)])
+
+
+class GpsTrack(object):
+    '''Time sorted UAV positions stored as numpy column arrays.'''
+
+    __slots__ = ('timestamps', 'lat', 'lon', 'alt', 'segments', 'matches')
+
+    def __init__(self, timestamps, lat, lon, alt, segments):
+        self.timestamps = numpy.asarray(timestamps, dtype=numpy.int64)
+        self.lat = numpy.asarray(lat, dtype=numpy.float64)
+        self.lon = numpy.asarray(lon, dtype=numpy.float64)
+        self.alt = numpy.asarray(alt, dtype=numpy.float64)
+        self.segments = numpy.asarray(segments, dtype=numpy.int32)
+        self.matches = numpy.empty(0, dtype=matchDtype)
+        if len(self.timestamps) > 1 and numpy.any(numpy.diff(self.timestamps) < 0):
+            raise ValueError('GpsTrack timestamps must be sorted.')
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    def _rows(self, rows):
+        # Return a GpsTrack of the given rows. Slices return views of the columns, not copies.
+        return GpsTrack(self.timestamps[rows], self.lat[rows], self.lon[rows], self.alt[rows], self.segments[rows])
+
+    def start_time(self):
+        return int(self.timestamps[0])
+
+    def end_time(self):
+        return int(self.timestamps[-1])
+
+    def positions_at(self, times):
+        # Return the latitudes, longitudes and altitudes at the given times (ms), interpolated linearly between the
+        # two samples either side of each time. Times outside the track take the position of the first/last sample.
+        times = numpy.asarray(times, dtype=numpy.float64)
+        return (numpy.interp(times, self.timestamps, self.lat),
+                numpy.interp(times, self.timestamps, self.lon),
+                numpy.interp(times, self.timestamps, self.alt))
+
+    def position_at(self, time):
+        # Return the (latitude, longitude, altitude) at a single time (ms)
+        lat, lon, alt = self.positions_at([time])
+        return float(lat[0]), float(lon[0]), float(alt[0])
+
+    def sample_indexes(self, times):
+        # Return the index of the first sample at or after each time (clipped to the last sample)
+        indexes = numpy.searchsorted(self.timestamps, numpy.asarray(times, dtype=numpy.float64), side='left')
+        return numpy.minimum(indexes, len(self.timestamps) - 1)
+
+    def slice(self, startTime, endTime):
+        # Return a view of the samples with startTime <= timestamp <= endTime
+        first = numpy.searchsorted(self.timestamps, startTime, side='left')
+        last = numpy.searchsorted(self.timestamps, endTime, side='right')
+        return self._rows(slice(first, last))
+
+    def segment_ids(self):
+        return numpy.unique(self.segments).tolist()
+
+    def segment_bounds(self):
+        # Return a dictionary of segment: (first sample index, last sample index + 1). Segments are contiguous because
+        # the samples are time sorted.
+        segments, firstIndex = numpy.unique(self.segments, return_index=True)
+        order = numpy.argsort(firstIndex)
+        segments = segments[order]
+        firstIndex = firstIndex[order]
+        stopIndex = numpy.append(firstIndex[1:], len(self.segments))
+        return dict(zip(segments.tolist(), zip(firstIndex.tolist(), stopIndex.tolist())))
+
+    def segment(self, segment):
+        # Return a view of the samples of one segment (range)
+        first, stop = self.segment_bounds()[segment]
+        return self._rows(slice(first, stop))
+
+    def segments_view(self):
+        # Return a list of (segment, GpsTrack view) pairs in time order
+        return [(segment, self._rows(slice(first, stop)))
+                for segment, (first, stop) in sorted(self.segment_bounds().items(), key=lambda item: item[1])]
+
+    def record_matches(self, sampleIndexes, frameTimes):
+        # Record that the frames taken at frameTimes were matched to the samples sampleIndexes
+        sampleIndexes = numpy.asarray(sampleIndexes, dtype=numpy.int64)
+        frameTimes = numpy.asarray(frameTimes, dtype=numpy.float64)
+        newMatches = numpy.empty(len(sampleIndexes), dtype=matchDtype)
+        newMatches['sample'] = sampleIndexes
+        newMatches['frame_time'] = frameTimes
+        newMatches['delta'] = numpy.abs(self.timestamps[sampleIndexes] - frameTimes)
+        self.matches = numpy.concatenate((self.matches, newMatches))
@@ -0,0 +1,88 @@
+#
+# Version 0.1 October 2018
+#
+# This is a module that contains the single pass image reader used by the ingest programs.
+#
+# The ingest programs used to read each image twice: once for its EXIF data and once more in full for its MD5 checksum.
+# On network mounted staging the second read doubled the time taken. ingest_image reads each image once:
+#
+#   1. The first block (checksum_engine.bufferSize bytes) is read and fed to the hasher, and the EXIF IFDs are parsed
+#      from it (see exif_reader.py). The TIFF IFDs and the JPEG EXIF segment are almost always in the first block.
+#   2. The rest of the image is read block by block and fed to the hasher.
+#   3. If the EXIF data was not all in the first block, the few IFD entries outside it are read from the open file.
+#
+# When the checksum of an unchanged image is in the checksum manifest in use (see checksum_manifest.py) only the EXIF
+# IFDs are read. ingest_images reads many images at once with a thread pool (see checksum_engine.checksum_files).
+#
+# The module runs with Python 2.7 (phenocam) and Python 3.
+#
+
+from __future__ import print_function
+from __future__ import division
+
+import io
+import os
+import hashlib
+import collections
+from multiprocessing.pool import ThreadPool
+
+import checksum_engine
+from exif_reader import read_exif
+
+ImageRecord = collections.namedtuple('ImageRecord', ['path', 'size', 'md5', 'tags'])
+
+
+def ingest_file(imageFile, path):
+    # Return the ImageRecord of an image open in binary mode (read from its start)
+    fileStat = os.fstat(imageFile.fileno())
+    manifest = checksum_engine.get_checksum_manifest()
+    checksum = manifest.lookup(path, fileStat) if manifest is not None else None
+    if checksum is not None:
+        return ImageRecord(path, fileStat.st_size, checksum, read_exif(imageFile))
+
+    hasher = hashlib.md5()
+    head = imageFile.read(checksum_engine.bufferSize)
+    hasher.update(head)
+    try:
+        tags = read_exif(io.BytesIO(head))
+    except ValueError:
+        tags = None
+    checksum = checksum_engine.hash_file_object(imageFile, hasher=hasher)
+    if tags is None:
+        tags = read_exif(imageFile)
+    if manifest is not None:
+        manifest.record(path, checksum, fileStat)
+    return ImageRecord(path, fileStat.st_size, checksum, tags)
+
+
+def ingest_image(path):
+    # Return the ImageRecord (path, size, MD5 checksum, EXIF tags) of an image read in a single pass
+    with io.open(path, 'rb', buffering=0) as imageFile:
+        return ingest_file(imageFile, path)
+
+
+def ingest_images(paths, workers=None):
+    #
+    # Return the list of ImageRecord of paths (in the same order), read by workers threads (chosen from the storage of
+    # the first image when workers is None). The record of an image that cannot be read is None.
+    #
+    paths = list(paths)
+    if len(paths) == 0:
+        return []
+    if workers is None:
+        workers = checksum_engine.storage_workers(os.path.dirname(os.path.abspath(paths[0])))
+    workers = max(min(workers, len(paths)), 1)
+    pool = ThreadPool(workers)
+    try:
+        return pool.map(_ingest_or_none, paths, 1)
+    finally:
+        pool.close()
+        pool.join()
+
+
+def _ingest_or_none(path):
+    try:
+        return ingest_image(path)
+    except (IOError, OSError) as e:
+        print('*** Warning*** Unable to read image', path, e)
+        return None
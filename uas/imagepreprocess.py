@@ -8,8 +8,8 @@
 import subprocess
 import time
 import utm
-import hashlib
-import exifread
+from checksum_engine import hashfilelist, calculate_checksum
+from exif_reader import read_exif, gps_degrees, gps_date_time, exif_date_time
 
 secsInWeek = 604800
 secsInDay = 86400
@@ -83,37 +83,12 @@ def get_image_utm_position(gpsLatitude, gpsLongitude):
 
     return utmPosition
 
-def hashfilelist(afile, blocksize=65536):
-    hasher = hashlib.md5()
-    buf = afile.read(blocksize)
-    while len(buf) > 0:
-        hasher.update(buf)
-        buf = afile.read(blocksize)
-    return hasher.hexdigest()
+def get_image_exif_data(filename, tags=None):
 
+    # Read only the IFD0, EXIF and GPS IFD tags of the image (see exif_reader.py). filename is a path or an open file.
+    # tags are the tags already read from the image (see image_ingest.py), if any.
 
-def calculate_checksum(ffilename):
-    checksum = hashfilelist(open(ffilename, 'rb'))
-    return checksum
-
-def get_image_exif_data(filename):
-
-    # Declare Tags for image EXIF data
-
-    gpsAltTag           = 'GPS GPSAltitude'
-    gpsAltRefTag        = 'GPS GPSAltitudeRef'
-    gpsDateTag          = 'GPS GPSDate'
-    gpsLatTag           = 'GPS GPSLatitude'
-    gpsLatRefTag        = 'GPS GPSLatitudeRef'
-    gpsLongTag          = 'GPS GPSLongitude'
-    gpsLongRefTag       = 'GPS GPSLongitudeRef'
-    gpsMapDatumTag      = 'GPS GPSMapDatum'
-    gpsStatusTag        = 'GPS GPSStatus'
-    gpsTimeTag          = 'GPS GPSTimeStamp'
-    exifCamSerialNo     = 'EXIF BodySerialNumber'
-    exifImageDateTime   = 'EXIF DateTimeOriginal'
-
-    tags = exifread.process_file(filename)
+    tags = tags if tags is not None else read_exif(filename)
 
     cam_position_x     = None
     cam_position_y     = None
@@ -125,26 +100,21 @@ def get_image_exif_data(filename):
     cam_lat_zone       = None
     cam_long_zone      = None
     cam_altitude_ref   = None
+    cam_serial_no      = None
 
     try:
 
     # Get Camera GPS Altitude
-        if gpsAltTag in tags:
-            altStr          = str(tags[gpsAltTag])
-            if '/' in altStr:
-                altNum,altDenom = altStr.split('/')
-                cam_position_z  = str(float(altNum)/float(altDenom))
-            else:
-                cam_position_z = altStr
+        if 'GPSAltitude' in tags:
+            cam_position_z = str(tags['GPSAltitude'])
         else:
             cam_position_z = '0'
 
 
     #    Get Camera GPS Altitude reference MSL - Mean Sea Level BMSL = Below Mean Sea Level
 
-        if gpsAltRefTag in tags:
-            altRefStr = str(tags[gpsAltRefTag])
-            if altRefStr == '0':
+        if 'GPSAltitudeRef' in tags:
+            if tags['GPSAltitudeRef'] == 0:
                 cam_altitude_ref='AMSL'
             else:
                 cam_altitude_ref='BMSL'
@@ -153,36 +123,9 @@ def get_image_exif_data(filename):
 
 
     # Get Camera GPS Latitude and Longitude Data
-        latRefStr       = str(tags[gpsLatRefTag])
-        latStrLen       = len(str(tags[gpsLatTag]))-1
-        latStr          = str(tags[gpsLatTag])[1:latStrLen]
-        lat,latMins,latSecs = latStr.split(', ')
-        if '/' in latSecs:
-            latSecsNum,latSecsDenom = latSecs.split('/')
-            latSecsDec = float(latSecsNum)/float(latSecsDenom)
-        else:
-            latSecsDec=float(latSecs)
 
-        if latRefStr == "S":
-            cam_latitude = (float(lat)+ (float(latMins)/60) + latSecsDec/3600) * (-1)
-        elif latRefStr == "N":
-            cam_latitude = (float(lat)+ (float(latMins)/60) + latSecsDec/3600)
-
-
-        longRefStr      = str(tags[gpsLongRefTag])
-        lonStrLen       = len(str(tags[gpsLongTag]))-1
-        lonStr          = str(tags[gpsLongTag])[1:lonStrLen]
-        lon,lonMins,lonSecs = lonStr.split(', ')
-        if '/' in lonSecs:
-            lonSecsNum,lonSecsDenom = lonSecs.split('/')
-            lonSecsDec = float(lonSecsNum)/float(lonSecsDenom)
-        else:
-            lonSecsDec=float(lonSecs)
-
-        if longRefStr == "W":
-            cam_longitude = (float(lon)+ (float(lonMins)/60) + lonSecsDec/3600) * (-1)
-        elif longRefStr == "E":
-            cam_longitude = (float(lon)+ (float(lonMins)/60) + lonSecsDec/3600)
+        cam_latitude = gps_degrees(tags, 'GPSLatitude')
+        cam_longitude = gps_degrees(tags, 'GPSLongitude')
 
     # Get Camera UTM Position
         camUtmPosition  = get_image_utm_position(cam_latitude, cam_longitude)
@@ -196,30 +139,12 @@ def get_image_exif_data(filename):
 
     # Get Camera Image Date and Time
 
-        if gpsDateTag in tags:
-            dateStr=str(tags[gpsDateTag])
-            year,month,day = dateStr.split(':')
-            cam_sample_date=year+'/'+month+'/'+day
-
-            timeStrLen = len(str(tags[gpsTimeTag]))-1
-            timeStr = str(tags[gpsTimeTag])[1:timeStrLen]
-            if '/' in timeStr:
-                hrs, mins, secsFract = timeStr.split(', ')
-                secsNum,secsDenom = secsFract.split('/')
-                secs = str(int(secsNum)/int(secsDenom))
-            else:
-                hrs, mins, secs = timeStr.split(', ')
-            cam_sample_time=hrs.zfill(2)+':'+mins.zfill(2)+':'+secs.zfill(2)
-        elif exifImageDateTime in tags:
-            dateStr=str(tags[exifImageDateTime]).split(' ')[0]
-            year, month, day = dateStr.split(':')
-            cam_sample_date = year + '/' + month + '/' + day
-            timeStr =str(tags[exifImageDateTime]).split(' ')[1]
-            hrs, mins, secs= timeStr.split(':')
-            cam_sample_time = hrs.zfill(2) + ':' + mins.zfill(2) + ':' + secs.zfill(2)
-
-        if exifCamSerialNo in tags:
-            cam_serial_no = str(tags[exifCamSerialNo])
+        camDateTime = gps_date_time(tags) or exif_date_time(tags)
+        if camDateTime is not None:
+            cam_sample_date, cam_sample_time = camDateTime
+
+        if 'BodySerialNumber' in tags:
+            cam_serial_no = tags['BodySerialNumber']
 
 
     #except Exception,e:
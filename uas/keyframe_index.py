@@ -0,0 +1,247 @@
+#
+# Version 0.1 October 2018
+#
+# This is a module that contains the keyframe index of a video used to choose frame accurate cut points.
+#
+# A stream copy cut can only start at a keyframe: with -ss before -codec copy the segment starts at an arbitrary
+# keyframe before the requested start, while re-encoding the whole segment is very slow. The keyframe times of a video
+# are read once with ffprobe (or avprobe) from the packet flags, without decoding, and cached next to the video in
+# <video>.keyframes. cut_commands then chooses how each segment is cut:
+#
+#   copy    The segment starts within snapTolerance seconds of a keyframe: it is stream copied from that keyframe.
+#   head    Only the leading GOP, from the requested start to the next keyframe, is re-encoded. The rest of the segment
+#           is stream copied from that keyframe and the two parts are joined with the ffmpeg concat demuxer.
+#   encode  The segment ends before the next keyframe: the whole (short) segment is re-encoded.
+#
+# The concat demuxer joins the parts without re-encoding, so the re-encoded head must be a stream the decoder can
+# continue from into the copied tail. The parameters of the video stream (codec, profile, level, pixel format,
+# resolution, frame rate and time base) are read with ffprobe when the index is loaded and the head is encoded with the
+# same parameters (head_codec). A video whose stream libx264 can not reproduce (another codec, or a profile or pixel
+# format libx264 does not encode) is cut in encode mode instead. The stream of the joined segment is checked against
+# the video (stream_matches) before the segment is reported as done (see video_segmenter.py).
+#
+# avconv has no concat demuxer, so with avconv a segment that does not start near a keyframe is stream copied from the
+# previous keyframe (mode keyframe). It covers the whole range but starts before it, so it is longer than the requested
+# duration and is not frame accurate: cut_commands returns the duration the output is expected to have.
+#
+
+from __future__ import print_function
+from __future__ import division
+
+import os
+import subprocess
+import numpy
+
+keyframeCacheVersion = 1
+defaultSnapTolerance = 0.1  # seconds
+frameAccurateModes = ('copy', 'head', 'encode')
+encodeCodec = ['-c:v', 'libx264', '-preset', 'veryfast', '-crf', '18']
+
+# Video stream parameters read with ffprobe, those the joined segment must share with the video, the libx264 profile
+# of each H.264 profile reported by ffprobe and the pixel formats libx264 encodes
+
+streamKeys = ('codec_name', 'profile', 'level', 'pix_fmt', 'width', 'height', 'r_frame_rate', 'time_base')
+matchedStreamKeys = ('codec_name', 'profile', 'pix_fmt', 'width', 'height')
+x264Profiles = {'Constrained Baseline': 'baseline', 'Baseline': 'baseline', 'Main': 'main', 'High': 'high',
+                'High 10': 'high10', 'High 4:2:2': 'high422', 'High 4:4:4 Predictive': 'high444'}
+x264PixelFormats = ('yuv420p', 'yuvj420p', 'yuv422p', 'yuvj422p', 'yuv444p', 'yuvj444p', 'nv12', 'yuv420p10le',
+                    'yuv422p10le', 'yuv444p10le')
+timescaleContainers = ('.mov', '.mp4', '.m4v')  # containers with the -video_track_timescale option
+
+
+def keyframe_cache_path(videoPath):
+    return videoPath + '.keyframes'
+
+
+def video_stamp(videoPath):
+    # Return the size and modification time of a video, used to check that a cached index is still valid
+    fileStat = os.stat(videoPath)
+    return [keyframeCacheVersion, fileStat.st_size, int(fileStat.st_mtime)]
+
+
+def probe_keyframes(probePath, videoPath):
+    #
+    # Return the sorted times (seconds) of the video keyframes of a video. The packet list is read (the video is not
+    # decoded) and the video packets flagged K are kept. The output of both ffprobe and avprobe is a list of blocks of
+    # key=value lines.
+    #
+    output = subprocess.check_output([probePath, '-v', 'error', '-show_packets', videoPath])
+    keyframes = []
+    packet = {}
+    for line in output.decode('utf-8', 'replace').splitlines() + ['[']:
+        line = line.strip()
+        if line.startswith('['):
+            if packet.get('codec_type') == 'video' and 'K' in packet.get('flags', ''):
+                try:
+                    keyframes.append(float(packet['pts_time']))
+                except (KeyError, ValueError):
+                    pass
+            packet = {}
+        elif '=' in line:
+            key, value = line.split('=', 1)
+            packet[key.strip()] = value.strip()
+    return numpy.unique(numpy.array(keyframes, dtype=numpy.float64))
+
+
+def probe_video_stream(probePath, videoPath):
+    # Return the parameters (streamKeys) of the first video stream of a video or an empty dictionary if they can not be
+    # read (avprobe has no -select_streams)
+    try:
+        output = subprocess.check_output([probePath, '-v', 'error', '-select_streams', 'v:0', '-show_streams',
+                                          videoPath], stderr=subprocess.STDOUT)
+    except (subprocess.CalledProcessError, OSError):
+        return {}
+    stream = {}
+    for line in output.decode('utf-8', 'replace').splitlines():
+        if '=' in line:
+            key, value = line.strip().split('=', 1)
+            if key in streamKeys and key not in stream:
+                stream[key] = value
+    return stream
+
+
+def stream_matches(stream, otherStream):
+    # Return True if two video streams (see probe_video_stream) have the same codec, profile, pixel format and size
+    return len(stream) > 0 and all(stream.get(key) == otherStream.get(key) for key in matchedStreamKeys)
+
+
+def head_codec(stream, outPath):
+    #
+    # Return the encoder options that re-encode the head of a segment with the parameters of the video stream, so the
+    # head can be joined to the stream copied tail, or None if libx264 can not encode a matching stream.
+    #
+    profile = x264Profiles.get(stream.get('profile'))
+    if stream.get('codec_name') != 'h264' or profile is None or stream.get('pix_fmt') not in x264PixelFormats:
+        return None
+    try:
+        level = int(stream['level'])
+        width = int(stream['width'])
+        height = int(stream['height'])
+    except (KeyError, ValueError):
+        return None
+    if level < 10 or width <= 0 or height <= 0:
+        return None
+    codec = encodeCodec + ['-profile:v', profile, '-level', '%d.%d' % divmod(level, 10), '-pix_fmt', stream['pix_fmt'],
+                           '-s', '%dx%d' % (width, height)]
+    frameRate = stream.get('r_frame_rate', '0/0')
+    if '/' in frameRate and not frameRate.startswith('0/') and not frameRate.endswith('/0'):
+        codec += ['-r', frameRate]
+    timeBase = stream.get('time_base', '')
+    if os.path.splitext(outPath)[1].lower() in timescaleContainers and timeBase.startswith('1/'):
+        codec += ['-video_track_timescale', timeBase[2:]]
+    return codec + ['-c:a', 'copy']
+
+
+def read_keyframe_cache(cachePath, stamp):
+    # Return the cached keyframe times or None if there is no valid cache file
+    try:
+        with open(cachePath, 'r') as cacheFile:
+            if [int(value) for value in cacheFile.readline().split()] != stamp:
+                return None
+            return numpy.array([float(line) for line in cacheFile if line.strip()], dtype=numpy.float64)
+    except (IOError, OSError, ValueError):
+        return None
+
+
+def write_keyframe_cache(cachePath, stamp, keyframes):
+    try:
+        tempPath = cachePath + '.tmp'
+        with open(tempPath, 'w') as cacheFile:
+            cacheFile.write(' '.join(str(value) for value in stamp) + '\n')
+            cacheFile.writelines('%.6f\n' % keyframe for keyframe in keyframes)
+        if os.path.exists(cachePath):
+            os.remove(cachePath)
+        os.rename(tempPath, cachePath)
+    except (IOError, OSError) as e:
+        print('*** Warning*** Unable to write keyframe index', cachePath, e)
+
+
+class KeyframeIndex(object):
+    '''Sorted keyframe times (seconds) and video stream parameters of a video.'''
+
+    def __init__(self, keyframes, stream=None):
+        self.keyframes = numpy.asarray(keyframes, dtype=numpy.float64)
+        self.stream = stream if stream is not None else {}
+
+    def __len__(self):
+        return len(self.keyframes)
+
+    def previous(self, time):
+        # Return the last keyframe at or before time (the first keyframe if there is none)
+        index = numpy.searchsorted(self.keyframes, time, side='right') - 1
+        return float(self.keyframes[max(index, 0)])
+
+    def next(self, time):
+        # Return the first keyframe at or after time or None if there is none
+        index = numpy.searchsorted(self.keyframes, time, side='left')
+        return float(self.keyframes[index]) if index < len(self.keyframes) else None
+
+    def nearest(self, time):
+        # Return the keyframe nearest to time
+        following = self.next(time)
+        preceding = self.previous(time)
+        if following is None or abs(time - preceding) <= abs(following - time):
+            return preceding
+        return following
+
+
+def load_keyframe_index(videoPath, probePath):
+    # Return the KeyframeIndex of a video. The keyframes are read from the cache next to the video when it is still
+    # valid; the stream parameters are read from the video header.
+    cachePath = keyframe_cache_path(videoPath)
+    stamp = video_stamp(videoPath)
+    keyframes = read_keyframe_cache(cachePath, stamp)
+    if keyframes is None:
+        keyframes = probe_keyframes(probePath, videoPath)
+        write_keyframe_cache(cachePath, stamp, keyframes)
+    return KeyframeIndex(keyframes, probe_video_stream(probePath, videoPath))
+
+
+def cut_commands(encoderPath, videoPath, segment, outPath, keyframeIndex, snapTolerance=defaultSnapTolerance):
+    #
+    # Return the cut mode, the encoder commands that write the segment (see video_segmenter.Segment) to outPath, to be
+    # run in order, the temporary files they create and the duration (seconds) of the output.
+    #
+    start = segment.start
+    end = segment.start + segment.duration
+    supportsConcat = 'avconv' not in os.path.basename(encoderPath)
+
+    nearest = keyframeIndex.nearest(start) if len(keyframeIndex) > 0 else None
+    following = keyframeIndex.next(start) if len(keyframeIndex) > 0 else None
+    if nearest is not None and abs(nearest - start) <= snapTolerance:
+        return 'copy', [copy_command(encoderPath, videoPath, nearest, end - nearest, outPath)], [], end - nearest
+    if nearest is not None and not supportsConcat:
+        copyStart = keyframeIndex.previous(start)
+        return 'keyframe', [copy_command(encoderPath, videoPath, copyStart, end - copyStart, outPath)], [], \
+            end - copyStart
+
+    headOptions = head_codec(keyframeIndex.stream, outPath) if following is not None else None
+    if following is None or following >= end - snapTolerance or headOptions is None:
+        return 'encode', [encode_command(encoderPath, videoPath, start, segment.duration, outPath)], [], \
+            segment.duration
+
+    root, ext = os.path.splitext(outPath)
+    headPath = root + '.head' + ext
+    tailPath = root + '.tail' + ext
+    listPath = root + '.concat.txt'
+    with open(listPath, 'w') as listFile:
+        for partPath in (headPath, tailPath):
+            listFile.write("file '" + os.path.abspath(partPath).replace("'", "'\\''") + "'\n")
+    commands = [encode_command(encoderPath, videoPath, start, following - start, headPath, headOptions),
+                copy_command(encoderPath, videoPath, following, end - following, tailPath),
+                [encoderPath, '-y', '-v', 'error', '-f', 'concat', '-safe', '0', '-i', listPath, '-codec', 'copy',
+                 outPath]]
+    return 'head', commands, [headPath, tailPath, listPath], segment.duration
+
+
+def copy_command(encoderPath, videoPath, start, duration, outPath):
+    # Return the command that stream copies duration seconds from start. -ss before -i seeks the input.
+    return [encoderPath, '-y', '-v', 'error', '-ss', '%.3f' % start, '-i', videoPath, '-t', '%.3f' % duration,
+            '-codec', 'copy', outPath]
+
+
+def encode_command(encoderPath, videoPath, start, duration, outPath, codec=None):
+    # Return the command that re-encodes duration seconds from start, frame accurately, with the encoder options codec
+    codec = codec if codec is not None else encodeCodec + ['-c:a', 'copy']
+    return ([encoderPath, '-y', '-v', 'error', '-ss', '%.3f' % start, '-i', videoPath, '-t', '%.3f' % duration] +
+            codec + [outPath])
@@ -0,0 +1,268 @@
+#
+# Version 0.1 October 2018
+#
+# This is a module that contains the PlotLattice class used to find the plot containing a position in a field laid out
+# as a (rotated) regular grid of plots.
+#
+# The rotation, plot spacing and origin of the grid are detected from the plot corners. A position is converted to its
+# (row, range) grid cell with a rotation, a subtraction and a division, and the cell gives the plot directly. Each plot
+# is treated as the rectangle aligned with the grid that bounds its corners; a position within the border band of that
+# rectangle (the largest distance between a plot corner and the rectangle corner plus the tolerance) is tested against
+# the plot polygons instead (see plot_locator.py). Plots that are not close to a grid-aligned rectangle, or that share
+# a cell with another plot, are always tested against the polygons.
+#
+# Longitude/latitude corners are projected to local meters (equirectangular projection about the center of the field)
+# so that rotations and the tolerance are the same as for UTM corners.
+#
+
+from __future__ import print_function
+from __future__ import division
+
+import math
+import numpy
+
+from plot_locator import PlotLocator, polygons_from_rings
+
+metersPerDegreeLatitude = 110574.0
+metersPerDegreeLongitude = 111319.49
+
+noPlot = -1
+polygonCell = -2
+
+defaultTolerance = 0.001  # meters
+
+
+def open_rings(coords, offsets):
+    # Return the ring coordinates and offsets without the closing coordinate of closed rings
+    coords = numpy.asarray(coords, dtype=numpy.float64).reshape(-1, 2)
+    offsets = numpy.asarray(offsets, dtype=numpy.int64)
+    starts = offsets[:-1]
+    ends = offsets[1:] - 1
+    closed = numpy.zeros(len(starts), dtype=bool)
+    rings = ends > starts
+    closed[rings] = numpy.all(coords[ends[rings]] == coords[starts[rings]], axis=1)
+    keep = numpy.ones(len(coords), dtype=bool)
+    keep[ends[closed]] = False
+    counts = numpy.diff(offsets) - closed
+    return coords[keep], numpy.concatenate(([0], numpy.cumsum(counts))).astype(numpy.int64)
+
+
+def detect_spacing(centers, extents, tolerance):
+    # Return the grid spacing along one axis from the plot centers and the plot extents along that axis.
+    # Sorted centers less than half a plot apart belong to the same grid line. The spacing is taken from the gaps
+    # between the mean positions of the grid lines; missing grid lines give gaps of a multiple of the spacing.
+    centers = numpy.sort(centers)
+    lineBreaks = numpy.diff(centers) > 0.5 * numpy.median(extents)
+    lineNumbers = numpy.concatenate(([0], numpy.cumsum(lineBreaks)))
+    lines = numpy.bincount(lineNumbers, weights=centers) / numpy.bincount(lineNumbers)
+    gaps = numpy.diff(lines)
+    if len(gaps) == 0:
+        return float(numpy.max(extents)) + 4.0 * tolerance
+    spacing = numpy.median(gaps)
+    return float(numpy.median(gaps / numpy.maximum(numpy.round(gaps / spacing), 1.0)))
+
+
+def detect_phase(centers, spacing):
+    # Return the position of the grid line closest to zero along one axis
+    lineNumbers = numpy.round((centers - centers[0]) / spacing)
+    return float(numpy.median(centers - lineNumbers * spacing))
+
+
+class PlotLattice(object):
+    '''Regular grid index of plot polygons used to find the plot containing each of a set of positions.'''
+
+    def __init__(self, plotIds, coords, offsets, geographic=None, tolerance=defaultTolerance, polygons=None):
+        #
+        # The corners of plot i are coords[offsets[i]:offsets[i + 1]] (x,y or longitude,latitude).
+        # geographic is True for longitude/latitude corners; it is detected from the coordinate range when None.
+        # polygons are the plot polygons used near plot borders; they are built from the corners when not given.
+        #
+        self.plotIds = numpy.array(list(plotIds), dtype=object)
+        self.coords, self.offsets = open_rings(coords, offsets)
+        self.tolerance = tolerance
+        self.table = None
+        self._locator = None if polygons is None else PlotLocator(self.plotIds, polygons)
+
+        if geographic is None:
+            geographic = bool(len(self.coords) > 0 and numpy.all(numpy.abs(self.coords[:, 0]) <= 180.0) and
+                              numpy.all(numpy.abs(self.coords[:, 1]) <= 90.0))
+        self.geographic = geographic
+        if len(self.plotIds) == 0 or numpy.any(numpy.diff(self.offsets) < 3):
+            return
+        self.center = self.coords.mean(axis=0)
+        self._build(self._project(self.coords))
+
+    @classmethod
+    def from_corners(cls, plotIds, corners, geographic=None, tolerance=defaultTolerance):
+        # Build a PlotLattice from an (N,4,2) array of plot corners e.g. the plot_map C2_1, C2_2, C1_2, C1_1 columns
+        corners = numpy.asarray(corners, dtype=numpy.float64).reshape(-1, 4, 2)
+        return cls(plotIds, corners.reshape(-1, 2), numpy.arange(0, 4 * len(corners) + 1, 4), geographic, tolerance)
+
+    def __len__(self):
+        return len(self.plotIds)
+
+    def _project(self, points):
+        # Return the positions in local meters (geographic) or unchanged (UTM), relative to the field center
+        points = numpy.asarray(points, dtype=numpy.float64).reshape(-1, 2) - self.center
+        if self.geographic:
+            points = points * (metersPerDegreeLongitude * math.cos(math.radians(self.center[1])),
+                               metersPerDegreeLatitude)
+        return points
+
+    def _build(self, corners):
+        plotCount = len(self.plotIds)
+        starts = self.offsets[:-1]
+        cornerCounts = numpy.diff(self.offsets)
+        cornerPlots = numpy.repeat(numpy.arange(plotCount), cornerCounts)
+
+        # Detect the grid rotation from the plot edge directions. Angles are multiplied by 4 so that all four edges of a
+        # rectangle give the same direction.
+
+        nextCorner = numpy.arange(1, len(corners) + 1)
+        nextCorner[self.offsets[1:] - 1] = starts
+        edges = corners[nextCorner] - corners
+        edgeLengths = numpy.hypot(edges[:, 0], edges[:, 1])
+        angles = 4.0 * numpy.arctan2(edges[:, 1], edges[:, 0])
+        self.rotation = math.atan2(numpy.sum(edgeLengths * numpy.sin(angles)),
+                                   numpy.sum(edgeLengths * numpy.cos(angles))) / 4.0
+        self.axisU = numpy.array([math.cos(self.rotation), math.sin(self.rotation)])
+        self.axisV = numpy.array([-math.sin(self.rotation), math.cos(self.rotation)])
+
+        # The rectangle of each plot (min u, min v, max u, max v) and the largest distance between a plot corner and the
+        # closest rectangle corner. A plot is regular when it has 4 corners, one near each rectangle corner.
+
+        u = corners.dot(self.axisU)
+        v = corners.dot(self.axisV)
+        bounds = numpy.column_stack((numpy.minimum.reduceat(u, starts), numpy.minimum.reduceat(v, starts),
+                                     numpy.maximum.reduceat(u, starts), numpy.maximum.reduceat(v, starts)))
+        cornerBounds = bounds[cornerPlots]
+        nearMaxU = u - cornerBounds[:, 0] > cornerBounds[:, 2] - u
+        nearMaxV = v - cornerBounds[:, 1] > cornerBounds[:, 3] - v
+        deviations = numpy.hypot(u - numpy.where(nearMaxU, cornerBounds[:, 2], cornerBounds[:, 0]),
+                                 v - numpy.where(nearMaxV, cornerBounds[:, 3], cornerBounds[:, 1]))
+        bands = numpy.maximum.reduceat(deviations, starts) + self.tolerance
+        cornerTypes = numpy.bincount(cornerPlots * 4 + nearMaxU * 2 + nearMaxV, minlength=4 * plotCount)
+        regular = (cornerCounts == 4) & numpy.all(cornerTypes.reshape(-1, 4) == 1, axis=1)
+        regular &= bands < 0.25 * numpy.minimum(bounds[:, 2] - bounds[:, 0], bounds[:, 3] - bounds[:, 1])
+
+        centersU = (bounds[:, 0] + bounds[:, 2]) / 2.0
+        centersV = (bounds[:, 1] + bounds[:, 3]) / 2.0
+        self.spacingU = detect_spacing(centersU, bounds[:, 2] - bounds[:, 0], self.tolerance)
+        self.spacingV = detect_spacing(centersV, bounds[:, 3] - bounds[:, 1], self.tolerance)
+        phaseU = detect_phase(centersU, self.spacingU)
+        phaseV = detect_phase(centersV, self.spacingV)
+
+        # Plots whose center is not close to a grid point are not part of the grid
+
+        lineU = numpy.round((centersU - phaseU) / self.spacingU)
+        lineV = numpy.round((centersV - phaseV) / self.spacingV)
+        regular &= numpy.abs(centersU - phaseU - lineU * self.spacingU) < 0.25 * self.spacingU
+        regular &= numpy.abs(centersV - phaseV - lineV * self.spacingV) < 0.25 * self.spacingV
+
+        # Grid cells are centered on the grid points and cover every plot
+
+        firstU = numpy.floor((bounds[:, 0] - bands - phaseU) / self.spacingU + 0.5).min()
+        firstV = numpy.floor((bounds[:, 1] - bands - phaseV) / self.spacingV + 0.5).min()
+        self.originU = phaseU + (firstU - 0.5) * self.spacingU
+        self.originV = phaseV + (firstV - 0.5) * self.spacingV
+        firstRows = numpy.floor((bounds[:, 0] - bands - self.originU) / self.spacingU).astype(numpy.int64)
+        lastRows = numpy.floor((bounds[:, 2] + bands - self.originU) / self.spacingU).astype(numpy.int64)
+        firstRanges = numpy.floor((bounds[:, 1] - bands - self.originV) / self.spacingV).astype(numpy.int64)
+        lastRanges = numpy.floor((bounds[:, 3] + bands - self.originV) / self.spacingV).astype(numpy.int64)
+        rowCount = int(lastRows.max()) + 1
+        rangeCount = int(lastRanges.max()) + 1
+        if rowCount * rangeCount > 100 * plotCount + 10000:
+            print('*** Warning*** The plots do not form a regular grid. Plots will be located using the plot polygons.')
+            return
+
+        plotRows = (lineU - firstU).astype(numpy.int64)
+        plotRanges = (lineV - firstV).astype(numpy.int64)
+        table = numpy.full((rowCount, rangeCount), noPlot, dtype=numpy.int64)
+        cellCounts = numpy.zeros((rowCount, rangeCount), dtype=numpy.int64)
+        numpy.add.at(cellCounts, (plotRows[regular], plotRanges[regular]), 1)
+        regular &= cellCounts[plotRows, plotRanges] == 1
+        table[plotRows[regular], plotRanges[regular]] = numpy.flatnonzero(regular)
+
+        # Cells reached by a plot other than the plot of the cell are tested against the polygons
+
+        spills = ~regular | (firstRows != plotRows) | (lastRows != plotRows) | (firstRanges != plotRanges) | \
+            (lastRanges != plotRanges)
+        for plotIndex in numpy.flatnonzero(spills).tolist():
+            cells = (slice(max(firstRows[plotIndex], 0), lastRows[plotIndex] + 1),
+                     slice(max(firstRanges[plotIndex], 0), lastRanges[plotIndex] + 1))
+            if regular[plotIndex]:
+                ownCell = table[plotRows[plotIndex], plotRanges[plotIndex]]
+                table[cells] = polygonCell
+                table[plotRows[plotIndex], plotRanges[plotIndex]] = ownCell
+            else:
+                table[cells] = polygonCell
+
+        self.table = table
+        self.bounds = bounds
+        self.bands = bands
+        self.regular = regular
+
+    def locator(self):
+        # Return the PlotLocator of the plot polygons used near plot borders and for irregular plots
+        if self._locator is None:
+            self._locator = PlotLocator(self.plotIds, polygons_from_rings(self.coords, self.offsets))
+        return self._locator
+
+    def _grid_coordinates(self, positions):
+        # Return the position of the positions along the two grid axes
+        points = self._project(positions)
+        return points.dot(self.axisU), points.dot(self.axisV)
+
+    def cells(self, positions):
+        # Return the (row, range) grid cell of each position. Rows run along the grid axis closest to the x axis.
+        u, v = self._grid_coordinates(positions)
+        rows = numpy.floor((u - self.originU) / self.spacingU).astype(numpy.int64)
+        ranges = numpy.floor((v - self.originV) / self.spacingV).astype(numpy.int64)
+        return rows, ranges
+
+    def locate_indexes(self, positions):
+        #
+        # Return the index of the plot containing each position of an (N, 2) array (x, y or longitude, latitude), or -1
+        # for a position that is not inside a plot.
+        #
+        positions = numpy.asarray(positions, dtype=numpy.float64).reshape(-1, 2)
+        plotIndexes = numpy.full(len(positions), noPlot, dtype=numpy.int64)
+        if len(positions) == 0 or len(self.plotIds) == 0:
+            return plotIndexes
+        if self.table is None:
+            return self.locator().locate_indexes(positions)
+
+        u, v = self._grid_coordinates(positions)
+        rows = numpy.floor((u - self.originU) / self.spacingU).astype(numpy.int64)
+        ranges = numpy.floor((v - self.originV) / self.spacingV).astype(numpy.int64)
+        inGrid = (rows >= 0) & (rows < self.table.shape[0]) & (ranges >= 0) & (ranges < self.table.shape[1])
+        cells = numpy.full(len(positions), noPlot, dtype=numpy.int64)
+        cells[inGrid] = self.table[rows[inGrid], ranges[inGrid]]
+
+        # Positions in the cell of a regular plot: inside the rectangle less the border band is in the plot, outside
+        # the rectangle plus the border band is not in any plot
+
+        gridIndex = numpy.flatnonzero(cells >= 0)
+        plots = cells[gridIndex]
+        bounds = self.bounds[plots]
+        bands = self.bands[plots]
+        gridU = u[gridIndex]
+        gridV = v[gridIndex]
+        inside = ((gridU > bounds[:, 0] + bands) & (gridU < bounds[:, 2] - bands) &
+                  (gridV > bounds[:, 1] + bands) & (gridV < bounds[:, 3] - bands))
+        outside = ((gridU < bounds[:, 0] - bands) | (gridU > bounds[:, 2] + bands) |
+                   (gridV < bounds[:, 1] - bands) | (gridV > bounds[:, 3] + bands))
+        plotIndexes[gridIndex[inside]] = plots[inside]
+
+        polygonIndex = numpy.concatenate((numpy.flatnonzero(cells == polygonCell), gridIndex[~inside & ~outside]))
+        if len(polygonIndex) > 0:
+            plotIndexes[polygonIndex] = self.locator().locate_indexes(positions[polygonIndex])
+        return plotIndexes
+
+    def locate(self, positions):
+        # Return the plot ID of the plot containing each position, or None for positions that are not inside a plot
+        plotIndexes = self.locate_indexes(positions)
+        plotIds = numpy.empty(len(plotIndexes), dtype=object)
+        found = plotIndexes >= 0
+        plotIds[found] = self.plotIds[plotIndexes[found]]
+        return plotIds
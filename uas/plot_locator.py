@@ -0,0 +1,141 @@
+#
+# Version 0.1 October 2018
+#
+# This is a module that contains the PlotLocator class used to find the plot that contains each image position.
+#
+# The plot polygons are stored in a shapely STRtree. All positions of an image set are located in one call: the tree
+# returns every plot whose bounding box contains a position (not only the plot with the nearest centroid) and the
+# candidates are tested with prepared polygons. With shapely 2 the query and the containment test are vectorized; with
+# shapely 1.x each position is queried in turn.
+#
+# line_crossings finds the plots crossed by lines (e.g. the flight path along a range) the same way and returns them in
+# the order they are crossed, with the fraction of the line at which each plot is entered and left.
+#
+
+from __future__ import print_function
+from __future__ import division
+
+import numpy
+import shapely
+from shapely.strtree import STRtree
+from shapely.prepared import prep
+from shapely.geometry import Point, Polygon
+
+vectorizedShapely = hasattr(shapely, 'points')
+
+
+def polygons_from_rings(coords, offsets):
+    # Return the list of polygons whose exterior rings are coords[offsets[i]:offsets[i + 1]]
+    coords = numpy.asarray(coords, dtype=numpy.float64).reshape(-1, 2)
+    offsets = numpy.asarray(offsets, dtype=numpy.int64)
+    if vectorizedShapely and len(offsets) > 1:
+        ringIndex = numpy.repeat(numpy.arange(len(offsets) - 1), numpy.diff(offsets))
+        return list(shapely.polygons(shapely.linearrings(coords, indices=ringIndex)))
+    return [Polygon(coords[start:stop].tolist()) for start, stop in zip(offsets[:-1].tolist(), offsets[1:].tolist())]
+
+
+class PlotLocator(object):
+    '''Spatial index of plot polygons used to find the plot containing each of a set of positions.'''
+
+    def __init__(self, plotIds, polygons):
+        self.plotIds = numpy.array(list(plotIds), dtype=object)
+        self.polygons = list(polygons)
+        if vectorizedShapely:
+            shapely.prepare(self.polygons)
+        else:
+            self.preparedPolygons = [prep(polygon) for polygon in self.polygons]
+            self.polygonIndex = dict((id(polygon), index) for index, polygon in enumerate(self.polygons))
+        self.tree = STRtree(self.polygons)
+
+    @classmethod
+    def from_plots(cls, plots):
+        # Build a PlotLocator from the plot dictionary (plot_id: [plot_id, polygon, centroid]) used by the HTP programs
+        plotIds = list(plots.keys())
+        return cls(plotIds, [plots[plotId][1] for plotId in plotIds])
+
+    def __len__(self):
+        return len(self.polygons)
+
+    def locate_indexes(self, positions):
+        #
+        # Return the index of the plot containing each (longitude, latitude) position of an (N, 2) array, or -1 for a
+        # position that is not inside a plot. A position inside overlapping plots is assigned the first plot.
+        #
+        positions = numpy.asarray(positions, dtype=numpy.float64).reshape(-1, 2)
+        plotIndexes = numpy.full(len(positions), -1, dtype=numpy.int64)
+        if len(positions) == 0 or len(self.polygons) == 0:
+            return plotIndexes
+
+        if vectorizedShapely:
+            points = shapely.points(positions)
+            pointIndexes, treeIndexes = self.tree.query(points, predicate='within')
+            # Keep the first (lowest index) plot for each position
+            order = numpy.lexsort((treeIndexes, pointIndexes))
+            pointIndexes = pointIndexes[order]
+            treeIndexes = treeIndexes[order]
+            first = numpy.ones(len(pointIndexes), dtype=bool)
+            first[1:] = pointIndexes[1:] != pointIndexes[:-1]
+            plotIndexes[pointIndexes[first]] = treeIndexes[first]
+        else:
+            for pointIndex, (lon, lat) in enumerate(positions.tolist()):
+                point = Point(lon, lat)
+                candidates = sorted(self.polygonIndex[id(polygon)] for polygon in self.tree.query(point))
+                for candidate in candidates:
+                    if self.preparedPolygons[candidate].contains(point):
+                        plotIndexes[pointIndex] = candidate
+                        break
+        return plotIndexes
+
+    def locate(self, positions):
+        # Return the plot ID of the plot containing each (longitude, latitude) position, or None for positions that
+        # are not inside a plot
+        plotIndexes = self.locate_indexes(positions)
+        plotIds = numpy.empty(len(plotIndexes), dtype=object)
+        found = plotIndexes >= 0
+        plotIds[found] = self.plotIds[plotIndexes[found]]
+        return plotIds
+
+    def line_crossings(self, lines):
+        #
+        # Return the plots crossed by each line as a list (one per line) of (plot index, entry, exit) tuples ordered
+        # along the line. entry and exit are the fractions (0..1) of the line length at which the line enters and
+        # leaves the plot.
+        #
+        lines = list(lines)
+        crossings = [[] for line in lines]
+        if len(lines) == 0 or len(self.polygons) == 0:
+            return crossings
+
+        if vectorizedShapely:
+            lineArray = numpy.array(lines, dtype=object)
+            lineIndexes, plotIndexes = self.tree.query(lineArray, predicate='intersects')
+            if len(lineIndexes) == 0:
+                return crossings
+            polygonArray = numpy.array(self.polygons, dtype=object)
+            overlaps = shapely.intersection(lineArray[lineIndexes], polygonArray[plotIndexes])
+            coords, overlapIndexes = shapely.get_coordinates(overlaps, return_index=True)
+            fractions = shapely.line_locate_point(lineArray[lineIndexes[overlapIndexes]], shapely.points(coords),
+                                                  normalized=True)
+            entries = numpy.full(len(lineIndexes), numpy.inf)
+            exits = numpy.full(len(lineIndexes), -numpy.inf)
+            numpy.minimum.at(entries, overlapIndexes, fractions)
+            numpy.maximum.at(exits, overlapIndexes, fractions)
+            crossed = numpy.isfinite(entries)
+            for lineIndex, plotIndex, entry, exit in zip(lineIndexes[crossed].tolist(), plotIndexes[crossed].tolist(),
+                                                         entries[crossed].tolist(), exits[crossed].tolist()):
+                crossings[lineIndex].append((plotIndex, entry, exit))
+        else:
+            for lineIndex, line in enumerate(lines):
+                for polygon in self.tree.query(line):
+                    plotIndex = self.polygonIndex[id(polygon)]
+                    if not self.preparedPolygons[plotIndex].intersects(line):
+                        continue
+                    overlap = line.intersection(polygon)
+                    parts = getattr(overlap, 'geoms', [overlap])
+                    fractions = [line.project(Point(coord), normalized=True) for part in parts for coord in part.coords]
+                    if len(fractions) > 0:
+                        crossings[lineIndex].append((plotIndex, min(fractions), max(fractions)))
+
+        for lineCrossings in crossings:
+            lineCrossings.sort(key=lambda crossing: (crossing[1], crossing[2], crossing[0]))
+        return crossings
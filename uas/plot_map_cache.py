@@ -0,0 +1,202 @@
+#
+# Version 0.1 October 2018
+#
+# This is a module that contains the local cache of plot_map polygons used by the HTP UAS programs.
+#
+# The plot polygons of an experiment prefix (e.g. 18ASH%) are stored in a compact .npz file in the cache folder:
+#
+#   plotIds     Plot IDs
+#   coords      (M,2) array of the exterior ring coordinates of all plots (longitude, latitude)
+#   offsets     Start of the ring of each plot in coords (plus the end of the last ring)
+#   bboxes      (N,4) array of plot bounding boxes (min x, min y, max x, max y)
+#   stamp       Row count and maximum record_id of the plot_map rows the file was built from
+#
+# When the database is available only the row count and maximum record_id of the prefix are queried; the polygons are
+# queried and parsed from WKT again only when they have changed. When the database is not available (e.g. processing in
+# the field) the cached plot map is used as is. The plot polygons and their STRtree (see plot_locator.py) are rebuilt
+# from the stored coordinate arrays, which takes milliseconds.
+#
+
+from __future__ import print_function
+from __future__ import division
+
+import os
+import re
+import hashlib
+import numpy
+import shapely
+from shapely import wkt
+
+from plot_locator import PlotLocator, polygons_from_rings
+from plot_lattice import PlotLattice
+
+cacheVersion = 1
+defaultCacheFolder = os.path.join(os.path.expanduser('~'), '.htp', 'plot_map')
+
+plotStampQuery = ("SELECT COUNT(*), MAX(record_id) FROM plot_map WHERE plot_id LIKE %s")
+plotPolygonQuery = ("SELECT plot_id, ST_AsText(plot_polygon) FROM plot_map WHERE plot_id LIKE %s ORDER BY plot_id")
+
+vectorizedShapely = hasattr(shapely, 'points')
+
+
+class PlotMap(object):
+    '''Plot polygons of an experiment prefix stored as coordinate arrays.'''
+
+    def __init__(self, prefix, stamp, plotIds, coords, offsets):
+        self.prefix = prefix
+        self.stamp = tuple(int(value) for value in stamp)
+        self.plotIds = [str(plotId) for plotId in plotIds]
+        self.coords = numpy.asarray(coords, dtype=numpy.float64).reshape(-1, 2)
+        self.offsets = numpy.asarray(offsets, dtype=numpy.int64)
+        self._polygons = None
+
+    def __len__(self):
+        return len(self.plotIds)
+
+    def bboxes(self):
+        # Return the (N,4) array of plot bounding boxes
+        if len(self.plotIds) == 0:
+            return numpy.empty((0, 4))
+        starts = self.offsets[:-1]
+        return numpy.column_stack((numpy.minimum.reduceat(self.coords[:, 0], starts),
+                                   numpy.minimum.reduceat(self.coords[:, 1], starts),
+                                   numpy.maximum.reduceat(self.coords[:, 0], starts),
+                                   numpy.maximum.reduceat(self.coords[:, 1], starts)))
+
+    def polygons(self):
+        # Return the list of plot polygons, built from the coordinate arrays on first use
+        if self._polygons is None:
+            self._polygons = polygons_from_rings(self.coords, self.offsets)
+        return self._polygons
+
+    def plots(self):
+        # Return a dictionary of plot_id: plot polygon
+        return dict(zip(self.plotIds, self.polygons()))
+
+    def locator(self):
+        # Return a PlotLocator of the plots
+        return PlotLocator(self.plotIds, self.polygons())
+
+    def lattice(self):
+        # Return a PlotLattice (see plot_lattice.py) of the plots
+        return PlotLattice(self.plotIds, self.coords, self.offsets, True, polygons=self.polygons())
+
+
+def plot_map_cache_path(prefix, utmZone=None, cacheFolder=defaultCacheFolder):
+    # Return the cache file path of a prefix. The prefix is hashed as it may contain characters such as % and _ that
+    # would otherwise make two prefixes share a file name.
+    key = prefix if utmZone is None else prefix + '|utm%d%s' % tuple(utmZone)
+    name = re.sub('[^A-Za-z0-9]', '_', key) + '_' + hashlib.md5(key.encode('utf-8')).hexdigest()[:8]
+    return os.path.join(cacheFolder, name + '.npz')
+
+
+def read_plot_map_cache(cachePath):
+    # Return the cached PlotMap or None if there is no usable cache file
+    try:
+        with numpy.load(cachePath) as cache:
+            if int(cache['version']) != cacheVersion:
+                return None
+            return PlotMap(str(cache['prefix']), cache['stamp'], cache['plotIds'].tolist(), cache['coords'],
+                           cache['offsets'])
+    except (IOError, OSError, KeyError, ValueError):
+        return None
+
+
+def write_plot_map_cache(cachePath, plotMap):
+    # Write the cache file. The file is written under a temporary name first so a partially written file is never read.
+    try:
+        folder = os.path.dirname(cachePath)
+        if not os.path.isdir(folder):
+            os.makedirs(folder)
+        tempPath = cachePath[:-len('.npz')] + '.tmp.npz'
+        numpy.savez(tempPath, version=cacheVersion, prefix=plotMap.prefix, stamp=numpy.array(plotMap.stamp),
+                    plotIds=numpy.array(plotMap.plotIds, dtype=str), coords=plotMap.coords, offsets=plotMap.offsets,
+                    bboxes=plotMap.bboxes())
+        if os.path.exists(cachePath):
+            os.remove(cachePath)
+        os.rename(tempPath, cachePath)
+    except (IOError, OSError) as e:
+        print('*** Warning*** Unable to write plot map cache', cachePath, e)
+
+
+def query_plot_map_stamp(cursor, prefix):
+    # Return the row count and maximum record_id of the plot_map rows of a prefix
+    cursor.execute(plotStampQuery, (prefix,))
+    count, maxRecordId = cursor.fetchone()
+    return int(count), int(maxRecordId) if maxRecordId is not None else 0
+
+
+def ring_coordinates(polygons):
+    # Return the exterior ring coordinates of the polygons as one (M,2) array and the offset of each ring
+    if vectorizedShapely:
+        coords, index = shapely.get_coordinates(shapely.get_exterior_ring(polygons), return_index=True)
+        counts = numpy.bincount(index, minlength=len(polygons))
+    else:
+        rings = [numpy.asarray(polygon.exterior.coords)[:, 0:2] for polygon in polygons]
+        coords = numpy.concatenate(rings) if len(rings) > 0 else numpy.empty((0, 2))
+        counts = numpy.array([len(ring) for ring in rings], dtype=numpy.int64)
+    return coords, numpy.concatenate(([0], numpy.cumsum(counts))).astype(numpy.int64)
+
+
+def query_plot_map(cursor, prefix, utmZone=None, stamp=(0, 0)):
+    #
+    # Query and parse the plot polygons of a prefix. utmZone (e.g. (43, 'R')) is given for plot_map rows stored in UTM
+    # coordinates, which are converted to longitude/latitude.
+    #
+    cursor.execute(plotPolygonQuery, (prefix,))
+    rows = cursor.fetchall()
+    plotIds = [str(row[0]) for row in rows]
+    wktStrings = [row[1] for row in rows]
+    if vectorizedShapely:
+        polygons = shapely.from_wkt(numpy.array(wktStrings, dtype=object))
+    else:
+        polygons = [wkt.loads(wktString) for wktString in wktStrings]
+    coords, offsets = ring_coordinates(polygons)
+
+    if utmZone is not None and len(coords) > 0:
+        import utm
+        lat, lon = utm.to_latlon(coords[:, 0], coords[:, 1], utmZone[0], utmZone[1])
+        coords = numpy.column_stack((lon, lat))
+
+    return PlotMap(prefix, stamp, plotIds, coords, offsets)
+
+
+def open_plot_map_connection(config):
+    # Return a connection to the HTP database or None if the database can not be reached
+    try:
+        import mysql.connector
+        return mysql.connector.connect(user=config.USER, password=config.PASSWORD, host=config.HOST,
+                                       port=config.PORT, database=config.DATABASE, connection_timeout=10)
+    except Exception as e:
+        print('*** Warning*** Unable to connect to the database:', e)
+        return None
+
+
+def load_plot_map(prefix, config=None, utmZone=None, cacheFolder=defaultCacheFolder):
+    #
+    # Return the PlotMap of the plot_map rows with plot_id LIKE prefix.
+    #
+    # The cached plot map is refreshed from the database when the row count or maximum record_id of the prefix has
+    # changed. Without a database connection (config is None or the database can not be reached) the cached plot map is
+    # returned; IOError is raised if the prefix has never been cached.
+    #
+    cachePath = plot_map_cache_path(prefix, utmZone, cacheFolder)
+    plotMap = read_plot_map_cache(cachePath)
+    cnx = open_plot_map_connection(config) if config is not None else None
+    if cnx is None:
+        if plotMap is None:
+            raise IOError('There is no database connection and no cached plot map for plot prefix ' + prefix)
+        print('Using cached plot map for plot prefix', prefix, cachePath)
+        return plotMap
+
+    try:
+        cursor = cnx.cursor(buffered=True)
+        stamp = query_plot_map_stamp(cursor, prefix)
+        if plotMap is None or plotMap.stamp != stamp:
+            print('Refreshing cached plot map for plot prefix', prefix)
+            plotMap = query_plot_map(cursor, prefix, utmZone, stamp)
+            write_plot_map_cache(cachePath, plotMap)
+        cursor.close()
+    finally:
+        cnx.close()
+    return plotMap
@@ -7,7 +7,8 @@ import os
 import argparse
 from datetime import datetime
 import errno
-import exiftool
+from exiftool_service import get_exiftool # One exiftool process is used for all EXIF reads and writes
+from transfer_engine import transfer_files, report_transfer_failures
 import shutil
 import numpy
 import cv2 # Installed with pip3 install opencv-python
@@ -294,19 +295,25 @@ except OSError as exception:
 # Rename and copy into Renamed directory
 alti = [] # altitude
 finalImList.sort()
-for im in finalImList:
+exifTool = get_exiftool()
+imTags = exifTool.get_tags(finalImList, ['EXIF:DateTimeOriginal', 'GPS:GPSAltitude']) # Tags of all images at once
+copies = []
+for im, tags in zip(finalImList, imTags):
     imObj = im.split(os.sep)  # os.sep for platform independence
     numOfObj = len(imObj)
     imFile = imObj[numOfObj-1]
-    with exiftool.ExifTool() as et:
-        dtTags = et.get_tag('EXIF:DateTimeOriginal',im)
-        exifAlti = float(et.get_tag('GPS:GPSAltitude',im))
-        if exifAlti > 0:
-            alti.append(exifAlti)
+    dtTags = tags['DateTimeOriginal']
+    exifAlti = float(tags['GPSAltitude'])
+    if exifAlti > 0:
+        alti.append(exifAlti)
     dtTags = ''.join(dtTags.split(":")).replace(" ","_")
     tgFile = filePath + os.sep + "renamed" + os.sep + dtTags +"_" + imFile  # os.sep for platform independence
-    newFile = shutil.copy2(im,tgFile)
-    print("Copying %s" % newFile)
+    copies.append((im, tgFile, None))
+# Copy the images concurrently, computing the checksum of each image while it is copied (see transfer_engine.py)
+copied, copyFailures = transfer_files(copies)
+for result in copied:
+    print("Copying %s" % result.target)
+report_transfer_failures(copyFailures)
 #------------------------------------------------------------------------
 # Calculate altitude
 alti_min = numpy.min(alti)
@@ -328,22 +335,22 @@ for im in renamedIm:
     if im.find("_1.tif") != -1:
         blueIm.append(im)
 acc = 0
-with exiftool.ExifTool() as et:
-    for im in blueIm:
-        alti = float(et.get_tag('GPS:GPSAltitude',filePath + os.sep + "renamed" + os.sep+im))
-        if alti < alti_th:
-            # Move to low directory
-            newFile = shutil.move(filePath + os.sep + "renamed" + os.sep+im, filePath + os.sep + "low_altitude" + os.sep+im)
-            print("Moving %s" % newFile)
-            newFile = shutil.move(filePath + os.sep + "renamed" + os.sep+im.replace("_1.tif","_2.tif"), filePath + os.sep + "low_altitude" + os.sep+im.replace("_1.tif","_2.tif"))
-            print("Moving %s" % newFile)
-            newFile = shutil.move(filePath + os.sep + "renamed" + os.sep+im.replace("_1.tif","_3.tif"), filePath + os.sep + "low_altitude" + os.sep+im.replace("_1.tif","_3.tif"))
-            print("Moving %s" % newFile)
-            newFile = shutil.move(filePath + os.sep + "renamed" + os.sep+im.replace("_1.tif","_4.tif"), filePath + os.sep + "low_altitude" + os.sep+im.replace("_1.tif","_4.tif"))
-            print("Moving %s" % newFile)
-            newFile = shutil.move(filePath + os.sep + "renamed" + os.sep+im.replace("_1.tif","_5.tif"), filePath + os.sep + "low_altitude" + os.sep+im.replace("_1.tif","_5.tif"))
-            print("Moving %s" % newFile)
-            acc += 5
+blueTags = exifTool.get_tags([filePath + os.sep + "renamed" + os.sep+im for im in blueIm], ['GPS:GPSAltitude'])
+for im, tags in zip(blueIm, blueTags):
+    alti = float(tags['GPSAltitude'])
+    if alti < alti_th:
+        # Move to low directory
+        newFile = shutil.move(filePath + os.sep + "renamed" + os.sep+im, filePath + os.sep + "low_altitude" + os.sep+im)
+        print("Moving %s" % newFile)
+        newFile = shutil.move(filePath + os.sep + "renamed" + os.sep+im.replace("_1.tif","_2.tif"), filePath + os.sep + "low_altitude" + os.sep+im.replace("_1.tif","_2.tif"))
+        print("Moving %s" % newFile)
+        newFile = shutil.move(filePath + os.sep + "renamed" + os.sep+im.replace("_1.tif","_3.tif"), filePath + os.sep + "low_altitude" + os.sep+im.replace("_1.tif","_3.tif"))
+        print("Moving %s" % newFile)
+        newFile = shutil.move(filePath + os.sep + "renamed" + os.sep+im.replace("_1.tif","_4.tif"), filePath + os.sep + "low_altitude" + os.sep+im.replace("_1.tif","_4.tif"))
+        print("Moving %s" % newFile)
+        newFile = shutil.move(filePath + os.sep + "renamed" + os.sep+im.replace("_1.tif","_5.tif"), filePath + os.sep + "low_altitude" + os.sep+im.replace("_1.tif","_5.tif"))
+        print("Moving %s" % newFile)
+        acc += 5
 print("%d files moved to low_altitude" % acc)
 with open(logname, 'a') as logoutput:
     logoutput.write("%d files moved to low_altitude\n" % acc)
@@ -352,9 +359,6 @@ with open(logname, 'a') as logoutput:
 
 if acc > 0:
     imageFiles = os.listdir(filePath + os.sep + "low_altitude" )
-    exiftoolPath = None
-    if os.name == 'nt':
-        exiftoolPath = 'D:/ExifTool/exiftool.exe'
     # Sum of each band's radiance 
     sbr_B = 0
     sbr_G = 0
@@ -372,7 +376,7 @@ if acc > 0:
         imageName = filePath + os.sep + "low_altitude" + os.sep+im
         imageRaw=plt.imread(imageName)
         print("Processing %s" % imageName)
-        meta = metadata.Metadata(imageName, exiftoolPath=exiftoolPath)
+        meta = metadata.Metadata(imageName, exiftool_obj=exifTool)
         bandName = meta.get_item('XMP:BandName')
         radianceImage, L, V, R = msutils.raw_image_to_radiance(meta, imageRaw)
         panel_coords = panelDetect(imageName, black_th, cont_th)
@@ -477,7 +481,7 @@ rawImages.sort()
 for im in rawImages:
     print("Calibrating: %s" % filePath + os.sep + "renamed" + os.sep+im)
     flightImageRaw=plt.imread(filePath + os.sep + "renamed" + os.sep+im)
-    meta = metadata.Metadata(filePath + os.sep + "renamed" + os.sep+im, exiftoolPath=exiftoolPath)
+    meta = metadata.Metadata(filePath + os.sep + "renamed" + os.sep+im, exiftool_obj=exifTool)
     bandName = meta.get_item('XMP:BandName')
     bitsPerPixel = meta.get_item('EXIF:BitsPerSample')
     dnMax = float(2**bitsPerPixel)
@@ -496,12 +500,9 @@ rawImages.sort()
 for im in rawImages:
     renameImgPath=os.path.join(renamePath,im)
     calImgPath=os.path.join(calPath,im)
-    os.system("exiftool -tagsFromFile %s %s" % (renameImgPath,calImgPath)) # Update EXIF from /renamed/IMG_nnnn_n.tif and Creates IMG_nnnn_n.tif_original
-    tif_origPath = calImgPath.replace(".tif", ".tif_original")# Replace path IMG_nnnn_n.tif with IMG_nnnn_n.tif_original
-    os.remove(tif_origPath)# Delete temporary file IMG_nnnn_n.tif_original
+    exifTool.copy_tags(renameImgPath, calImgPath) # Update EXIF from /renamed/IMG_nnnn_n.tif (no IMG_nnnn_n.tif_original is kept)
     # Copy XMP:
-    os.system("exiftool -xmp -b %s > %s" % (renameImgPath, calImgPath.replace(".tif", ".xmp"))) # Create temporary file IMG_nnnn_n.xmp
-    os.system("exiftool -tagsfromfile %s -xmp %s" % (calImgPath.replace(".tif", ".xmp"), calImgPath)) # Creates IMG_nnnn_n.tif from IMG_nnnn_n.xmp
+    exifTool.copy_tags(renameImgPath, calImgPath, ['xmp']) # Copy the XMP block of /renamed/IMG_nnnn_n.tif without a temporary .xmp file
 # Cleanup: Remove temporary files *.xmp and *.tif_original
 for img in os.listdir(calPath):
     if img.endswith(".xmp"):
@@ -36,7 +36,7 @@ import time
 import math
 import sys
 import argparse
-import exifread
+from exif_reader import read_exif
 
 # Declare Tags for image EXIF data
 
@@ -129,26 +129,15 @@ def getcamevents(fcamTriggerList):
 
 def get_image_exif_datetime(ifilename):
 
-    tags = exifread.process_file(image)
+    tags = read_exif(ifilename)
 
     try:
 
     # Get Camera Image Date and Time
 
-        dateStr=str(tags[gpsDateTag])
-        year,month,day = dateStr.split(':')
-        fcam_sample_date=year+month+day
-
-        timeStrLen = len(str(tags[gpsTimeTag]))-1
-        timeStr = str(tags[gpsTimeTag])[1:timeStrLen]
-        if '/' in timeStr:
-            hrs, mins, secsFract = timeStr.split(', ')
-            secsNum,secsDenom = secsFract.split('/')
-            secs = str(int(secsNum)/int(secsDenom))
-        else:
-            hrs, mins, secs = timeStr.split(', ')
-
-        fcam_sample_time=hrs.zfill(2)+mins.zfill(2)+secs.zfill(2)
+        fcam_sample_date=tags['GPSDate'].replace(':','')
+        hrs, mins, secs = tags['GPSTimeStamp']
+        fcam_sample_time='%02d%02d%02d' % (hrs, mins, secs)
 
 
     except Exception,e:
@@ -2,6 +2,11 @@
 #
 # Program: segment_x5_video_by_range_kd_tree
 #
+# Version: 0.3 October 2018  Plots of each range are listed in the order they are flown over and the time window of
+#                             each plot within the video is written to RangePlotWindows.csv. Waypoints are matched
+#                             to the log in UTM coordinates and in time order. Segments can be cut in parallel
+#                             with --execute at frame accurate cut points.
+#
 # Version: 0.2 May 4,2017  Added capability to identify plots associated with each video segment.
 #
 # Version: 0.1 February 22,2017
@@ -9,7 +14,7 @@
 # This program will generate the data necessary to segment a video taken by a UAV which traverses a field by range.
 #
 # It first constructs a KD tree of all timestamped positions recorded in a DJI UAV log file and then queries the
-# KD Tree for each waypoint in the UAV flight plan to determine the point in the logfile that is nearest to the
+# KD Tree for all waypoints in the UAV flight plan to determine the point in the logfile at which the UAV reached each
 # waypoint.
 #
 #Command Line Inputs:
@@ -18,9 +23,10 @@
 # '-p' or '--plan':     'Full path to the flight plan file containing the positions of the way points.'
 # '-v' or '--video':    'Full path to the video files to be segmented'
 # '-o' or '--out':      'Output file path to the file containing the timestamped endpoints of each range'
+# '-x' or '--execute':  'Cut the video segments (see video_segmenter.py) instead of only writing the .sh command files'
+# '-t' or '--threads':  'Number of segments cut at once'
 
 from math import radians, cos, sin, asin, sqrt
-from scipy.spatial import cKDTree
 import numpy
 import sys
 import datetime
@@ -33,27 +39,17 @@ import config
 import time
 import os
 import logging
-import utm
+
+from flight_log_cache import load_flight_log
+from plot_map_cache import load_plot_map
+from waypoint_rendezvous import read_flight_plan, find_waypoint_rendezvous
+from video_segmenter import Segment, VideoSegmenter, defaultThreads, find_video_tools
+from keyframe_index import load_keyframe_index
+from exiftool_service import get_exiftool
 
 from shapely import wkt
 from shapely.geometry import Point, LineString, Polygon
 
-def convert_polygon_coord_system(plt):
-    LonLatCoordString = 'POLYGON(('
-    coordString=plt[9:-2]
-    coords=coordString.split(',')
-    for pos in coords:
-        coordPair=str(pos).split(' ')
-        x=float(coordPair[0])
-        y=float(coordPair[1])
-        latLonPosition=utm.to_latlon(x,y,43,'R')
-        latCoord=str(latLonPosition[0])
-        lonCoord=str(latLonPosition[1])
-        LonLatCoordString+=lonCoord + ' ' + latCoord + ','
-    LonLatPlt=LonLatCoordString[0:-1] + '))'
-    return LonLatPlt
-
-
 def setup_logging(output_path, file_log_level, console_log_level):
     '''Setup logging. Always to log file, optionally to command line if console_level isn't None. Return log.'''
 
@@ -125,14 +121,8 @@ def commit_and_close_db_connection(cursor,cnx):
 
 
 
-def filter_log_by_isTakingVideo(logPath): # Generator function to filter log to include only lines with isTakingVideo=1
-    with open(logPath, 'rU') as log:
-        header = next(log)  # Skip the header row
-        for row in log:
-            rowFields = row.split(',')
-            isTakingVideo = rowFields[37]
-            if isTakingVideo == '1':
-                yield row
+def filter_log_by_isTakingVideo(flightLogColumns): # Filter the log to include only rows with isTakingVideo=1
+    return flightLogColumns[flightLogColumns.isTakingVideo]
 
 
 def haversine_distance(lon1, lat1, lon2, lat2):
@@ -152,53 +142,13 @@ def haversine_distance(lon1, lat1, lon2, lat2):
     return c * r
 
 def get_video_exif(videoFileName):
-    videoLat = ''
-    videoLon = ''
-    videoDate = ''
-    videoTime = ''
-    videoDuration = ''
-    exifPath = ''
-
-#    whichCmd=['which','exiftool']
-#    exiftoolPath=subprocess.check_output(['which','exiftool'])
-#    for char in exiftoolPath:
-#        if char != '\n':
-#            exifPath += char
-#    print exifPath
-
-#    proc = subprocess.Popen(['which','exiftool'],stdout=subprocess.PIPE)
-#    tmp = proc.stdout.read()
-
-    latCmd=['/usr/local/bin/exiftool', '-n', '-gpsLatitude', videoFileName]
-    gpsVideoLat=subprocess.check_output(latCmd)
-    for char in gpsVideoLat:
-        if char != '\n':
-            videoLat += char
-    vlat = float(videoLat.split(': ')[1])
-
-    lonCmd=['/usr/local/bin/exiftool', '-n', '-gpsLongitude', videoFileName]
-    gpsVideoLon=subprocess.check_output(lonCmd)
-    for char in gpsVideoLon:
-        if char != '\n':
-            videoLon += char
-    vlon = float(videoLon.split(': ')[1])
-
-    dateCmd=['/usr/local/bin/exiftool', '-n', '-trackcreatedate', videoFileName]
-    gpsVideoDate=subprocess.check_output(dateCmd)
-    for char in gpsVideoDate:
-        if char != '\n':
-            videoDate += char
-    vdateTime = videoDate.split(': ')[1]
-    vdate=vdateTime.split(' ')[0]
-    vtime = vdateTime.split(' ')[1]
-    timeCmd=['/usr/local/bin/exiftool', '-n', '-trackcreatetime', videoFileName]
-
-    durationCmd = ['/usr/local/bin/exiftool', '-n', '-duration', videoFileName]
-    gpsVideoDuration = subprocess.check_output(durationCmd)
-    for char in gpsVideoDuration:
-        if char != '\n':
-            videoDuration += char
-    vduration = videoDuration.split(': ')[1]
+    # Read the video start position, date, time and duration with one command of the shared exiftool process
+    videoTags = get_exiftool().get_tags([videoFileName], ['GPSLatitude', 'GPSLongitude', 'TrackCreateDate',
+                                                          'Duration'])[0]
+    vlat = float(videoTags['GPSLatitude'])
+    vlon = float(videoTags['GPSLongitude'])
+    vdate, vtime = str(videoTags['TrackCreateDate']).split(' ')[0:2]
+    vduration = str(videoTags['Duration'])
 
     return vlat,vlon,vdate,vtime,vduration
 
@@ -218,6 +168,8 @@ cmdline.add_argument('-l', '--log', help='Flight Log File Name')
 cmdline.add_argument('-p', '--plan', help='Flight Plan File Name')
 cmdline.add_argument('-v', '--vid', help='Flight Video File Name')
 cmdline.add_argument('-c', '--cmd', help='Video Segmentation Command File Path')
+cmdline.add_argument('-x', '--execute', action='store_true', help='Cut the video segments into the flight data folder')
+cmdline.add_argument('-t', '--threads', type=int, default=defaultThreads, help='Number of segments cut at once')
 
 args = cmdline.parse_args()
 
@@ -231,31 +183,23 @@ videoFile = args.vid
 videoPath = args.inp + videoFile
 cmdPath = args.cmd
 plotRangePath=flightDataPath + 'RangePlotIntersections.csv'
+plotWindowsPath=flightDataPath + 'RangePlotWindows.csv'
 lineSegmentsPath=flightDataPath + 'RangeLineSegments.csv'
 
 
 
-# Query the database for the plot polygons and store them in a dictionary with plot_id as key
-
-cursor, cnx = open_db_connection(config)
-plotQuery=("SELECT plot_id,ST_AsText(plot_polygon) FROM plot_map WHERE plot_id LIKE %s")
+# Load the plot polygons from the local plot map cache and store them in a dictionary with plot_id as key.
+# The plot_map polygons of these plots are stored in UTM zone 43R coordinates and are converted to longitude/latitude
+# when the cache is refreshed.
 
 try:
-    cursor.execute(plotQuery, (plotPrefix,))
-    if cursor.rowcount != 0:
-        for row in cursor:
-            plotId=row[0]
-            plotPolygon=row[1]
-            LonLatPlt = convert_polygon_coord_system(plotPolygon)
-            plt=wkt.loads(LonLatPlt)
-            plots[plotId]=plt
+    plotMap = load_plot_map(plotPrefix, config, utmZone=(43, 'R'))
+    plots = plotMap.plots()
+    plotLocator = plotMap.locator()
 except:
-    print 'Unexpected error during database query:', sys.exc_info()[0]
+    print 'Unexpected error while loading the plot map:', sys.exc_info()[0]
     sys.exit()
 
-log().info('Committing changes and closing connection to database table: plot_map ')
-commit_and_close_db_connection(cursor, cnx)
-
 # Determine the video start position, date, time and video duration from the video EXIF
 
 latitude,longitude,createDate,createTime,videoDuration=get_video_exif(videoPath)
@@ -274,29 +218,22 @@ print ''
 
 # Determine the video start position, date, time and video duration from the DJI log file
 
-with open (logPath,'rU') as log:
-    header = next(log)  # Skip the header row
-    for row in log:
-        rowFields = row.split(',')
-        isTakingVideo=rowFields[37]
-
-        if isTakingVideo == '1':
+flightLogColumns = load_flight_log(logPath)
+videoLog = filter_log_by_isTakingVideo(flightLogColumns)
 
-            # Record the time elapsed in ms since the flight started
-            elapsedTime = rowFields[10]
-            startTime = float(elapsedTime)
+# Record the time elapsed in ms since the flight started
+elapsedTime = int(videoLog.elapsed[0])
+startTime = float(elapsedTime)
 
-            # Convert the timestamp to UTC time
-            timestamp = int(rowFields[43])
-            dateTimeStr = datetime.datetime.utcfromtimestamp(timestamp / 1000.0).strftime('%Y/%m/%d %H:%M:%S.%f')
-            #dateTimeStrLocal = datetime.datetime.fromtimestamp(timestamp / 1000.0).strftime('%Y/%m/%d %H:%M:%S.%f')
-            startDateStr = dateTimeStr.split(' ')[0]
-            startTimeStr = dateTimeStr.split(' ')[1]
+# Convert the timestamp to UTC time
+timestamp = int(videoLog.timestamp[0])
+dateTimeStr = datetime.datetime.utcfromtimestamp(timestamp / 1000.0).strftime('%Y/%m/%d %H:%M:%S.%f')
+startDateStr = dateTimeStr.split(' ')[0]
+startTimeStr = dateTimeStr.split(' ')[1]
 
-            # Record the position that the UAV started taking video
-            startLat = float(rowFields[0])
-            startLon = float(rowFields[1])
-            break
+# Record the position that the UAV started taking video
+startLat = float(videoLog.lat[0])
+startLon = float(videoLog.lon[0])
 
 print ''
 print 'Log Video Start Time (utc):          ' , startDateStr,startTimeStr
@@ -318,37 +255,22 @@ print ''
 
 
 
-# Load the flight log and flight plan data into an array structure
-
-videoLines=filter_log_by_isTakingVideo(logPath)
-flightLog=numpy.loadtxt(videoLines,delimiter=',',usecols=(0,1),skiprows=1)
-videoTimeLines=filter_log_by_isTakingVideo(logPath)
-flightLogTime=numpy.loadtxt(videoTimeLines,dtype={'names': ('lat', 'long','elapsed_ms'),'formats': (float, float, int)},delimiter=',',usecols=(0,1,10),skiprows=1)
-
+# Find the log position (and associated timestamp) at which the UAS reached each waypoint of the flight plan. The log
+# positions and the waypoints are projected to UTM and all waypoints are matched in one query, in time order (see
+# waypoint_rendezvous.py). Waypoints after the end of the log are unmatched (row -1) and have no range segment. The
+# rows of the whole log are given so that the end of one range and the start of the next are not taken as one pass.
 
-#flightLog=numpy.loadtxt(logPath,delimiter=',',usecols=(0,1),skiprows=1)
-#flightLogTime=numpy.loadtxt(logPath,dtype={'names': ('lat', 'long','elapsed_ms'),'formats': (float, float, int)},delimiter=',',usecols=(0,1,10),skiprows=1)
-flightPlan=numpy.loadtxt(planPath,dtype={'names': ('waypoint', 'lat', 'long'),'formats': ('|S5', float, float)},delimiter=',',usecols=(0,1,2),skiprows=1)
-flightPlan=numpy.loadtxt(planPath,dtype={'names': ('lat', 'long'),'formats': (float, float)},delimiter=',',usecols=(0,1,2),skiprows=1)
-
-# Build the K-tree structure containing all points in the DJI log file
-
-flightKDTree=cKDTree(flightLog, leafsize=100)
-
-# Determine the nearest neighboring point (and associated timestamp) in the log file for each way point
-i=1
-for item in flightPlan:
-    waypointID=i
-    waypointLat=item[0]
-    waypointLon=item[1]
-    waypointLatLon=(item[0],item[1])
-    nearest = flightKDTree.query(waypointLatLon, k=1, distance_upper_bound=6)
-    nearestLat=flightLogTime[nearest[1]][0]
-    nearestLon=flightLogTime[nearest[1]][1]
-    nearestTime=flightLogTime[nearest[1]][2]
-    waypointRendezvous[waypointID]=(waypointLat,waypointLon,nearestLat,nearestLon,nearestTime)
-    i+=1
-endTime=nearestTime # The last time a nearest neighbour match was found
+planLat,planLon=read_flight_plan(planPath)
+videoLogRows=numpy.flatnonzero(flightLogColumns.isTakingVideo) # Row of each video log position in the whole log
+rendezvousRows,rendezvousDistances=find_waypoint_rendezvous(videoLog.lat,videoLog.lon,planLat,planLon,
+                                                            logRows=videoLogRows)
+rendezvousRows=rendezvousRows[rendezvousRows >= 0]
+for i,row in enumerate(rendezvousRows):
+    waypointID=i+1
+    waypointRendezvous[waypointID]=(planLat[i],planLon[i],videoLog.lat[row],videoLog.lon[row],int(videoLog.elapsed[row]))
+    if rendezvousDistances[i] > 1:
+        print 'Waypoint',waypointID,'reached',round(rendezvousDistances[i],2),'meters from its planned position'
+endTime=waypointRendezvous[len(rendezvousRows)][4] # The time the last waypoint was reached
 
 # Correct the first waypoint data to correspond to the time that the UAS started taking video
 
@@ -404,16 +326,29 @@ with open(lineSegmentsPath,'w') as lineSegmentsFile:
         lineSegment=rangeId[0] + ',"' + rangeId[1].wkt + '"\n'
         lineSegmentsFile.write(lineSegment)
 
-# Determine which plots intersect the range segment
+# Determine which plots intersect the range segment. The plots of each range are listed in the order the UAV flies
+# over them together with the distance along the range (m) at which the UAV enters and leaves the plot and the
+# corresponding time window within the video. The UAV is assumed to fly at a constant speed along a range.
 
-with open(plotRangePath,'w') as plotRangeFile:
+rangeIds = sorted(rangeLines.keys())
+rangeCrossings = plotLocator.line_crossings([rangeLines[rangeId] for rangeId in rangeIds])
+
+with open(plotRangePath,'w') as plotRangeFile, open(plotWindowsPath,'w') as plotWindowsFile:
     plotRangeFile.write('range_id' + ',' + 'plot_id' + ',' +'plot' + '\n')
-    for rangeId in sorted(rangeLines.items()):
-        for plotId in sorted(plots.items()):
-            if rangeId[1].intersects(plotId[1]):
-                #print 'Range Id ' + rangeId[0] +  ' intersects Plot ID ' + plotId[0] + ' , ' + plotId[1].wkt
-                rangePlotLine=rangeId[0]+','+ plotId[0] + ',"' + plotId[1].wkt+'"\n'
-                plotRangeFile.write(rangePlotLine)
+    plotWindowsFile.write('range_id,plot_id,entry_m,exit_m,start_ms,duration_s\n')
+    for rangeId, crossings in zip(rangeIds, rangeCrossings):
+        (lonA, latA), (lonB, latB) = rangeLines[rangeId].coords
+        rangeLength = haversine_distance(lonA, latA, lonB, latB) * 1000
+        segStart, segDuration = rangeSegments[rangeId]
+        for plotIndex, entry, exit in crossings:
+            plotId = plotMap.plotIds[plotIndex]
+            #print 'Range Id ' + rangeId +  ' intersects Plot ID ' + plotId + ' , ' + plots[plotId].wkt
+            rangePlotLine=rangeId+','+ plotId + ',"' + plots[plotId].wkt+'"\n'
+            plotRangeFile.write(rangePlotLine)
+            windowStart = segStart + entry * segDuration * 1000
+            windowDuration = (exit - entry) * segDuration
+            plotWindowsFile.write('%s,%s,%.2f,%.2f,%d,%.3f\n' % (rangeId, plotId, entry * rangeLength,
+                                                                 exit * rangeLength, windowStart, windowDuration))
 
 #sys.exit()
 
@@ -471,6 +406,28 @@ with open(segTimingPath,'w') as segTimingFile:
             segTimingLine=segID+','+segStart+','+segDuration+'\n'
             segTimingFile.write(segTimingLine)
 
+# Cut the video segments with a pool of encoder processes. Segments already cut by an earlier run are skipped (see
+# video_segmenter.py). The cut points are chosen from the keyframe index of the video (see keyframe_index.py) so
+# segments are frame accurate while only the leading GOP of a segment is ever re-encoded.
+
+if args.execute:
+    segments=[]
+    for segID,segTimes in sorted(rangeSegments.items()):
+        if segTimes[1] <= 0.0:
+            print '***Positioning Error*** Segment',segID,'is not cut'
+            continue
+        segFile = flightDataPath + videoFileName + '_' + segID + vidExt
+        segments.append(Segment(segID, segTimes[0]/1000.0, segTimes[1], segFile))
+    manifestPath = flightDataPath + 'segment_' + videoFileName + '_manifest.csv'
+    videoTools = find_video_tools()
+    keyframeIndex = load_keyframe_index(videoPath, videoTools[1])
+    print 'Video keyframes:', len(keyframeIndex)
+    segmenter = VideoSegmenter(videoPath, manifestPath, args.threads, tools=videoTools, keyframeIndex=keyframeIndex)
+    segmentResults = segmenter.run(segments)
+    failedSegments = [result.segmentId for result in segmentResults if result.status == 'failed']
+    if len(failedSegments) > 0:
+        print '*** Warning*** Segments not cut:', ', '.join(failedSegments)
+
 
 sys.exit()
 
@@ -0,0 +1,23 @@
+#
+# Version 0.1 October 2018
+#
+# Test fixtures shared by the tests of the UAS modules. The modules are imported from the uas folder as the programs do.
+#
+
+import os
+import sys
+import stat
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+
+@pytest.fixture
+def fake_exiftool(tmp_path):
+    # Return the path of an executable that runs fake_exiftool.py with the current interpreter
+    executable = tmp_path / 'exiftool'
+    executable.write_text('#!' + sys.executable + '\n' +
+                          open(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fake_exiftool.py')).read())
+    executable.chmod(executable.stat().st_mode | stat.S_IXUSR)
+    return str(executable)
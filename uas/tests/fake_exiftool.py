@@ -0,0 +1,42 @@
+#
+# Version 0.1 October 2018
+#
+# This is a stand-in for exiftool -stay_open used by the tests. It reads the arguments of each command from stdin and,
+# like exiftool, writes one "Error: File not found - <file>" line to stderr for every missing file, the summary to
+# stdout, the -echo4 text to stderr and {readyN} to stdout on -executeN. Options (-csv=<file> included) are not
+# taken as image files.
+#
+
+from __future__ import print_function
+
+import os
+import sys
+
+
+def main():
+    arguments = []
+    for line in iter(sys.stdin.readline, ''):
+        argument = line.rstrip('\n')
+        if argument.startswith('-execute'):
+            files = [arg for arg in arguments if not arg.startswith('-') and not arg.startswith('{') and
+                     arg not in ('filename=utf8', 'True')]
+            missing = [fileName for fileName in files if not os.path.exists(fileName)]
+            for fileName in missing:
+                sys.stderr.write('Error: File not found - %s\n' % fileName)
+            sys.stdout.write('    %d image files updated\n' % (len(files) - len(missing)))
+            if len(missing) > 0:
+                sys.stdout.write("    %d files weren't updated due to errors\n" % len(missing))
+            if '-echo4' in arguments:
+                sys.stderr.write(arguments[arguments.index('-echo4') + 1] + '\n')
+            sys.stdout.write('{ready%s}\n' % argument[len('-execute'):])
+            sys.stdout.flush()
+            sys.stderr.flush()
+            arguments = []
+        elif argument == 'False' and len(arguments) > 0 and arguments[-1] == '-stay_open':
+            break
+        else:
+            arguments.append(argument)
+
+
+if __name__ == '__main__':
+    main()
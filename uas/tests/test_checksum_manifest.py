@@ -0,0 +1,33 @@
+import os
+
+import checksum_engine
+from checksum_manifest import manifestFileName, use_checksum_manifest, remove_checksum_manifest
+
+
+def test_manifest_is_removed_from_a_folder_before_it_is_archived(tmp_path):
+    folder = tmp_path / 'dataset'
+    folder.mkdir()
+    (folder / 'IMG_0001_1.tif').write_bytes(b'image data')
+    use_checksum_manifest(str(folder))
+    try:
+        checksum = checksum_engine.calculate_checksum(str(folder / 'IMG_0001_1.tif'))
+        assert (folder / manifestFileName).exists()
+        remove_checksum_manifest(str(folder))
+        assert checksum_engine.get_checksum_manifest() is None
+        assert sorted(os.listdir(str(folder))) == ['IMG_0001_1.tif']
+        assert checksum_engine.calculate_checksum(str(folder / 'IMG_0001_1.tif')) == checksum
+    finally:
+        checksum_engine.set_checksum_manifest(None)
+
+
+def test_using_a_new_manifest_closes_the_previous_one(tmp_path):
+    first = use_checksum_manifest(str(tmp_path))
+    try:
+        first.record(__file__, 'd41d8cd98f00b204e9800998ecf8427e')
+        second = use_checksum_manifest(str(tmp_path))
+        assert first.local.connection is None
+        assert checksum_engine.get_checksum_manifest() is second
+        assert not os.path.exists(os.path.join(str(tmp_path), manifestFileName + '-wal')) or \
+            os.path.getsize(os.path.join(str(tmp_path), manifestFileName + '-wal')) == 0
+    finally:
+        checksum_engine.set_checksum_manifest(None)
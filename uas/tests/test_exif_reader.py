@@ -0,0 +1,27 @@
+import io
+import struct
+
+from exif_reader import read_exif, gps_date_time
+
+
+def gps_tiff(timeStamp, gpsDate):
+    # Return a little-endian TIFF whose only IFD points to a GPS IFD holding GPSTimeStamp (3 rationals) and GPSDate
+    gpsOffset = 8 + 2 + 12 + 4
+    dataOffset = gpsOffset + 2 + 2 * 12 + 4
+    date = gpsDate.encode('ascii') + b'\x00'
+    ifd0 = struct.pack('<H', 1) + struct.pack('<HHLL', 0x8825, 4, 1, gpsOffset) + struct.pack('<L', 0)
+    gpsIfd = (struct.pack('<H', 2) + struct.pack('<HHLL', 0x0007, 5, 3, dataOffset) +
+              struct.pack('<HHLL', 0x001D, 2, len(date), dataOffset + 24) + struct.pack('<L', 0))
+    rationals = b''.join(struct.pack('<LL', numerator, denominator) for numerator, denominator in timeStamp)
+    return b'II*\x00' + struct.pack('<L', 8) + ifd0 + gpsIfd + rationals + date
+
+
+def test_gps_date_time_truncates_rational_seconds():
+    tags = read_exif(io.BytesIO(gps_tiff([(14, 1), (3, 1), (12345, 1000)], '2018:05:02')))
+    assert tags['GPSTimeStamp'] == (14.0, 3.0, 12.345)
+    assert gps_date_time(tags) == ('2018/05/02', '14:03:12')
+
+
+def test_gps_date_time_pads_single_digit_seconds():
+    tags = read_exif(io.BytesIO(gps_tiff([(14, 1), (3, 1), (11, 2)], '2018:05:02')))
+    assert gps_date_time(tags) == ('2018/05/02', '14:03:05')
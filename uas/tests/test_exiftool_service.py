@@ -0,0 +1,36 @@
+import os
+import threading
+
+from exiftool_service import ExifTool
+
+
+def run_with_timeout(function, timeout=60):
+    # Return the result of function, or fail when it does not return within timeout seconds (a deadlock)
+    results = []
+    worker = threading.Thread(target=lambda: results.append(function()))
+    worker.daemon = True
+    worker.start()
+    worker.join(timeout)
+    assert not worker.is_alive(), 'exiftool command did not return'
+    return results[0]
+
+
+def test_execute_with_errors_returns_output_and_errors(fake_exiftool, tmp_path):
+    existing = tmp_path / 'image.tif'
+    existing.write_bytes(b'II*\x00')
+    with ExifTool(fake_exiftool) as exifTool:
+        output, errors = exifTool.execute_with_errors(str(existing), str(tmp_path / 'missing.tif'))
+    assert '1 image files updated' in output
+    assert errors.strip() == 'Error: File not found - ' + str(tmp_path / 'missing.tif')
+
+
+def test_many_errors_do_not_block_on_the_stderr_pipe(fake_exiftool, tmp_path):
+    # About 400 KiB of error messages, several times the size of a pipe buffer
+    missing = [str(tmp_path / ('missing_%05d_' % index + 'x' * 60 + '.tif')) for index in range(4000)]
+    with ExifTool(fake_exiftool) as exifTool:
+        output, errors = run_with_timeout(lambda: exifTool.execute_with_errors(*missing))
+        assert "4000 files weren't updated due to errors" in output
+        assert len(errors.splitlines()) == 4000
+        # The next command is still matched to its own output
+        output, errors = run_with_timeout(lambda: exifTool.execute_with_errors(missing[0]))
+        assert errors.strip() == 'Error: File not found - ' + missing[0]
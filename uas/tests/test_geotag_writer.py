@@ -0,0 +1,24 @@
+from exiftool_service import ExifTool
+from geotag_writer import GeotagRecord, write_geotags, failed_files, chunkSize
+
+
+def test_failed_files_reports_every_error_and_ignores_warnings():
+    fileNames = ['/flight/image_%05d.jpg' % index for index in range(5000)]
+    errors = '\n'.join(['Error: File not found - ' + fileName for fileName in fileNames[:4000]] +
+                       ['Warning: [minor] Bad MakerNotes directory - ' + fileNames[4000],
+                        'Error: File not found - /elsewhere/other.jpg'])
+    failures = failed_files(errors, fileNames)
+    assert [fileName for fileName, message in failures] == fileNames[:4000]
+    assert all(message == 'File not found' for fileName, message in failures)
+
+
+def test_write_geotags_reports_a_chunk_of_missing_images(fake_exiftool, tmp_path):
+    # More missing images than a chunk, each with a long name: the error messages of a chunk exceed a pipe buffer
+    existing = tmp_path / 'image.jpg'
+    existing.write_bytes(b'\xff\xd8')
+    missing = [str(tmp_path / ('missing_%05d_' % index + 'x' * 60 + '.jpg')) for index in range(chunkSize + 500)]
+    records = [GeotagRecord(str(existing), 39.1, -96.6, None)] + \
+              [GeotagRecord(fileName, 39.1, -96.6, 320.0) for fileName in missing]
+    with ExifTool(fake_exiftool) as exifTool:
+        failures = write_geotags(records, exifTool)
+    assert sorted(fileName for fileName, message in failures) == sorted(missing)
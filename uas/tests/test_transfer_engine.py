@@ -0,0 +1,33 @@
+import os
+
+import pytest
+
+import transfer_engine
+
+
+def test_kernel_copy_that_stops_early_is_completed_by_blocks(tmp_path, monkeypatch):
+    # copy_file_range returning 0 before the end of the file, as it does between some file systems
+    source = tmp_path / 'source.bin'
+    source.write_bytes(os.urandom(300000))
+    calls = []
+
+    def short_copy_file_range(sourceFd, targetFd, count):
+        calls.append(count)
+        return os.write(targetFd, os.read(sourceFd, 1000)) if len(calls) == 1 else 0
+
+    monkeypatch.setattr(os, 'copy_file_range', short_copy_file_range, raising=False)
+    monkeypatch.delattr(os, 'sendfile', raising=False)
+    result = transfer_engine.transfer_file(str(source), str(tmp_path / 'target.bin'), verify=False)
+    assert result.method == 'kernel'
+    assert (tmp_path / 'target.bin').read_bytes() == source.read_bytes()
+    assert not (tmp_path / 'target.bin.part').exists()
+
+
+def test_kernel_copy_of_the_wrong_size_is_not_renamed(tmp_path, monkeypatch):
+    source = tmp_path / 'source.bin'
+    source.write_bytes(os.urandom(5000))
+    monkeypatch.setattr(os, 'copy_file_range', lambda sourceFd, targetFd, count: count, raising=False)
+    with pytest.raises(transfer_engine.TransferError):
+        transfer_engine.transfer_file(str(source), str(tmp_path / 'target.bin'), verify=False)
+    assert not (tmp_path / 'target.bin').exists()
+    assert not (tmp_path / 'target.bin.part').exists()
@@ -0,0 +1,29 @@
+import numpy
+
+from waypoint_rendezvous import find_waypoint_rendezvous
+
+
+def two_range_video_log():
+    # isTakingVideo rows of two ranges flown 3 m apart: the video of range 1 stops 5 m before its end waypoint and the
+    # video of range 2 starts at its start waypoint, 40 rows later in the whole log
+    lat1 = numpy.linspace(39.0, 39.000955, 20)
+    lat2 = numpy.linspace(39.001, 39.0, 20)
+    lat = numpy.concatenate((lat1, lat2))
+    lon = numpy.concatenate((numpy.full(20, -96.6), numpy.full(20, -96.599965)))
+    logRows = numpy.concatenate((numpy.arange(0, 20), numpy.arange(60, 80)))
+    planLat = [39.0, 39.001, 39.001, 39.0]
+    planLon = [-96.6, -96.6, -96.599965, -96.599965]
+    return lat, lon, planLat, planLon, logRows
+
+
+def test_range_end_is_not_matched_to_the_start_of_the_next_range():
+    lat, lon, planLat, planLon, logRows = two_range_video_log()
+    rows, distances = find_waypoint_rendezvous(lat, lon, planLat, planLon, logRows=logRows)
+    assert rows.tolist() == [0, 19, 20, 39]
+
+
+def test_waypoints_after_the_end_of_the_log_are_unmatched():
+    lat, lon, planLat, planLon, logRows = two_range_video_log()
+    rows, distances = find_waypoint_rendezvous(lat[:20], lon[:20], planLat, planLon, logRows=logRows[:20])
+    assert rows.tolist() == [0, 19, -1, -1]
+    assert numpy.isnan(distances[2:]).all()
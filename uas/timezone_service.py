@@ -0,0 +1,74 @@
+#
+# Version 0.1 October 2018
+#
+# This is a module that contains the timezone lookup shared by the HTP UAS programs.
+#
+# Creating a TimezoneFinder loads a large timezone polygon data set so the programs no longer create one per lookup:
+#
+#   1. Positions inside a known field site return the site timezone without any lookup.
+#   2. Other positions are cached by grid cell (cellSize degrees, about 1 km) in a least recently used cache.
+#   3. Only a cache miss uses the TimezoneFinder, which is created once per process on the first miss.
+#
+
+from __future__ import print_function
+from __future__ import division
+
+import collections
+
+# Known field sites: name, minimum latitude, maximum latitude, minimum longitude, maximum longitude, timezone
+# The Kansas box excludes the western counties that use mountain time. The India box covers the Punjab, Haryana and
+# Delhi field sites in UTM zone 43R.
+
+knownSites = [
+    ('Kansas',      37.0,   40.0,   -101.5, -94.6,  'America/Chicago'),
+    ('India 43R',   28.0,   32.0,   75.5,   78.0,   'Asia/Kolkata'),
+]
+
+cellSize = 0.01
+cacheSize = 1024
+
+_timezoneFinder = None
+_timezoneCache = collections.OrderedDict()
+
+
+def get_timezone_finder():
+    # Return the process wide TimezoneFinder, creating it on first use
+    global _timezoneFinder
+    if _timezoneFinder is None:
+        from timezonefinder import TimezoneFinder
+        _timezoneFinder = TimezoneFinder()
+    return _timezoneFinder
+
+
+def known_site_timezone(lat, lon):
+    # Return the timezone of the known field site containing the position or None
+    for name, minLat, maxLat, minLon, maxLon, timezone in knownSites:
+        if minLat <= lat <= maxLat and minLon <= lon <= maxLon:
+            return timezone
+    return None
+
+
+def grid_cell(lat, lon):
+    return int(round(lat / cellSize)), int(round(lon / cellSize))
+
+
+def timezone_at(lat, lon):
+    #
+    # Return the timezone name (e.g. America/Chicago) of a position given in decimal degrees.
+    # Returns None when the position is not in any timezone.
+    #
+    lat = float(lat)
+    lon = float(lon)
+    timezone = known_site_timezone(lat, lon)
+    if timezone is not None:
+        return timezone
+
+    cell = grid_cell(lat, lon)
+    if cell in _timezoneCache:
+        timezone = _timezoneCache.pop(cell)
+    else:
+        timezone = get_timezone_finder().timezone_at(lng=lon, lat=lat)
+        if len(_timezoneCache) >= cacheSize:
+            _timezoneCache.popitem(last=False)
+    _timezoneCache[cell] = timezone
+    return timezone
@@ -0,0 +1,211 @@
+#
+# Version 0.1 October 2018
+#
+# This is a module that contains the copy and move engine used to transfer image files between the staging, working and
+# archive folders.
+#
+# shutil.copy2 and shutil.move across file systems read each image once to copy it, and the programs then read it
+# again to compute or check its MD5 checksum. transfer_file copies a file in a single pass:
+#
+#   rename  A move within a file system is a rename: no data is copied.
+#   copy    The file is read block by block into a reused buffer, each block is fed to the MD5 hasher and written to
+#           <target>.part. The checksum of the data read from the source is compared with the expected checksum of the
+#           file (when known, e.g. from the image metadata) before <target>.part is renamed to the target. The target is
+#           not read back: the checksum shows that the data read is the expected data, not that the target storage
+#           holds it.
+#   kernel  Files that do not need a checksum (verify=False) are copied by the kernel with os.copy_file_range or
+#           os.sendfile where available, without passing the data through the program. They are not checksummed.
+#
+# <target>.part is flushed to disk (fsync) before it is renamed to the target, so a crash never leaves a target that
+# holds only part of its data.
+#
+# The permissions and times of the source are kept (as shutil.copy2). A moved file is only removed from its source once
+# its copy is complete and verified. transfer_files and move_tree run several transfers at once with a thread pool; the
+# number of threads is chosen from the storage of the target (see checksum_engine.storage_workers).
+#
+
+from __future__ import print_function
+from __future__ import division
+
+import io
+import os
+import shutil
+import hashlib
+import collections
+from multiprocessing.pool import ThreadPool
+
+import checksum_engine
+
+TransferResult = collections.namedtuple('TransferResult', ['source', 'target', 'md5', 'size', 'method'])
+
+
+class TransferError(IOError):
+    pass
+
+
+def same_file_system(source, targetFolder):
+    return os.stat(source).st_dev == os.stat(targetFolder).st_dev
+
+
+def copy_hashing(source, partPath, blockSize=checksum_engine.bufferSize):
+    # Copy source to partPath, flushed to disk, and return the MD5 checksum of the data read from source
+    hasher = hashlib.md5()
+    blockBuffer = bytearray(blockSize)
+    view = memoryview(blockBuffer)
+    with io.open(source, 'rb', buffering=0) as sourceFile, io.open(partPath, 'wb', buffering=0) as partFile:
+        count = sourceFile.readinto(blockBuffer)
+        while count:
+            hasher.update(view[:count])
+            written = 0
+            while written < count:
+                written += partFile.write(view[written:count])
+            count = sourceFile.readinto(blockBuffer)
+        os.fsync(partFile.fileno())
+    return hasher.hexdigest()
+
+
+def copy_kernel(source, partPath, blockSize=checksum_engine.bufferSize):
+    # Copy source to partPath with os.copy_file_range or os.sendfile (Linux), or by blocks where neither is available
+    # or copies the whole file, and flush it to disk. The size of the copy is checked as the file is not checksummed.
+    copyFileRange = getattr(os, 'copy_file_range', None)
+    sendFile = getattr(os, 'sendfile', None)
+    with io.open(source, 'rb', buffering=0) as sourceFile, io.open(partPath, 'wb', buffering=0) as partFile:
+        size = os.fstat(sourceFile.fileno()).st_size
+        remaining = size
+        offset = 0
+        for kernelCopy in (copyFileRange, sendFile):
+            if kernelCopy is None:
+                continue
+            try:
+                while remaining > 0:
+                    if kernelCopy is copyFileRange:
+                        copied = copyFileRange(sourceFile.fileno(), partFile.fileno(), min(remaining, blockSize))
+                    else:
+                        copied = sendFile(partFile.fileno(), sourceFile.fileno(), offset, min(remaining, blockSize))
+                    if copied == 0:
+                        break
+                    offset += copied
+                    remaining -= copied
+                break
+            except OSError:
+                # Not supported between these file systems: continue from the current offset with the next method
+                sourceFile.seek(offset)
+                partFile.seek(offset)
+        if remaining > 0:
+            # No kernel copy, or one that stopped before the end of the file (some file systems return 0 early): copy
+            # the rest by blocks
+            sourceFile.seek(offset)
+            partFile.seek(offset)
+            shutil.copyfileobj(sourceFile, partFile, blockSize)
+        os.fsync(partFile.fileno())
+        if os.fstat(partFile.fileno()).st_size != size:
+            raise TransferError('Copy of ' + source + ' is ' + str(os.fstat(partFile.fileno()).st_size) +
+                                ' bytes, not ' + str(size))
+
+
+def transfer_file(source, target, move=False, expectedMd5=None, verify=True):
+    #
+    # Copy (or move) source to target (a file path or an existing folder) and return its TransferResult. The MD5 of the
+    # data read from source is computed when verify is True and must be equal to expectedMd5 when it is given,
+    # otherwise a TransferError is raised and the target is not written.
+    #
+    if os.path.isdir(target):
+        target = os.path.join(target, os.path.basename(source))
+    size = os.stat(source).st_size
+    if move and same_file_system(source, os.path.dirname(os.path.abspath(target))):
+        os.rename(source, target)
+        return TransferResult(source, target, expectedMd5, size, 'rename')
+
+    partPath = target + '.part'
+    try:
+        if verify:
+            md5 = copy_hashing(source, partPath)
+            method = 'copy'
+            if expectedMd5 is not None and md5 != expectedMd5:
+                raise TransferError('Checksum ' + md5 + ' of the data read is not the expected checksum ' +
+                                    expectedMd5)
+        else:
+            copy_kernel(source, partPath)
+            md5 = None
+            method = 'kernel'
+        shutil.copystat(source, partPath)
+        if os.path.exists(target):
+            os.remove(target)
+        os.rename(partPath, target)
+    finally:
+        if os.path.exists(partPath):
+            os.remove(partPath)
+
+    if move:
+        os.remove(source)
+    return TransferResult(source, target, md5, size, method)
+
+
+def transfer_files(transfers, move=False, workers=None, verify=True):
+    #
+    # Run the transfers, a list of (source, target, expected MD5 or None), with workers threads. Returns the list of
+    # TransferResult of the transfers done (in the order of transfers) and the list of (source, message) of the
+    # transfers that failed.
+    #
+    transfers = list(transfers)
+    if len(transfers) == 0:
+        return [], []
+    if workers is None:
+        workers = checksum_engine.storage_workers(os.path.dirname(os.path.abspath(transfers[0][1])))
+
+    def run(transfer):
+        source, target, expectedMd5 = transfer
+        try:
+            return transfer_file(source, target, move, expectedMd5, verify), None
+        except (IOError, OSError) as e:
+            return None, (source, str(e))
+
+    pool = ThreadPool(max(min(workers, len(transfers)), 1))
+    try:
+        outcomes = pool.map(run, transfers, 1)
+    finally:
+        pool.close()
+        pool.join()
+    return [result for result, failure in outcomes if result is not None], \
+           [failure for result, failure in outcomes if failure is not None]
+
+
+def move_tree(sourceFolder, targetFolder, expectedMd5s=None, workers=None):
+    #
+    # Move sourceFolder into targetFolder (as shutil.move(sourceFolder, targetFolder) with an existing targetFolder).
+    # expectedMd5s is a dictionary of path relative to sourceFolder: expected MD5; those files are verified, the other
+    # files are copied by the kernel. sourceFolder is only removed when every file was moved. Returns the list of
+    # (source, message) of the files that could not be moved.
+    #
+    expectedMd5s = expectedMd5s if expectedMd5s is not None else {}
+    sourceFolder = os.path.normpath(sourceFolder)
+    destination = os.path.join(targetFolder, os.path.basename(sourceFolder))
+    if os.path.exists(destination):
+        raise TransferError('Destination path ' + destination + ' already exists')
+    if same_file_system(sourceFolder, targetFolder):
+        os.rename(sourceFolder, destination)
+        return []
+
+    verified = []
+    unverified = []
+    for folder, subFolders, fileNames in os.walk(sourceFolder):
+        relativeFolder = os.path.relpath(folder, sourceFolder)
+        os.makedirs(os.path.normpath(os.path.join(destination, relativeFolder)))
+        for fileName in fileNames:
+            relativePath = os.path.normpath(os.path.join(relativeFolder, fileName))
+            transfer = (os.path.join(folder, fileName), os.path.join(destination, relativePath),
+                        expectedMd5s.get(relativePath))
+            (verified if transfer[2] is not None else unverified).append(transfer)
+
+    failures = transfer_files(verified, True, workers)[1] + transfer_files(unverified, True, workers, False)[1]
+    if len(failures) == 0:
+        shutil.rmtree(sourceFolder)
+    return failures
+
+
+def report_transfer_failures(failures):
+    # Print the files that could not be transferred
+    for source, message in failures:
+        print('*** Error*** Unable to transfer', source, ':', message)
+    if len(failures) > 0:
+        print('***', len(failures), 'files were not transferred')
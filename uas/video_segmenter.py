@@ -0,0 +1,246 @@
+#
+# Version 0.1 October 2018
+#
+# This is a module that contains the video segmentation executor used to cut a flight video into range segments.
+#
+# The segments are cut by ffmpeg (or avconv) subprocesses run by a bounded pool of worker threads, so several ranges are
+# cut at once instead of one after another from a shell script. Each segment is written under a temporary name and is
+# renamed only after the duration of the output (read with ffprobe or avprobe) has been checked against the duration
+# expected from the cut. When the keyframe index of the video is given (see keyframe_index.py) the cut points are frame
+# accurate: segments are stream copied when they start near a keyframe and only their leading GOP is re-encoded
+# otherwise, with the parameters of the video stream; a joined segment whose stream does not match the video is
+# re-encoded whole. Without a keyframe index, or with avconv, a segment is stream copied from a keyframe before its
+# start and is recorded as not frame accurate. The result of every segment is recorded in a CSV manifest next to the
+# segments:
+#
+#   segment_id,file,start_s,duration_s,output_duration_s,size,status,mode,frame_accurate,seconds
+#
+# A segment already recorded as done in the manifest, with the same start and duration and an output file of the
+# recorded size, is skipped (and keeps its manifest row), so an interrupted run can simply be started again.
+#
+
+from __future__ import print_function
+from __future__ import division
+
+import os
+import re
+import csv
+import time
+import threading
+import subprocess
+import collections
+from multiprocessing.pool import ThreadPool
+
+from keyframe_index import copy_command, cut_commands, defaultSnapTolerance, encode_command, frameAccurateModes, \
+    probe_video_stream, stream_matches
+
+try:
+    from shutil import which
+except ImportError:
+    from distutils.spawn import find_executable as which
+
+Segment = collections.namedtuple('Segment', ['segmentId', 'start', 'duration', 'outPath'])
+SegmentResult = collections.namedtuple('SegmentResult', ['segmentId', 'outPath', 'start', 'duration', 'outputDuration',
+                                                         'size', 'status', 'mode', 'frameAccurate', 'seconds'])
+
+manifestColumns = ['segment_id', 'file', 'start_s', 'duration_s', 'output_duration_s', 'size', 'status', 'mode',
+                   'frame_accurate', 'seconds']
+
+defaultThreads = 4
+defaultTolerance = 1.0      # seconds, stream copy cuts start at a keyframe
+
+# Encoder and matching probe programs in order of preference
+
+videoTools = [('ffmpeg', 'ffprobe'), ('avconv', 'avprobe')]
+
+
+def find_video_tools():
+    # Return the paths of the first encoder and probe pair found on the PATH
+    for encoder, probe in videoTools:
+        encoderPath = which(encoder)
+        probePath = which(probe)
+        if encoderPath is not None and probePath is not None:
+            return encoderPath, probePath
+    raise IOError('Neither ffmpeg/ffprobe nor avconv/avprobe were found on the PATH')
+
+
+def probe_duration(probePath, videoPath):
+    # Return the duration (seconds) of a video file or None if it can not be read
+    try:
+        output = subprocess.check_output([probePath, '-v', 'error', '-show_format', videoPath],
+                                         stderr=subprocess.STDOUT)
+    except (subprocess.CalledProcessError, OSError):
+        return None
+    match = re.search(r'duration\s*=\s*([0-9.]+)', output.decode('utf-8', 'replace'))
+    return float(match.group(1)) if match is not None else None
+
+
+def part_path(outPath):
+    # Return the temporary path a segment is written to. The extension is kept so the encoder picks the same container.
+    root, ext = os.path.splitext(outPath)
+    return root + '.part' + ext
+
+
+def read_manifest(manifestPath):
+    # Return a dictionary of segment_id: manifest row (dictionary) of a manifest file, empty if there is none
+    if not os.path.exists(manifestPath):
+        return {}
+    with open(manifestPath, 'r') as manifestFile:
+        return dict((row['segment_id'], row) for row in csv.DictReader(manifestFile))
+
+
+def write_manifest(manifestPath, results):
+    # Write the manifest rows of the results (SegmentResult), sorted by segment ID
+    tempPath = manifestPath + '.tmp'
+    with open(tempPath, 'w') as manifestFile:
+        writer = csv.writer(manifestFile, lineterminator='\n')
+        writer.writerow(manifestColumns)
+        for result in sorted(results, key=lambda result: result.segmentId):
+            writer.writerow([result.segmentId, os.path.basename(result.outPath), '%.3f' % result.start,
+                             '%.3f' % result.duration,
+                             '%.3f' % result.outputDuration if result.outputDuration is not None else '',
+                             result.size, result.status, result.mode, 'yes' if result.frameAccurate else 'no',
+                             '%.2f' % result.seconds])
+    if os.path.exists(manifestPath):
+        os.remove(manifestPath)
+    os.rename(tempPath, manifestPath)
+
+
+def is_segment_done(segment, manifestRow):
+    # Return True if the manifest row records the same segment as done and its output file is still complete
+    if manifestRow is None or manifestRow['status'] != 'done':
+        return False
+    try:
+        return (abs(float(manifestRow['start_s']) - segment.start) < 0.0005 and
+                abs(float(manifestRow['duration_s']) - segment.duration) < 0.0005 and
+                os.path.getsize(segment.outPath) == int(manifestRow['size']))
+    except (OSError, ValueError):
+        return False
+
+
+class VideoSegmenter(object):
+    '''Cuts range segments out of a video with a pool of encoder subprocesses and records them in a manifest.'''
+
+    def __init__(self, videoPath, manifestPath, threads=defaultThreads, tolerance=defaultTolerance, tools=None,
+                 keyframeIndex=None, snapTolerance=defaultSnapTolerance):
+        self.videoPath = videoPath
+        self.manifestPath = manifestPath
+        self.threads = threads
+        self.tolerance = tolerance
+        self.keyframeIndex = keyframeIndex
+        self.snapTolerance = snapTolerance
+        self.encoderPath, self.probePath = tools if tools is not None else find_video_tools()
+        self.results = {}
+        self.lock = threading.Lock()
+
+    def segment_commands(self, segment, outPath):
+        #
+        # Return the cut mode, the encoder commands that write the segment to outPath, their temporary files and the
+        # duration of the output. Without a keyframe index the segment is stream copied from the keyframe before its
+        # start (mode keyframe); its output duration is then only known to be about the requested duration.
+        #
+        if self.keyframeIndex is None:
+            return 'keyframe', [copy_command(self.encoderPath, self.videoPath, segment.start, segment.duration,
+                                             outPath)], [], segment.duration
+        return cut_commands(self.encoderPath, self.videoPath, segment, outPath, self.keyframeIndex, self.snapTolerance)
+
+    def run_cut(self, segment, tempPath, mode, commands, tempPaths, expectedDuration):
+        #
+        # Run the encoder commands of a cut and return its status and the duration of its output (written to tempPath).
+        # The output must have the expected duration and, for a head cut, the video stream parameters of the video.
+        #
+        status = 'done'
+        outputDuration = None
+        try:
+            for command in commands:
+                subprocess.check_output(command, stderr=subprocess.STDOUT)
+            outputDuration = probe_duration(self.probePath, tempPath)
+            if outputDuration is None or abs(outputDuration - expectedDuration) > self.tolerance:
+                status = 'failed'
+                print('*** Warning*** Segment', segment.segmentId, 'duration', outputDuration, 'does not match',
+                      expectedDuration)
+            elif mode == 'head' and not stream_matches(self.keyframeIndex.stream,
+                                                       probe_video_stream(self.probePath, tempPath)):
+                status = 'failed'
+                print('*** Warning*** Segment', segment.segmentId, 'video stream does not match the video')
+        except (subprocess.CalledProcessError, IOError, OSError) as e:
+            status = 'failed'
+            print('*** Warning*** Unable to cut segment', segment.segmentId, e)
+        for path in tempPaths:
+            if os.path.exists(path):
+                os.remove(path)
+        return status, outputDuration
+
+    def cut(self, segment):
+        #
+        # Cut one segment and return its SegmentResult. A head cut that fails or can not be joined is cut again by
+        # re-encoding the whole segment.
+        #
+        startTime = time.time()
+        tempPath = part_path(segment.outPath)
+        status = 'failed'
+        mode = ''
+        outputDuration = None
+        try:
+            mode, commands, tempPaths, expectedDuration = self.segment_commands(segment, tempPath)
+            status, outputDuration = self.run_cut(segment, tempPath, mode, commands, tempPaths, expectedDuration)
+            if status == 'failed' and mode == 'head':
+                print('*** Warning*** Segment', segment.segmentId, 'is re-encoded whole')
+                mode = 'encode'
+                commands = [encode_command(self.encoderPath, self.videoPath, segment.start, segment.duration,
+                                           tempPath)]
+                status, outputDuration = self.run_cut(segment, tempPath, mode, commands, [], segment.duration)
+            if status == 'done':
+                if os.path.exists(segment.outPath):
+                    os.remove(segment.outPath)
+                os.rename(tempPath, segment.outPath)
+        except (subprocess.CalledProcessError, IOError, OSError) as e:
+            status = 'failed'
+            print('*** Warning*** Unable to cut segment', segment.segmentId, e)
+        size = os.path.getsize(segment.outPath) if status == 'done' else 0
+        return SegmentResult(segment.segmentId, segment.outPath, segment.start, segment.duration, outputDuration, size,
+                             status, mode, mode in frameAccurateModes, time.time() - startTime)
+
+    def _run_segment(self, segment):
+        result = self.cut(segment)
+        with self.lock:
+            self.results[segment.segmentId] = result
+            write_manifest(self.manifestPath, list(self.results.values()))
+        print('Segment', result.segmentId, result.status, result.mode, 'in', round(result.seconds, 2), 'seconds')
+        return result
+
+    def run(self, segments):
+        #
+        # Cut the segments that are not already done and return the SegmentResult of every segment, in the order of
+        # segments. Segments are cut by up to threads encoder processes at once.
+        #
+        manifest = read_manifest(self.manifestPath)
+        pending = []
+        for segment in segments:
+            manifestRow = manifest.get(segment.segmentId)
+            if is_segment_done(segment, manifestRow):
+                outputDuration = float(manifestRow['output_duration_s']) if manifestRow['output_duration_s'] else None
+                self.results[segment.segmentId] = SegmentResult(segment.segmentId, segment.outPath, segment.start,
+                                                                segment.duration, outputDuration,
+                                                                int(manifestRow['size']), 'done',
+                                                                manifestRow.get('mode', ''),
+                                                                manifestRow.get('mode', '') in frameAccurateModes
+                                                                if 'frame_accurate' not in manifestRow
+                                                                else manifestRow['frame_accurate'] == 'yes',
+                                                                float(manifestRow['seconds']))
+            else:
+                pending.append(segment)
+        print(len(segments) - len(pending), 'segments already done,', len(pending), 'segments to cut')
+
+        if len(pending) > 0:
+            startTime = time.time()
+            pool = ThreadPool(min(self.threads, len(pending)))
+            try:
+                pool.map(self._run_segment, pending, chunksize=1)
+            finally:
+                pool.close()
+                pool.join()
+            print('Cut', len(pending), 'segments in', round(time.time() - startTime, 2), 'seconds')
+        else:
+            write_manifest(self.manifestPath, list(self.results.values()))
+        return [self.results[segment.segmentId] for segment in segments]
@@ -0,0 +1,111 @@
+#
+# Version 0.1 October 2018
+#
+# This is a module that contains the functions used to find when the UAV reached each waypoint of a flight plan.
+#
+# The log positions and the waypoints are projected to UTM (meters) in one vectorized step so that the distance cutoff
+# is a real distance. All waypoints are queried against a KD tree of the log positions in a single call and the
+# matches are then kept in time order: each waypoint is matched to the first pass of the UAV within the cutoff after
+# the time the previous waypoint was reached, so a waypoint that is flown over again later in the flight can not be
+# matched to the wrong pass. A pass is a run of consecutive log rows; when the positions are a filtered log (e.g. the
+# isTakingVideo rows only) their row numbers in the original log are given so that a pass does not run on from the end
+# of one range into the start of the next.
+#
+
+from __future__ import print_function
+from __future__ import division
+
+import io
+import numpy
+import utm
+from scipy.spatial import cKDTree
+
+defaultMaxDistance = 10.0   # meters
+
+# Flight plan columns: attribute name, header names, legacy column index
+
+planColumns = [
+    ('lat', ('latitude', 'lat'), 1),
+    ('lon', ('longitude', 'long', 'lon'), 2),
+]
+
+
+def read_flight_plan(planPath):
+    # Return the latitudes and longitudes of the waypoints of a flight plan CSV file in flight order.
+    # Columns are located by their header name; the legacy layout is waypoint,lat,long.
+    with io.open(planPath, 'r', newline=None) as plan:
+        headerNames = [name.strip().lower() for name in next(plan).split(',')]
+        usecols = []
+        for name, headerAliases, legacyIndex in planColumns:
+            matches = [headerNames.index(alias) for alias in headerAliases if alias in headerNames]
+            usecols.append(matches[0] if len(matches) > 0 else legacyIndex)
+        waypoints = numpy.loadtxt(plan, delimiter=',', usecols=usecols, dtype=numpy.float64, ndmin=2)
+    return waypoints[:, 0], waypoints[:, 1]
+
+
+def project_to_utm(lat, lon, zoneNumber=None, zoneLetter=None):
+    #
+    # Project latitudes and longitudes (degrees) to UTM eastings and northings (meters) in one vectorized step.
+    # All positions are projected into the same zone (the zone of the first position unless given) so that distances
+    # are valid across a zone boundary. Returns an (N,2) array and the zone number and letter.
+    #
+    lat = numpy.asarray(lat, dtype=numpy.float64)
+    lon = numpy.asarray(lon, dtype=numpy.float64)
+    if zoneNumber is None:
+        zoneNumber = utm.latlon_to_zone_number(float(lat[0]), float(lon[0]))
+        zoneLetter = utm.latitude_to_zone_letter(float(lat[0]))
+    easting, northing, zoneNumber, zoneLetter = utm.from_latlon(lat, lon, force_zone_number=zoneNumber,
+                                                                force_zone_letter=zoneLetter)
+    return numpy.column_stack((easting, northing)), zoneNumber, zoneLetter
+
+
+def first_pass_nearest(candidates, distances, logRows=None):
+    # Return the candidate row nearest to the waypoint within the first pass i.e. the first run of consecutive rows
+    # (consecutive rows of the original log when logRows, the original row number of each row, is given)
+    candidates = numpy.asarray(candidates)
+    originalRows = candidates if logRows is None else numpy.asarray(logRows)[candidates]
+    passBreaks = numpy.flatnonzero(numpy.diff(originalRows) > 1)
+    firstPass = slice(0, passBreaks[0] + 1) if len(passBreaks) > 0 else slice(0, len(candidates))
+    return candidates[firstPass][numpy.argmin(distances[firstPass])]
+
+
+def find_waypoint_rendezvous(logLat, logLon, planLat, planLon, maxDistance=defaultMaxDistance, firstRow=0,
+                             logRows=None):
+    #
+    # Return the log row at which the UAV reached each waypoint and the distance (m) between the waypoint and the log
+    # position. The log rows must be in time order. The matched rows never go back in time: waypoint i is matched to a
+    # row after the row of waypoint i-1 (and at or after firstRow). When no log position after the previous match is
+    # within maxDistance (m) of a waypoint, the nearest later position is used and a warning is printed. When the
+    # previous match is the last log row the remaining waypoints are unmatched: their row is -1 and their distance NaN.
+    # logRows is the row number in the original log of each log position when the log was filtered (see
+    # first_pass_nearest); the rows returned are rows of the positions given.
+    #
+    logXY, zoneNumber, zoneLetter = project_to_utm(logLat, logLon)
+    planXY = project_to_utm(planLat, planLon, zoneNumber, zoneLetter)[0]
+    logTree = cKDTree(logXY, leafsize=100)
+    candidateRows = logTree.query_ball_point(planXY, r=maxDistance)
+
+    rows = numpy.empty(len(planXY), dtype=numpy.int64)
+    distances = numpy.empty(len(planXY))
+    previousRow = firstRow - 1
+    for waypointIndex, candidates in enumerate(candidateRows):
+        candidates = numpy.sort(numpy.asarray(candidates, dtype=numpy.int64))
+        candidates = candidates[candidates > previousRow]
+        if len(candidates) > 0:
+            candidateDistances = numpy.hypot(*(logXY[candidates] - planXY[waypointIndex]).T)
+            row = first_pass_nearest(candidates, candidateDistances, logRows)
+        elif previousRow + 1 >= len(logXY):
+            rows[waypointIndex:] = -1
+            distances[waypointIndex:] = numpy.nan
+            print('*** Warning*** The log ends before waypoint', waypointIndex + 1, '-', len(planXY) - waypointIndex,
+                  'waypoints are unmatched')
+            break
+        else:
+            laterRows = numpy.arange(previousRow + 1, len(logXY))
+            row = laterRows[numpy.argmin(numpy.hypot(*(logXY[laterRows] - planXY[waypointIndex]).T))]
+            print('*** Warning*** No log position within', maxDistance, 'm of waypoint', waypointIndex + 1,
+                  '- using the nearest later position')
+        rows[waypointIndex] = row
+        distances[waypointIndex] = numpy.hypot(*(logXY[row] - planXY[waypointIndex]))
+        previousRow = row
+    return rows, distances